@@ -0,0 +1,118 @@
+# rest_client_benchmark.py
+# Requests/sec of the raw REST paths against the local stub server (offline,
+# run in its own process so client and server don't share a GIL):
+#
+#   naive   requests.post per call (new connection every time, the old script)
+#   pooled  OpenAIRestClient (one keep-alive session), sequential
+#   async   AsyncOpenAIRestClient.chat_many over one pool, --concurrency in flight
+#
+#   python Day1_Setup/rest_client_benchmark.py
+#   python Day1_Setup/rest_client_benchmark.py --requests 2000 --latency 0.02 --fail-rate 0.05
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import requests
+
+# Shared helpers live in ../powerai_core
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from powerai_core.rest_client import AsyncOpenAIRestClient, OpenAIRestClient
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_stub_process(port, latency, fail_rate):
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "powerai_core.stub_openai_server", "--port", str(port),
+         "--latency", str(latency), "--fail-rate", str(fail_rate), "--retry-after", "0"],
+        cwd=BASE_DIR, stdout=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}/v1"
+    for _ in range(100):
+        try:
+            requests.get(f"{base_url}/models", timeout=0.5)
+            return proc, base_url
+        except requests.ConnectionError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("stub server did not start")
+
+
+def server_counters(base_url):
+    info = requests.get(f"{base_url}/models", timeout=5).json()
+    return info["requests"], info["connections"]
+
+
+def conversations(n):
+    return [[{"role": "user", "content": f"Say OK #{i}"}] for i in range(n)]
+
+
+def run_naive(base_url, convs):
+    for messages in convs:
+        r = requests.post(f"{base_url}/chat/completions", json={"model": "stub", "messages": messages},
+                          headers={"Connection": "close"}, timeout=30)
+        r.raise_for_status()
+
+
+def run_pooled(base_url, convs):
+    with OpenAIRestClient(api_key="stub", base_url=base_url, backoff_base=0.01) as client:
+        for messages in convs:
+            client.chat_text(messages, model="stub")
+        return client.retries
+
+
+async def run_async(base_url, convs, concurrency):
+    async with AsyncOpenAIRestClient(api_key="stub", base_url=base_url, max_connections=concurrency,
+                                     backoff_base=0.01) as client:
+        await client.chat_many(convs, concurrency=concurrency, model="stub")
+        return client.retries
+
+
+def measure(label, base_url, n, fn):
+    before = server_counters(base_url)
+    t0 = time.perf_counter()
+    retries = fn()
+    elapsed = time.perf_counter() - t0
+    after = server_counters(base_url)
+    reqs = after[0] - before[0]
+    conns = after[1] - before[1] - 1  # minus the counters probe itself
+    print(f"{label:<8}{n:>8}{elapsed:>10.2f}{n / elapsed:>10.0f}{conns:>8}{reqs:>10}{retries or 0:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="REST client throughput against the stub server")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.0, help="stub latency per request, seconds")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of 429/503 replies (retried)")
+    args = parser.parse_args()
+
+    proc, base_url = start_stub_process(free_port(), args.latency, args.fail_rate)
+    convs = conversations(args.requests)
+    print(f"stub at {base_url}, latency {args.latency}s, fail rate {args.fail_rate:.0%}\n")
+    print(f"{'client':<8}{'calls':>8}{'secs':>10}{'req/s':>10}{'conns':>8}{'served':>10}{'retries':>9}")
+    try:
+        if args.fail_rate == 0:  # the naive path has no retries
+            measure("naive", base_url, args.requests, lambda: run_naive(base_url, convs))
+        measure("pooled", base_url, args.requests, lambda: run_pooled(base_url, convs))
+        measure("async", base_url, args.requests,
+                lambda: asyncio.run(run_async(base_url, convs, args.concurrency)))
+    finally:
+        proc.terminate()
+        proc.wait(timeout=5)
+
+
+if __name__ == "__main__":
+    main()
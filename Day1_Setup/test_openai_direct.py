@@ -1,15 +1,27 @@
 from dotenv import load_dotenv
 import os
+import sys
 from openai import OpenAI
 
+# Shared helpers live in ../powerai_core
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from powerai_core.llm_cache import cached_chat_completion, get_response_cache
+
 load_dotenv()
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-resp = client.chat.completions.create(
+# Same prompt every run -> answered from the response cache after the first call
+reply = cached_chat_completion(
+    client,
     model="gpt-4o-mini",  # fallback: "gpt-4o"
     messages=[
         {"role": "system", "content": "You are a clear, concise AI tutor."},
         {"role": "user", "content": "Say hello and explain what an AI agent is in 3 simple lines."},
     ],
+    cache=True,
 )
-print(resp.choices[0].message.content)
+print(reply)
+print(get_response_cache().format_stats())
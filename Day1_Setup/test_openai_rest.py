@@ -1,8 +1,14 @@
-import os, requests
+import os, sys
 from dotenv import load_dotenv
 
 # Always load from parent directory
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from powerai_core.llm_cache import cache_key, get_response_cache, should_cache
+from powerai_core.rest_client import OpenAIRestClient, RestClientError
+
 ENV_PATH = os.path.join(BASE_DIR, ".env")
 print("Looking for .env at:", ENV_PATH)
 load_dotenv(ENV_PATH)
@@ -13,12 +19,25 @@ assert key, "OPENAI_API_KEY missing (check .env location or spelling)"
 
 print("✅ .env loaded successfully!")
 
-url = "https://api.openai.com/v1/chat/completions"
-payload = {
-    "model": model,
-    "messages": [{"role": "user", "content": "Say OK if working"}],
-}
-headers = {"Authorization": f"Bearer {key}"}
+# Pooled keep-alive session with timeouts and retries on 429/5xx.
+# OPENAI_BASE_URL=http://127.0.0.1:8089/v1 targets the local stub server instead.
+client = OpenAIRestClient(api_key=key, default_model=model)
+messages = [{"role": "user", "content": "Say OK if working"}]
 
-r = requests.post(url, headers=headers, json=payload)
-print("Response:", r.status_code, r.text[:500])
+# Cache successful replies (POWERAI_CACHE=off to always hit the API)
+cache = get_response_cache() if should_cache(None, cache=True) else None
+entry = cache_key(model, None, messages, endpoint=client.url("chat/completions"))
+text = cache.get(entry) if cache else None
+if text is not None:
+    print("Response: 200 (cached)", text[:500])
+else:
+    try:
+        text = client.chat_text(messages)
+        if cache:
+            cache.put(entry, text)
+        print("Response: 200", text[:500])
+    except RestClientError as e:
+        print("Response:", e.status, e.body[:500] or e)
+client.close()
+if cache:
+    print(get_response_cache().format_stats())
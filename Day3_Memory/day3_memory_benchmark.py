@@ -0,0 +1,74 @@
+# day3_memory_benchmark.py
+# Micro-benchmark: push synthetic turns through the Day 3 chat loop (chat_turn)
+# and check that per-turn cost stays flat as the conversation grows.
+#
+#   python Day3_Memory/day3_memory_benchmark.py            # 100k turns
+#   python Day3_Memory/day3_memory_benchmark.py --turns 20000
+
+import argparse
+import random
+import time
+
+try:
+    import resource  # peak RSS (Unix only)
+except ImportError:
+    resource = None
+
+from day3_memory_offline import ConversationMemory, chat_turn
+
+SAMPLES = [
+    "My name is Vikas Joshi",
+    "I like LangChain and I use Python every day",
+    "I prefer short answers",
+    "I work with Streamlit dashboards",
+    "Can you give me a summary?",
+    "who am i",
+    "What's your name?",
+    "Tell me how agents keep memory between sessions",
+    "I love building automation for small businesses",
+]
+
+
+def synthetic_messages(n, seed=7):
+    rnd = random.Random(seed)
+    for i in range(n):
+        yield f"{rnd.choice(SAMPLES)} (turn {i})"
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Day 3 memory micro-benchmark")
+    parser.add_argument("--turns", type=int, default=100_000)
+    parser.add_argument("--segments", type=int, default=5, help="report latency per slice of the run")
+    args = parser.parse_args()
+
+    mem = ConversationMemory(window_size=4, summary_target_len=500)
+    per_turn = []
+
+    started = time.perf_counter()
+    for user in synthetic_messages(args.turns):
+        t0 = time.perf_counter()
+        chat_turn(mem, user)
+        per_turn.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+
+    print(f"turns: {args.turns:,}  total: {elapsed:.2f}s  throughput: {args.turns / elapsed:,.0f} turns/s")
+    if resource is not None:
+        peak_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KiB on Linux
+        print(f"peak RSS: {peak_kib / 1024:.1f} MiB  (ring holds {len(mem.turns)} turns)")
+    print("per-turn latency by segment (µs):")
+    size = max(1, len(per_turn) // args.segments)
+    for i in range(0, len(per_turn), size):
+        seg = sorted(per_turn[i:i + size])
+        print(f"  turns {i:>7,}–{i + len(seg) - 1:>7,}: "
+              f"p50 {percentile(seg, 50) * 1e6:7.1f}  p99 {percentile(seg, 99) * 1e6:7.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,126 @@
 import re
+from collections import deque
 from textwrap import shorten
 
+# ---------------------------
+# Compact turn storage
+# ---------------------------
+class Turn:
+    """One chat turn. Slotted: no per-turn dict, ~half the memory of {"role", "text"}."""
+    __slots__ = ("role", "text")
+
+    def __init__(self, role, text):
+        self.role = role
+        self.text = text
+
+    def __repr__(self):
+        return f"Turn({self.role!r}, {self.text!r})"
+
+
+class TurnRing:
+    """
+    Fixed-capacity ring buffer of Turn records. Appends overwrite the oldest
+    turn once full; tail(n) touches only the n newest slots, never the whole buffer.
+    """
+    __slots__ = ("_slots", "_next", "_size", "capacity")
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._slots = [None] * capacity
+        self._next = 0      # index the next append writes to
+        self._size = 0
+
+    def append(self, turn):
+        self._slots[self._next] = turn
+        self._next = (self._next + 1) % self.capacity
+        if self._size < self.capacity:
+            self._size += 1
+
+    def tail(self, n):
+        """Newest n turns, oldest first."""
+        n = min(n, self._size)
+        first = self._next - n
+        if first >= 0:
+            return self._slots[first:self._next]
+        return self._slots[first:] + self._slots[:self._next]
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return iter(self.tail(self._size))
+
+
+# One compiled pass for all entity patterns. Lookaheads are zero-width, so the
+# patterns can overlap ("my name is X and I like Y" still yields the like).
+ENTITY_RE = re.compile(
+    r"(?=\bmy name is (?P<name>[A-Za-z][A-Za-z\s]+))"
+    r"|(?=\bI (?:like|love|prefer)\s+(?P<likes>[A-Za-z0-9\-\_ ]+))"
+    r"|(?=\bI (?:use|work with)\s+(?P<tools>[A-Za-z0-9\-\_ ]+))",
+    re.I,
+)
+
+SUMMARY_TURNS = 10   # the summary covers the last 10 turns
+WHITESPACE_RE = re.compile(r"\s")
+
+def clip_for_shorten(text, width):
+    """
+    shorten() only keeps ~width characters but wraps the WHOLE string to find
+    them. Hand it a prefix that ends on whitespace and still overflows `width`
+    once whitespace is collapsed: the result is identical, the cost is bounded.
+    """
+    cut = width + 1
+    while cut < len(text):
+        m = WHITESPACE_RE.search(text, cut)
+        if m is None:
+            break
+        head = text[:m.start()]
+        if len(" ".join(head.split())) > width:
+            return head
+        cut *= 2
+    return text
+
 # ---------------------------
 # Simple in-memory structures
 # ---------------------------
 class ConversationMemory:
-    def __init__(self, window_size=4, summary_target_len=500):
-        self.turns = []              # full buffer: list of {"role": "user"/"assistant", "text": "..."}
+    def __init__(self, window_size=4, summary_target_len=500, max_turns=200):
+        self.turns = TurnRing(max(max_turns, window_size * 2))  # bounded buffer of Turn records
         self.summary = ""            # rolling summary
         self.entities = {}           # entity store: {entity -> {facts}}
         self.window_size = window_size
         self.summary_target_len = summary_target_len
+        self._bullets = deque(maxlen=SUMMARY_TURNS)  # summary lines of the latest turns
+        self._pending = []           # turns added since the last update_summary()
+        self._persona = None         # cached persona card (None = rebuild)
 
     # ---- buffer operations ----
     def add(self, role, text):
-        self.turns.append({"role": role, "text": text})
+        turn = Turn(role, text)
+        self.turns.append(turn)
+        self._pending.append(turn)
 
     def last_window(self):
-        return self.turns[-self.window_size*2:]  # roughly last K exchanges
+        return self.turns.tail(self.window_size * 2)  # roughly last K exchanges
 
     # ---- naive summary (offline) ----
     def update_summary(self):
         """
         Offline summary: compresses the conversation turns to a short bullet overview.
+        Only turns added since the last call are processed; the bullet deque drops
+        anything older than the last 10 turns by itself.
         In a real app, you'd call an LLM to improve this.
         """
-        bullets = []
-        for t in self.turns[-10:]:  # summarise recent context
-            who = "U" if t["role"] == "user" else "A"
-            line = t["text"].strip().replace("\n", " ")
-            bullets.append(f"{who}: {line}")
-        joined = " • ".join(bullets)
+        if not self._pending:
+            return
+        for t in self._pending[-SUMMARY_TURNS:]:
+            who = "U" if t.role == "user" else "A"
+            line = t.text.strip().replace("\n", " ")
+            self._bullets.append(f"{who}: {line}")
+        self._pending.clear()
+        joined = " • ".join(self._bullets)
         # keep it compact
+        joined = clip_for_shorten(joined, self.summary_target_len)
         self.summary = shorten(joined, width=self.summary_target_len, placeholder=" ...")
 
     # ---- naive entity extraction (offline) ----
@@ -40,24 +129,35 @@ class ConversationMemory:
         Extremely naive: capture patterns like "My name is X", "I like Y", "I use Z".
         Replace with real NER later.
         """
-        name_match = re.search(r"\bmy name is ([A-Za-z][A-Za-z\s]+)", text, re.I)
-        if name_match:
-            self.entities.setdefault("user", {})["name"] = name_match.group(1).strip()
-
-        like_match = re.findall(r"\bI (?:like|love|prefer)\s+([A-Za-z0-9\-\_ ]+)", text, re.I)
-        if like_match:
-            self.entities.setdefault("user", {}).setdefault("likes", set()).update(map(str.strip, like_match))
-
-        use_match = re.findall(r"\bI (?:use|work with)\s+([A-Za-z0-9\-\_ ]+)", text, re.I)
-        if use_match:
-            self.entities.setdefault("user", {}).setdefault("tools", set()).update(map(str.strip, use_match))
+        name = None
+        found = {"likes": [], "tools": []}
+        ends = {"likes": -1, "tools": -1}
+        for m in ENTITY_RE.finditer(text):
+            kind = m.lastgroup
+            if kind == "name":
+                if name is None:
+                    name = m.group("name").strip()
+            elif m.start() >= ends[kind]:
+                # same matches a plain findall would give (no match inside a previous one)
+                found[kind].append(m.group(kind).strip())
+                ends[kind] = m.end(kind)
+
+        if name:
+            self.entities.setdefault("user", {})["name"] = name
+            self._persona = None
+        for kind, values in found.items():
+            if values:
+                self.entities.setdefault("user", {}).setdefault(kind, set()).update(values)
+                self._persona = None
 
     def persona_card(self):
-        u = self.entities.get("user", {})
-        name = u.get("name", "User")
-        likes = ", ".join(sorted(u.get("likes", []))) if u.get("likes") else "—"
-        tools = ", ".join(sorted(u.get("tools", []))) if u.get("tools") else "—"
-        return f"Persona → name: {name} | likes: {likes} | tools: {tools}"
+        if self._persona is None:
+            u = self.entities.get("user", {})
+            name = u.get("name", "User")
+            likes = ", ".join(sorted(u.get("likes", []))) if u.get("likes") else "—"
+            tools = ", ".join(sorted(u.get("tools", []))) if u.get("tools") else "—"
+            self._persona = f"Persona → name: {name} | likes: {likes} | tools: {tools}"
+        return self._persona
 
 # ---------------------------
 # Offline "LLM" (placeholder)
@@ -76,7 +176,7 @@ def offline_llm(context, user_msg):
         return f"From what I remember: {context.get('persona','(no persona yet)')}"
 
     # default response that references memory window size
-    last_user = [t['text'] for t in context.get('window', []) if t['role'] == 'user']
+    last_user = [t.text for t in context.get('window', []) if t.role == 'user']
     hint = f"(I see your recent {len(last_user)} message(s).)"
     return f"{hint} You said: '{user_msg[:140]}'. Tell me more so I can help."
 
@@ -90,6 +190,21 @@ def build_context(mem: ConversationMemory):
         "persona": mem.persona_card()
     }
 
+def chat_turn(mem: ConversationMemory, user: str) -> str:
+    """One pass of the chat loop: remember the user turn, reply, remember the reply."""
+    # update memory with user turn
+    mem.add("user", user)
+    mem.extract_entities(user)
+    mem.update_summary()
+
+    # build context & get reply
+    ctx = build_context(mem)
+    reply = offline_llm(ctx, user)
+
+    # store assistant turn
+    mem.add("assistant", reply)
+    return reply
+
 def main():
     print("🤖 Offline Chat with Memory (no API) — type 'exit' to quit.")
     mem = ConversationMemory(window_size=4, summary_target_len=500)
@@ -100,17 +215,7 @@ def main():
             print("Assistant: Bye! 👋")
             break
 
-        # update memory with user turn
-        mem.add("user", user)
-        mem.extract_entities(user)
-        mem.update_summary()
-
-        # build context & get reply
-        ctx = build_context(mem)
-        reply = offline_llm(ctx, user)
-
-        # store assistant turn
-        mem.add("assistant", reply)
+        reply = chat_turn(mem, user)
 
         # show assistant
         print(f"Assistant: {reply}")
@@ -121,4 +226,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,81 @@
+# day4_memory_benchmark.py
+# Per-turn latency of the Day 4 offline bot as the history grows.
+#
+# "rebuild" replays what each turn used to do: load_memory_variables, join the
+# whole transcript into text, regex-scan it for a name. "incremental" is the
+# current chat_turn() with IncrementalContext. The first grows with the history,
+# the second should stay flat.
+#
+#   python Day4_ConversationMemory/day4_memory_benchmark.py
+#   python Day4_ConversationMemory/day4_memory_benchmark.py --turns 20000 --skip-rebuild
+
+import argparse
+import time
+
+from langchain.memory import ConversationBufferMemory
+
+from day4_memory_buffer_offline import (
+    IncrementalContext, chat_turn, extract_name_from_history,
+)
+
+MESSAGES = [
+    "My name is Vikas",
+    "I like building agents with LangChain",
+    "remind me what i said earlier",
+    "what is my name?",
+    "Let's talk about vector stores",
+]
+
+
+def new_memory():
+    return ConversationBufferMemory(memory_key="history", return_messages=True)
+
+
+def rebuild_turn(memory, user):
+    """The old per-turn path: O(history) work every turn."""
+    history_msgs = memory.load_memory_variables({}).get("history", [])
+    context_text = "\n".join(f"{m.type.upper()}: {m.content}" for m in history_msgs)
+    name = extract_name_from_history(context_text)
+    lines = [ln for ln in context_text.splitlines() if ln.startswith("HUMAN:")]
+    reply = f"name={name} last={' | '.join(lines[-3:])[:80]}"
+    memory.save_context({"input": user}, {"output": reply})
+    return reply
+
+
+def run(label, turn_fn, turns, checkpoints):
+    rows = []
+    window = []
+    for i in range(1, turns + 1):
+        user = f"{MESSAGES[i % len(MESSAGES)]} #{i}"
+        t0 = time.perf_counter()
+        turn_fn(user)
+        window.append(time.perf_counter() - t0)
+        if i in checkpoints:
+            window.sort()
+            rows.append((i, window[len(window) // 2]))
+            window = []
+    print(f"\n{label}: median per-turn latency (µs) by history size")
+    for n, median in rows:
+        print(f"  after {n:>7,} turns: {median * 1e6:9.1f}")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Day 4 memory latency vs. history size")
+    parser.add_argument("--turns", type=int, default=5000)
+    parser.add_argument("--skip-rebuild", action="store_true", help="only run the incremental path")
+    args = parser.parse_args()
+
+    step = max(1, args.turns // 5)
+    checkpoints = set(range(step, args.turns + 1, step))
+
+    memory, context = new_memory(), IncrementalContext()
+    run("incremental", lambda u: chat_turn(memory, context, u), args.turns, checkpoints)
+
+    if not args.skip_rebuild:
+        memory = new_memory()
+        run("rebuild (old)", lambda u: rebuild_turn(memory, u), args.turns, checkpoints)
+
+
+if __name__ == "__main__":
+    main()
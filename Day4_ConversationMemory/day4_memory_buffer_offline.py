@@ -1,20 +1,67 @@
+from collections import deque
 from langchain.memory import ConversationBufferMemory
 import re
 
+NAME_RE = re.compile(r"\bmy\s+name\s+is\s+([A-Za-z][A-Za-z\s]+)", re.I)
+IM_RE = re.compile(r"\b(i\'m|i am)\s+([A-Za-z][A-Za-z\s]+)", re.I)
+
 def extract_name_from_history(history_text: str) -> str | None:
     # look for "my name is <...>" (case-insensitive), grab first match
-    m = re.search(r"\bmy\s+name\s+is\s+([A-Za-z][A-Za-z\s]+)", history_text, flags=re.I)
+    m = NAME_RE.search(history_text)
     if m:
         return m.group(1).strip()
     # also try "I'm <...>" or "I am <...>" as fallback
-    m = re.search(r"\b(i\'m|i am)\s+([A-Za-z][A-Za-z\s]+)", history_text, flags=re.I)
+    m = IM_RE.search(history_text)
     if m:
         return m.group(2).strip()
     return None
 
-def fake_llm_reply(context: str, user_msg: str) -> str:
+class IncrementalContext:
+    """
+    Conversation context that grows by one message at a time.
+
+    Rebuilding a text transcript each turn and regex-scanning it is O(n) per turn
+    (O(n²) per session). Instead, each message is scanned once when it is added,
+    and the answers fake_llm_reply needs are kept ready:
+      - name:        first "my name is X" seen, else first "I'm/I am X"
+      - user_lines:  the last few things the user said (for "remind me")
+    """
+
+    def __init__(self, keep_user_lines: int = 3):
+        self.messages = []                             # (role, text), append-only
+        self.user_lines = deque(maxlen=keep_user_lines)
+        self.facts = {}                                # {"name": ..., "im": ...}
+
+    def add(self, role: str, text: str):
+        self.messages.append((role, text))
+        if role != "human":
+            return
+        # same view the transcript gave: the first line of each HUMAN message
+        first_line = text.split("\n", 1)[0]
+        self.user_lines.append(first_line.replace("HUMAN:", "").strip())
+        if "name" not in self.facts:
+            m = NAME_RE.search(text)
+            if m:
+                self.facts["name"] = m.group(1).strip()
+        if "im" not in self.facts:
+            m = IM_RE.search(text)
+            if m:
+                self.facts["im"] = m.group(2).strip()
+
+    @property
+    def name(self) -> str | None:
+        return self.facts.get("name") or self.facts.get("im")
+
+    def recent_user_lines(self) -> list[str]:
+        return list(self.user_lines)
+
+    def as_text(self) -> str:
+        """Full transcript, only built when someone actually asks for it (debugging)."""
+        return "\n".join(f"{role.upper()}: {text}" for role, text in self.messages)
+
+def fake_llm_reply(context: IncrementalContext, user_msg: str) -> str:
     lower_user = user_msg.lower()
-    name = extract_name_from_history(context)
+    name = context.name
 
     # explicit QAs using memory
     if "what's my name" in lower_user or "what is my name" in lower_user or "who am i" in lower_user:
@@ -24,8 +71,7 @@ def fake_llm_reply(context: str, user_msg: str) -> str:
 
     if "remind me what i said earlier" in lower_user or "remind me" in lower_user:
         # show last couple of user lines from context
-        lines = [ln for ln in context.splitlines() if ln.startswith("HUMAN:")]
-        last = " | ".join(ln.replace("HUMAN:", "").strip() for ln in lines[-3:])
+        last = " | ".join(context.recent_user_lines())
         return f"Recently you said: {last or '(no prior messages)'}"
 
     # generic reply with a friendly memory hint
@@ -34,6 +80,17 @@ def fake_llm_reply(context: str, user_msg: str) -> str:
         hint += f" I remember your name is {name}."
     return f"{hint} You said: '{user_msg[:140]}'"
 
+def chat_turn(memory: ConversationBufferMemory, context: IncrementalContext, user: str) -> str:
+    # 1) The context already holds every earlier message (appended as we go)
+    # 2) Get a reply using the buffered history
+    reply = fake_llm_reply(context, user)
+
+    # 3) Save this turn back to memory (and to the incremental context)
+    memory.save_context({"input": user}, {"output": reply})
+    context.add("human", user)
+    context.add("ai", reply)
+    return reply
+
 def main():
     print("🤖 Day 4 — ConversationBufferMemory (Offline). Type 'exit' to quit.")
     memory = ConversationBufferMemory(
@@ -41,26 +98,15 @@ def main():
         return_messages=True
     )
 
+    context = IncrementalContext()
+
     while True:
         user = input("\nYou: ").strip()
         if user.lower() in {"exit", "quit"}:
             print("Assistant: Bye! 👋")
             break
 
-        # 1) Pull current memory into the prompt variables
-        vars_now = memory.load_memory_variables({})
-        history_msgs = vars_now.get("history", [])
-
-        # Build a simple text context for our offline LLM
-        context_text = "\n".join(
-            f"{m.type.upper()}: {m.content}" for m in history_msgs
-        )
-
-        # 2) Get a reply using the buffered history
-        reply = fake_llm_reply(context_text, user)
-
-        # 3) Save this turn back to memory
-        memory.save_context({"input": user}, {"output": reply})
+        reply = chat_turn(memory, context, user)
 
         # 4) Show assistant reply
         print(f"Assistant: {reply}")
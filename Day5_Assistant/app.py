@@ -1,8 +1,18 @@
 import streamlit as st
-from langchain_openai import ChatOpenAI
-from langchain.memory import ConversationBufferMemory
-from langchain.chains import ConversationChain
 import os
+import sys
+import uuid
+
+# Shared helpers live in ../powerai_core
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+from powerai_core.chat_client import get_chat_client, service_url
+from powerai_core.memory_modes import DEFAULT_TOKEN_BUDGET, build_memory
+from powerai_core.resources import get_llm
+from powerai_core.startup import warm_up
+from powerai_core.streaming import TurnTimings, stream_turn
+from powerai_core import telemetry
 
 # --- PAGE SETUP ---
 st.set_page_config(
@@ -10,6 +20,17 @@ st.set_page_config(
     page_icon="🤖",
     layout="centered"
 )
+turn = telemetry.begin_turn("assistant")
+telemetry.start_metrics_server()
+
+# Thin-client mode (POWERAI_CHAT_SERVICE_URL): chat_service.py keeps the memory and
+# calls the model; each browser session gets its own service session id.
+chat_service_url = service_url()
+if chat_service_url and "service_session" not in st.session_state:
+    st.session_state.service_session = f"assistant-{uuid.uuid4().hex}"
+if not chat_service_url:
+    # the chain is built at the first message; import its pieces while the user types
+    warm_up("langchain.chains.conversation.base", "langchain_openai", "powerai_core.llm_cache")
 
 # --- HEADER ---
 st.title("🤖 PowerAI — Your Smart AI Assistant")
@@ -20,39 +41,89 @@ with st.sidebar:
     st.header("⚙️ Settings")
     st.caption("Model: **gpt-4o-mini**")
     temperature = st.slider("Temperature", 0.0, 1.0, 0.6, 0.1)
+    stream_replies = st.toggle("⚡ Stream responses", value=True)
+    # (retrieval mode needs the SQLite store, see PowerAI_MemoryChat)
+    memory_mode = st.selectbox("Memory mode", ("buffer", "budget"), index=0)
+    token_budget = DEFAULT_TOKEN_BUDGET
+    if memory_mode == "budget":
+        token_budget = st.number_input("History token budget", 200, 16000, DEFAULT_TOKEN_BUDGET, 100)
     st.markdown("Session Active ✅")
     if st.button("Clear chat"):
-        st.session_state.memory = ConversationBufferMemory()
+        if chat_service_url:
+            get_chat_client(chat_service_url).reset(st.session_state.service_session)
+        else:
+            st.session_state.memory = build_memory(memory_mode, token_budget=token_budget)
+            st.session_state.memory_key = (memory_mode, token_budget)
 
 # --- OPENAI SETUP ---
 from dotenv import load_dotenv
 load_dotenv()
 api_key = os.getenv("OPENAI_API_KEY")
 
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=temperature, openai_api_key=api_key)
+if chat_service_url:
+    client = get_chat_client(chat_service_url)
+    service_session = st.session_state.service_session
+    turn_settings = {"memory_mode": memory_mode, "token_budget": token_budget, "temperature": temperature}
+else:
+    # Built on the first message, so the page renders without importing langchain_openai
+    def current_conversation():
+        from langchain.chains import ConversationChain
 
-# --- MEMORY ---
-if "memory" not in st.session_state:
-    st.session_state.memory = ConversationBufferMemory()
+        # Shared client per (model, temperature, key) — not rebuilt on every rerun
+        llm = get_llm("gpt-4o-mini", temperature=temperature, api_key=api_key)
 
-memory = st.session_state.memory
+        # --- MEMORY ---
+        # Switching mode keeps the conversation: the new memory wraps the same message store
+        memory_key = (memory_mode, token_budget)
+        if "memory" not in st.session_state or st.session_state.get("memory_key") != memory_key:
+            old = st.session_state.get("memory")
+            st.session_state.memory = build_memory(
+                memory_mode, chat_memory=old.chat_memory if old else None, llm=llm, token_budget=token_budget
+            )
+            st.session_state.memory_key = memory_key
 
-conversation = ConversationChain(
-    llm=llm,
-    memory=memory,
-    verbose=False
-)
+        memory = st.session_state.memory
+
+        # Reuse this session's chain until the LLM or memory object changes
+        conversation = st.session_state.get("conversation")
+        if conversation is None or conversation.llm is not llm or conversation.memory is not memory:
+            conversation = ConversationChain(
+                llm=llm,
+                memory=memory,
+                verbose=False
+            )
+            st.session_state.conversation = conversation
+        return conversation
 
 # --- CHAT INTERFACE ---
 user_input = st.chat_input("Type your message…")
 
 if user_input:
+    turn.tag(chat_turn=True, memory=memory_mode)
     with st.chat_message("user"):
         st.write(user_input)
     with st.chat_message("assistant"):
-        with st.spinner("🤔 Thinking…"):
-            response = conversation.run(user_input)
-            st.write(response)
+        if stream_replies:
+            timings = TurnTimings()
+            if chat_service_url:
+                chunks = client.stream_turn(service_session, user_input, timings,
+                                            api_key=api_key, **turn_settings)
+            else:
+                chunks = stream_turn(current_conversation(), user_input, timings)
+            response = st.write_stream(chunks)
+            st.caption(timings.caption())
+        else:
+            with st.spinner("🤔 Thinking…"), telemetry.span("chain.invoke"):
+                if chat_service_url:
+                    response = client.send_turn(service_session, user_input, api_key=api_key,
+                                                **turn_settings)["reply"]
+                else:
+                    response = current_conversation().run(user_input)
+                st.write(response)
+
+# --- PERFORMANCE ---
+turn.end()
+telemetry.render_panel(st.sidebar.expander("📈 Performance"), turn)
 
 # --- FOOTER ---
 st.markdown("<br><hr><center>Built with ❤️ using Streamlit & LangChain by Vikash Jaishi</center>", unsafe_allow_html=True)
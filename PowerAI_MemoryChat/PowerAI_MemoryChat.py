@@ -2,19 +2,46 @@
 # Streamlit chat app with persistent memory (SQLite) using LangChain
 
 import os
+import sys
 from dotenv import load_dotenv
 import streamlit as st
-from sqlalchemy import create_engine
 
-from langchain_openai import ChatOpenAI
-from langchain.chains import ConversationChain
-from langchain.memory import ConversationBufferMemory
-from langchain_community.chat_message_histories import SQLChatMessageHistory
+# Shared helpers live in ../powerai_core
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+from powerai_core.chat_client import get_chat_client, service_url
+from powerai_core.memory_modes import DEFAULT_TOKEN_BUDGET, MEMORY_MODES, build_memory
+from powerai_core.resources import get_engine, get_llm, get_session_history, key_fingerprint
+from powerai_core.startup import warm_up
+from powerai_core.streaming import TurnTimings, stream_turn
+from powerai_core.transcript import forget_transcript, history_pages, load_transcript
+from powerai_core import telemetry
+
+# How much history each consumer pulls per rerun
+CHAIN_WINDOW = 20    # messages sent to the model (plus the pinned [SYSTEM NOTE])
+UI_PAGE = 30         # messages per transcript page ("load older" adds one)
+BUDGET_WINDOW = 200  # messages the token-budget memory may fold into summaries
+
+# Local mode imports these on first use; the first run of the process starts importing
+# them in the background (SQL history first, then the chain) while the page renders
+LOCAL_MODULES = ("powerai_core.persistence", "powerai_core.maintenance",
+                 "langchain.chains.conversation.base", "langchain_openai", "powerai_core.llm_cache")
 
 # --------- App Config ---------
 st.set_page_config(page_title="PowerAI — Memory Chat", page_icon="🤖", layout="wide")
 load_dotenv()
 
+# Per-rerun timings: sidebar panel below, POWERAI_TRACE_FILE / POWERAI_METRICS_PORT to export
+turn = telemetry.begin_turn("memorychat")
+telemetry.start_metrics_server()
+
+# Thin-client mode: with POWERAI_CHAT_SERVICE_URL set, a chat_service.py process owns
+# sessions, memory and model calls; this app only renders and forwards turns.
+chat_service_url = service_url()
+if not chat_service_url:
+    warm_up(*LOCAL_MODULES)
+
 # --------- Sidebar Controls ---------
 st.sidebar.title("⚙️ PowerAI Settings")
 
@@ -41,9 +68,28 @@ default_system_prompt = (
 )
 system_prompt = st.sidebar.text_area("System Prompt (optional)", value=default_system_prompt)
 
-# DB path (local SQLite)
-db_path = st.sidebar.text_input("SQLite DB path", value="powerai_memory.db")
-engine = create_engine(f"sqlite:///{db_path}")
+# DB path (local SQLite) — the service has its own
+if chat_service_url:
+    st.sidebar.caption(f"🛰️ Chat service: {chat_service_url}")
+else:
+    db_path = st.sidebar.text_input("SQLite DB path", value="powerai_memory.db")
+    from powerai_core.maintenance import start_maintenance
+
+    engine = get_engine(db_path)  # pooled, reused across reruns and sessions
+    start_maintenance(engine)  # retention/archive/vacuum thread (POWERAI_RETENTION_* env)
+
+# Memory mode: full buffer, or token budget (recent turns + tiered summaries)
+memory_mode = st.sidebar.selectbox("Memory mode", MEMORY_MODES, index=0)
+token_budget = DEFAULT_TOKEN_BUDGET
+if memory_mode == "budget":
+    token_budget = st.sidebar.number_input("History token budget", 200, 16000, DEFAULT_TOKEN_BUDGET, 100)
+
+# Streaming: render tokens as they arrive (memory is written once, at the end)
+stream_replies = st.sidebar.toggle("⚡ Stream responses", value=True)
+
+# Transcript: newest page only, older pages on demand (off = whole session)
+paged_transcript = st.sidebar.toggle("📜 Paged transcript", value=True,
+                                     help="Render the latest messages; load older ones on demand")
 
 # Buttons
 col_a, col_b = st.sidebar.columns(2)
@@ -54,66 +100,97 @@ with col_b:
 
 st.sidebar.markdown("---")
 st.sidebar.caption("Tip: Use different Session IDs to keep separate memories per user/client.")
+turn.tag(session=session_id, memory=memory_mode)
+
+# Pages shown so far, per session id
+if st.session_state.get("transcript_session") != session_id or hard_reset:
+    st.session_state.transcript_session = session_id
+    st.session_state.transcript_pages = 1
+
+def load_older():
+    st.session_state.transcript_pages += 1
 
 # --------- Header ---------
 st.title("🤖 PowerAI — Memory Chat")
 st.caption("LangChain + OpenAI + SQLite persistent memory")
 
 # --------- Guards ---------
-if not openai_key:
+if not openai_key and not chat_service_url:  # the service may hold its own key
     st.warning("Please provide your OpenAI API Key in the left sidebar to start.", icon="🔑")
     st.stop()
 
-# --------- Init persistent chat history for this session_id ---------
-# Using new `connection=` param (avoids deprecation warning)
-sql_history = SQLChatMessageHistory(session_id=session_id, connection=engine)
+# --------- Thin client: everything below goes through the chat service ---------
+if chat_service_url:
+    client = get_chat_client(chat_service_url)
+    turn_settings = {"system_prompt": system_prompt, "memory_mode": memory_mode,
+                     "token_budget": token_budget, "temperature": 0.4}
+    if hard_reset:
+        client.reset(session_id)
+        st.success(f"Memory wiped for session: {session_id}")
 
-# Wrap it with a Memory object so ConversationChain can use it
-memory = ConversationBufferMemory(chat_memory=sql_history, return_messages=True)
+# --------- Init persistent chat history for this session_id ---------
+# Windowed reads: `.messages` returns only the last CHAIN_WINDOW rows (+ the first
+# [SYSTEM NOTE] row), served from the (session_id, id) index.
+# The history object is cached per session in the process-wide resource layer.
+# Budget mode folds whatever leaves its verbatim share into summaries, so it gets a longer view.
+history_window = CHAIN_WINDOW if memory_mode == "buffer" else BUDGET_WINDOW
+if not chat_service_url:
+    sql_history = get_session_history(session_id, db_path, window=history_window, keep_first=True)
 
 # Create / reuse a chain in session_state (keeps the same LLM + memory during the Streamlit session)
 def build_chain():
-    llm = ChatOpenAI(api_key=openai_key, model="gpt-4o-mini", temperature=0.4)
+    from langchain.chains import ConversationChain
+
+    llm = get_llm("gpt-4o-mini", temperature=0.4, api_key=openai_key)  # shared client
     # We inject a system prompt by priming with an initial “message” into memory if not present.
     # A clean way: prepend to the first turn by writing to memory once.
     # If you prefer, you can switch to custom prompt templates; this is minimalist & robust.
-    if not sql_history.messages:
+    if not sql_history.has_messages():
         # Save an initial assistant “system intro” so the next answers follow personality
         sql_history.add_ai_message(f"[SYSTEM NOTE]\n{system_prompt}")
+    # Wrap it with a Memory object so ConversationChain can use it
+    memory = build_memory(memory_mode, chat_memory=sql_history, llm=llm,
+                          token_budget=token_budget, return_messages=True)
     return ConversationChain(llm=llm, memory=memory, verbose=False)
 
-if "chain" not in st.session_state:
-    st.session_state.chain = build_chain()
+# Built at the first turn, not the first page: the transcript renders without
+# waiting for langchain_openai. Rebuilt only when the session, DB or key changes.
+def current_chain():
+    chain_key = (session_id, os.path.abspath(db_path), key_fingerprint(openai_key), memory_mode, token_budget)
+    if st.session_state.get("chain") is None or st.session_state.get("chain_key") != chain_key:
+        st.session_state.chain = build_chain()
+        st.session_state.chain_key = chain_key
+    return st.session_state.chain
 
 # --------- Hard reset memory in DB for this user ---------
-if hard_reset:
-    # Drop only this session's messages
-    # SQLChatMessageHistory has no native delete-all; we recreate the history by dropping rows manually via engine.
-    # Minimal safe approach: recreate a fresh SQLChatMessageHistory instance and overwrite table rows for this session.
-    # Implementation detail: table is `chat_message` by default; we delete by session_id.
-    with engine.begin() as conn:
-        conn.exec_driver_sql("DELETE FROM chat_message WHERE session_id = :sid", {"sid": session_id})
-    # Rebuild in-memory objects after wipe
-    sql_history = SQLChatMessageHistory(session_id=session_id, connection=engine)
-    memory = ConversationBufferMemory(chat_memory=sql_history, return_messages=True)
-    st.session_state.chain = build_chain()
+if hard_reset and not chat_service_url:
+    from powerai_core.retrieval import clear_index
+
+    # Drop only this session's messages (indexed DELETE on the history table)
+    # and its retrieval index
+    sql_history.clear()
+    clear_index(sql_history)
+    forget_transcript(sql_history)
+    # Rebuild in-memory objects (and the [SYSTEM NOTE]) at the next turn
+    st.session_state.chain = None
     st.success(f"Memory wiped for session: {session_id}")
 
 # --------- Show existing history (from DB) in the UI ---------
 with st.container():
     st.subheader("Chat")
-    # Render messages from persistent SQL history except our [SYSTEM NOTE]
-    for msg in sql_history.messages:
-        role = getattr(msg, "type", getattr(msg, "role", "ai"))  # compatibility
-        content = getattr(msg, "content", "")
-        if content.startswith("[SYSTEM NOTE]"):
-            continue
-        if role in ("human", "user"):
-            with st.chat_message("user"):
-                st.markdown(content)
-        else:
-            with st.chat_message("assistant"):
-                st.markdown(content)
+    # Newest page(s) of the transcript; the query itself skips our [SYSTEM NOTE],
+    # and decoded messages are cached by id across reruns and browser sessions
+    fetch = client.transcript_pages(session_id) if chat_service_url else history_pages(sql_history)
+    if paged_transcript:
+        blocks, has_older = load_transcript(fetch, st.session_state.transcript_pages, UI_PAGE)
+    else:
+        blocks, has_older = load_transcript(fetch, None, page_size=500)
+    if has_older:
+        st.button("⬆️ Load older messages", on_click=load_older)
+    with telemetry.span("ui.render_history"):
+        for block in blocks:
+            with st.chat_message(block.role):
+                st.markdown(block.content)
 
 # --------- Clear runtime (UI) only ---------
 if clear_runtime:
@@ -123,15 +200,38 @@ if clear_runtime:
 # --------- Chat input ---------
 user_input = st.chat_input("Type your message...")
 if user_input:
+    turn.tag(chat_turn=True)
     with st.chat_message("user"):
         st.markdown(user_input)
 
     with st.chat_message("assistant"):
-        with st.spinner("Thinking..."):
+        if stream_replies:
+            timings = TurnTimings()
             try:
-                # ConversationChain expects {"input": "..."}
-                resp_dict = st.session_state.chain.invoke({"input": user_input})
-                reply = resp_dict.get("response", "").strip()
+                if chat_service_url:
+                    chunks = client.stream_turn(session_id, user_input, timings,
+                                                api_key=openai_key or None, **turn_settings)
+                else:
+                    chunks = stream_turn(current_chain(), user_input, timings)
+                reply = st.write_stream(chunks)
+                st.caption(timings.caption())
             except Exception as e:
-                reply = f"Sorry, something went wrong: `{e}`"
-        st.markdown(reply)
+                st.markdown(f"Sorry, something went wrong: `{e}`")
+        else:
+            with st.spinner("Thinking..."):
+                try:
+                    # ConversationChain expects {"input": "..."}
+                    with telemetry.span("chain.invoke"):
+                        if chat_service_url:
+                            resp_dict = {"response": client.send_turn(
+                                session_id, user_input, api_key=openai_key or None, **turn_settings)["reply"]}
+                        else:
+                            resp_dict = current_chain().invoke({"input": user_input})
+                    reply = resp_dict.get("response", "").strip()
+                except Exception as e:
+                    reply = f"Sorry, something went wrong: `{e}`"
+            st.markdown(reply)
+
+# --------- Performance panel ---------
+turn.end()
+telemetry.render_panel(st.sidebar.expander("📈 Performance"), turn)
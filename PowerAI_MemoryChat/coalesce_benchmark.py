@@ -0,0 +1,88 @@
+# coalesce_benchmark.py
+# Upstream calls made when many new sessions open with the same first message.
+#
+# Every new PowerAI_MemoryChat session starts from the same [SYSTEM NOTE], so
+# "hi" from N users at once is N identical requests. This sends them through
+# get_llm() against the local stub server (offline), half streamed and half
+# with invoke(), once with POWERAI_COALESCE=off and once with coalescing on:
+#
+#   python PowerAI_MemoryChat/coalesce_benchmark.py
+#   python PowerAI_MemoryChat/coalesce_benchmark.py --sessions 50 --latency 0.8 --spread 0.2
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+# Shared helpers live in ../powerai_core
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from powerai_core.coalesce import get_coalescer
+from powerai_core.resources import get_llm
+from powerai_core.stub_openai_server import start_stub_server
+
+SYSTEM_NOTE = "[SYSTEM NOTE]\nYou are PowerAI, a friendly, concise AI assistant."
+FIRST_MESSAGES = ["hi", "what can you do?"]
+
+
+def run(base_url, server, sessions, spread, seed):
+    llm = get_llm("gpt-4o-mini", temperature=0.4, api_key="stub", base_url=base_url)
+    rnd = random.Random(seed)
+    latencies = []
+    replies = []
+    lock = threading.Lock()
+
+    def session(i, delay, streamed):
+        time.sleep(delay)
+        messages = [AIMessage(content=SYSTEM_NOTE), HumanMessage(content=FIRST_MESSAGES[i % 2])]
+        t0 = time.perf_counter()
+        if streamed:
+            text = "".join(chunk.content for chunk in llm.stream(messages))
+        else:
+            text = llm.invoke(messages).content
+        with lock:
+            latencies.append(time.perf_counter() - t0)
+            replies.append(text)
+
+    before = server.state.requests
+    threads = [threading.Thread(target=session, args=(i, rnd.uniform(0, spread), i % 4 < 2))
+               for i in range(sessions)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    latencies.sort()
+    return server.state.requests - before, elapsed, latencies[len(latencies) // 2], len(set(replies))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coalescing of identical concurrent first messages")
+    parser.add_argument("--sessions", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.5, help="stub latency per request, seconds")
+    parser.add_argument("--spread", type=float, default=0.3, help="sessions arrive within this many seconds")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(latency=args.latency, token_latency=0.005)
+    print(f"{args.sessions} sessions within {args.spread}s, stub latency {args.latency}s\n")
+    print(f"{'coalescing':<12}{'upstream':>10}{'secs':>8}{'p50 latency':>13}{'distinct replies':>18}")
+    try:
+        for mode in ("off", "on"):
+            os.environ["POWERAI_COALESCE"] = mode
+            upstream, elapsed, p50, distinct = run(base_url, server, args.sessions, args.spread, args.seed)
+            print(f"{mode:<12}{upstream:>10}{elapsed:>8.2f}{p50:>12.2f}s{distinct:>18}")
+    finally:
+        server.shutdown()
+    print("\n" + get_coalescer().format_stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+# run_benchmarks.py
+# Offline end-to-end benchmark suite (no API key, no network).
+#
+# Starts the stub chat-completions server (powerai_core/stub_openai_server.py)
+# in its own process, then runs every case of the chosen suite in a fresh child
+# process so each one reports its own peak RSS. Per case it prints throughput,
+# latency p50/p95/p99 and peak RSS, and compares them with the saved baseline
+# (benchmarks/baselines/<suite>.json).
+#
+#   python benchmarks/run_benchmarks.py                        # quick suite, compare to baseline
+#   python benchmarks/run_benchmarks.py --suite full
+#   python benchmarks/run_benchmarks.py --only memorychat day9 --latency 0.2 --token-latency 0.01
+#   python benchmarks/run_benchmarks.py --fail-rate 0.05       # inject 429/503 replies
+#   python benchmarks/run_benchmarks.py --save-baseline        # accept current numbers
+#   python benchmarks/run_benchmarks.py --check                # exit 1 on a regression
+#
+# Baselines are machine-specific: re-save them when you change machines, and
+# compare runs made with the same stub settings (stored in the baseline file).
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = os.path.dirname(HERE)
+BASELINE_DIR = os.path.join(HERE, "baselines")
+RESULTS_DIR = os.path.join(HERE, "results")
+
+# (scenario, params). Case ids are derived from these, so keep them stable.
+SUITES = {
+    "quick": [
+        ("memorychat", {"sessions": 8, "concurrency": 8, "turns": 5, "history": 0}),
+        ("memorychat", {"sessions": 8, "concurrency": 8, "turns": 5, "history": 2000, "stream": True}),
+        ("memorychat", {"sessions": 32, "concurrency": 32, "turns": 3, "history": 50}),
+        ("day9", {"queries": 40, "concurrency": 8}),
+        ("startup", {"entry": "day10", "runs": 3}),
+        ("startup", {"entry": "memorychat", "runs": 3}),
+        ("day3", {"history": 0, "turns": 20000}),
+        ("day3", {"history": 100000, "turns": 20000}),
+        ("day4", {"history": 0, "turns": 5000}),
+        ("day4", {"history": 20000, "turns": 5000}),
+    ],
+    "full": [
+        ("memorychat", {"sessions": 16, "concurrency": 16, "turns": 10, "history": 0}),
+        ("memorychat", {"sessions": 16, "concurrency": 16, "turns": 10, "history": 10000}),
+        ("memorychat", {"sessions": 16, "concurrency": 16, "turns": 10, "history": 10000, "stream": True}),
+        ("memorychat", {"sessions": 128, "concurrency": 64, "turns": 3, "history": 200}),
+        ("service", {"sessions": 300, "turns": 3, "workers": 1}),
+        ("service", {"sessions": 300, "turns": 3, "workers": 2, "history": 200}),
+        ("day9", {"queries": 200, "concurrency": 32}),
+        ("day9", {"queries": 200, "concurrency": 4}),
+        ("startup", {"entry": "day8", "runs": 5}),
+        ("startup", {"entry": "day9", "runs": 5}),
+        ("startup", {"entry": "day10", "runs": 5}),
+        ("startup", {"entry": "day11", "runs": 5}),
+        ("startup", {"entry": "assistant", "runs": 5}),
+        ("startup", {"entry": "memorychat", "runs": 5}),
+        ("startup", {"entry": "memorychat", "runs": 5, "client": True}),
+        ("day3", {"history": 0, "turns": 100000}),
+        ("day3", {"history": 500000, "turns": 100000}),
+        ("day4", {"history": 0, "turns": 20000}),
+        ("day4", {"history": 100000, "turns": 20000}),
+    ],
+}
+
+# metric -> True when higher is better
+COMPARED = {"throughput": True, "p50_ms": False, "p95_ms": False, "peak_rss_mb": False}
+NOISE_FLOOR_MS = 1.0  # latency changes smaller than this are never a regression
+
+
+def case_id(scenario: str, params: dict) -> str:
+    return scenario + "[" + ",".join(f"{k}={v}" for k, v in sorted(params.items())) + "]"
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def peak_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return 0.0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+# ---------------------------
+# Child: run one case
+# ---------------------------
+def run_child(spec: dict) -> None:
+    from scenarios import SCENARIOS
+
+    workdir = tempfile.mkdtemp(prefix="powerai_bench_")
+    try:
+        raw = SCENARIOS[spec["scenario"]](base_url=spec.get("base_url"), workdir=workdir, **spec["params"])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    latencies = sorted(raw.pop("latencies"))
+    wall = raw.pop("wall_s")
+    out = {
+        "unit": raw.pop("unit"),
+        "ops": raw.pop("ops"),
+        "errors": raw.pop("errors"),
+        "wall_s": round(wall, 3),
+        "throughput": round(len(latencies) / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+    out.update({k: round(v, 3) for k, v in raw.items()})
+    print("RESULT " + json.dumps(out), flush=True)
+
+
+def child_env(concurrency_hint: int) -> dict:
+    env = dict(os.environ)
+    env.update({
+        # measure the client stack, not the rate limiter or the cache
+        "POWERAI_RPM": "1000000", "POWERAI_TPM": "1000000000",
+        "POWERAI_MAX_CONCURRENCY": str(max(16, concurrency_hint * 2)),
+        "POWERAI_CACHE": "off",
+        "PYTHONPATH": os.pathsep.join([HERE, BASE_DIR, env.get("PYTHONPATH", "")]).rstrip(os.pathsep),
+    })
+    env.pop("POWERAI_SCHEDULER_STATE", None)
+    env.pop("POWERAI_TRACE_FILE", None)
+    return env
+
+
+def run_case(scenario: str, params: dict, base_url: str, timeout: float) -> dict:
+    spec = json.dumps({"scenario": scenario, "params": params, "base_url": base_url})
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", spec],
+                          cwd=BASE_DIR, env=child_env(int(params.get("concurrency", params.get("sessions", 1)))),
+                          capture_output=True, text=True, timeout=timeout)
+    for line in reversed(proc.stdout.splitlines()):
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    tail = (proc.stderr or proc.stdout).strip().splitlines()[-5:]
+    raise RuntimeError(f"{case_id(scenario, params)} failed (exit {proc.returncode}):\n  " + "\n  ".join(tail))
+
+
+# ---------------------------
+# Stub server process
+# ---------------------------
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_stub(stub: dict):
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "powerai_core.stub_openai_server", "--port", str(port),
+         "--latency", str(stub["latency"]), "--jitter", str(stub["jitter"]),
+         "--token-latency", str(stub["token_latency"]), "--fail-rate", str(stub["fail_rate"])],
+        cwd=BASE_DIR, stdout=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}/v1"
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f"{base_url}/models", timeout=0.5).read()
+            return proc, base_url
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("stub server did not start")
+
+
+# ---------------------------
+# Baselines
+# ---------------------------
+def machine_info() -> dict:
+    return {"python": platform.python_version(), "platform": platform.platform(),
+            "cpus": os.cpu_count()}
+
+
+def load_baseline(suite: str):
+    path = os.path.join(BASELINE_DIR, f"{suite}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_json(path: str, data: dict) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(current: dict, baseline: dict, tolerance: float):
+    """[(metric, change, is_regression)] for one case."""
+    out = []
+    for metric, higher_is_better in COMPARED.items():
+        old, new = baseline.get(metric), current.get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        regression = worse > tolerance
+        if metric.endswith("_ms") and abs(new - old) < NOISE_FLOOR_MS:
+            regression = False
+        out.append((metric, change, regression))
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline PowerAI benchmark suite")
+    parser.add_argument("--suite", choices=sorted(SUITES), default="quick")
+    parser.add_argument("--only", nargs="+", metavar="SCENARIO", help="run only these scenarios")
+    parser.add_argument("--latency", type=float, default=0.05, help="stub seconds before each reply")
+    parser.add_argument("--jitter", type=float, default=0.0, help="stub extra random latency")
+    parser.add_argument("--token-latency", type=float, default=0.002, help="stub seconds between streamed chunks")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of stub replies that are 429/503")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative change vs baseline")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the suite baseline")
+    parser.add_argument("--check", action="store_true", help="exit 1 if any case regressed")
+    parser.add_argument("--timeout", type=float, default=600, help="seconds per case")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(json.loads(args.child))
+        return
+
+    from scenarios import NEEDS_SERVER
+
+    cases = [(s, p) for s, p in SUITES[args.suite] if not args.only or s in args.only]
+    stub = {"latency": args.latency, "jitter": args.jitter, "token_latency": args.token_latency,
+            "fail_rate": args.fail_rate}
+    baseline = load_baseline(args.suite)
+    same_stub = baseline is not None and baseline.get("stub") == stub
+    if baseline and not same_stub:
+        print(f"note: baseline was recorded with stub settings {baseline.get('stub')}; "
+              "LLM-backed cases are not compared\n")
+
+    proc, base_url = (None, None)
+    if any(s in NEEDS_SERVER for s, _ in cases):
+        proc, base_url = start_stub(stub)
+        print(f"stub at {base_url}: latency {args.latency}s, token latency {args.token_latency}s, "
+              f"fail rate {args.fail_rate:.0%}\n")
+
+    header = f"{'case':<72}{'thruput':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'RSS MB':>8}{'err':>5}"
+    print(header)
+    results, regressions = {}, []
+    try:
+        for scenario, params in cases:
+            cid = case_id(scenario, params)
+            try:
+                r = run_case(scenario, params, base_url, args.timeout)
+            except (RuntimeError, subprocess.TimeoutExpired) as e:
+                print(f"{cid:<72}  FAILED: {e}")
+                regressions.append((cid, "failed", 0.0))
+                continue
+            results[cid] = r
+            print(f"{cid:<72}{r['throughput']:>8.1f}/s{r['p50_ms']:>11.2f}{r['p95_ms']:>10.2f}"
+                  f"{r['p99_ms']:>10.2f}{r['peak_rss_mb']:>8.0f}{r['errors']:>5}")
+            old = (baseline or {}).get("cases", {}).get(cid)
+            if old and (same_stub or scenario not in NEEDS_SERVER):
+                changes = compare(r, old, args.tolerance)
+                notes = []
+                for metric, change, bad in changes:
+                    notes.append(f"{metric} {change:+.0%}{' REGRESSION' if bad else ''}")
+                    if bad:
+                        regressions.append((cid, metric, change))
+                print(f"{'':<4}vs baseline: " + ", ".join(notes))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=5)
+
+    run = {"created": datetime.datetime.now().isoformat(timespec="seconds"), "suite": args.suite,
+           "machine": machine_info(), "stub": stub, "cases": results}
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    write_json(os.path.join(RESULTS_DIR, f"{args.suite}-{stamp}.json"), run)
+    if args.save_baseline:
+        if baseline and args.only:  # keep the cases that were not re-run
+            run["cases"] = {**baseline.get("cases", {}), **results}
+        write_json(os.path.join(BASELINE_DIR, f"{args.suite}.json"), run)
+        print(f"\nbaseline saved: benchmarks/baselines/{args.suite}.json")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+        for cid, metric, change in regressions:
+            print(f"  {cid}: {metric} {change:+.0%}")
+    elif baseline:
+        print(f"\nno regressions beyond {args.tolerance:.0%}")
+    if args.check and regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+# scenarios.py
+# The workloads run_benchmarks.py drives. Each scenario is a function taking
+# its parameters (plus base_url/workdir where it needs them) and returning
+#
+#   {"unit": "turns/s", "ops": N, "wall_s": s, "latencies": [seconds, ...],
+#    "errors": n, ...extra numbers}
+#
+# run_benchmarks.py turns that into throughput, p50/p95/p99 and peak RSS, one
+# scenario per child process.
+#
+#   memorychat  ConversationChain + write-behind SQL history through get_llm(),
+#               against the stub server: many sessions, pre-seeded history,
+#               threads = concurrent users, invoke or streamed turns
+#   service     chat_service.py (N worker processes) driven over HTTP/SSE by
+#               `sessions` concurrent async clients, streamed turns
+#   day9        the Day 9 SequentialChain (3 LLM calls per query), threads
+#   startup     cold start of one entry point in fresh processes: time to the
+#               first prompt / first page, then to the first reply
+#   day3        Day 3 offline ConversationMemory + chat_turn, long histories
+#   day4        Day 4 offline ConversationBufferMemory + IncrementalContext
+
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for folder in ("", "Day3_Memory", "Day4_ConversationMemory", "day9_prompt_flow"):
+    path = os.path.join(BASE_DIR, folder) if folder else BASE_DIR
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+USER_MESSAGES = [
+    "My name is Vikas and I build automation for small businesses",
+    "How do agents keep memory between sessions?",
+    "Give me three ideas for a LangChain side project",
+    "what is my name?",
+    "Summarize what we talked about so far",
+]
+
+
+def _user_message(session: int, turn: int) -> str:
+    # unique per session and turn, so neither the cache nor coalescing kicks in
+    return f"{USER_MESSAGES[turn % len(USER_MESSAGES)]} (session {session}, turn {turn})"
+
+
+def _seed_history(history, messages: int, session: int) -> None:
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    batch = []
+    for turn in range(messages // 2):
+        batch.append(HumanMessage(content=_user_message(session, turn)))
+        batch.append(AIMessage(content=f"(seeded) answer {turn} " + "lorem ipsum " * 12))
+        if len(batch) >= 500:
+            history.add_messages(batch)
+            batch = []
+    if batch:
+        history.add_messages(batch)
+
+
+# ---------------------------
+# LLM-backed scenarios
+# ---------------------------
+def memorychat(base_url, workdir, sessions=8, concurrency=8, turns=5, history=0, stream=False,
+               window=20):
+    from langchain.chains import ConversationChain
+    from powerai_core.memory_modes import build_memory
+    from powerai_core.persistence import close_writer
+    from powerai_core.resources import get_engine, get_llm, get_session_history
+    from powerai_core.streaming import TurnTimings, stream_turn
+
+    db_path = os.path.join(workdir, "memorychat.db")
+    llm = get_llm("gpt-4o-mini", temperature=0.4, api_key="stub", base_url=base_url)
+    chains = []
+    for s in range(sessions):
+        h = get_session_history(f"bench-{s}", db_path, window=window, keep_first=True)
+        h.add_ai_message("[SYSTEM NOTE]\nYou are PowerAI, a friendly, concise AI assistant.")
+        _seed_history(h, history, s)
+        memory = build_memory("buffer", chat_memory=h, llm=llm, return_messages=True)
+        chains.append(ConversationChain(llm=llm, memory=memory, verbose=False))
+    for chain in chains:
+        chain.memory.chat_memory.flush()
+
+    latencies, ttfts = [], []
+    errors = [0]
+    lock = threading.Lock()
+
+    def user(s):
+        chain = chains[s]
+        for t in range(turns):
+            text = _user_message(s, history // 2 + t)
+            t0 = time.perf_counter()
+            try:
+                if stream:
+                    timings = TurnTimings()
+                    for _ in stream_turn(chain, text, timings):
+                        pass
+                else:
+                    chain.invoke({"input": text})
+            except Exception:
+                with lock:
+                    errors[0] += 1
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - t0)
+                if stream and timings.ttft is not None:
+                    ttfts.append(timings.ttft)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(user, range(sessions)))
+    for chain in chains:
+        chain.memory.chat_memory.flush()
+    wall = time.perf_counter() - started
+    close_writer(get_engine(db_path))
+
+    result = {"unit": "turns/s", "ops": len(latencies), "wall_s": wall, "latencies": latencies,
+              "errors": errors[0]}
+    if ttfts:
+        ttfts.sort()
+        result["ttft_p50_ms"] = ttfts[len(ttfts) // 2] * 1000
+    return result
+
+
+def _start_service(base_url, workdir, db_path, workers=1):
+    """chat_service.py in a child process; returns (proc, url) once /health answers."""
+    import socket
+    import subprocess
+    import urllib.request
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    env = dict(os.environ, OPENAI_API_KEY="stub")
+    if workers > 1:
+        env["POWERAI_SCHEDULER_STATE"] = os.path.join(workdir, "scheduler.json")
+    proc = subprocess.Popen([sys.executable, "-m", "powerai_core.chat_service", "--port", str(port),
+                             "--db", db_path, "--openai-base-url", base_url, "--workers", str(workers)],
+                            cwd=BASE_DIR, env=env, stdout=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(200):
+        try:
+            urllib.request.urlopen(f"{url}/health", timeout=0.5).read()
+            break
+        except OSError:
+            time.sleep(0.05)
+    time.sleep(0.5 if workers > 1 else 0)  # let the other workers bind too
+    return proc, url
+
+
+def service(base_url, workdir, sessions=200, turns=3, workers=1, history=0):
+    import asyncio
+
+    import aiohttp
+
+    db_path = os.path.join(workdir, "service.db")
+    if history:
+        from powerai_core.persistence import close_writer
+        from powerai_core.resources import get_engine, get_session_history
+
+        for s in range(sessions):
+            _seed_history(get_session_history(f"svc-{s}", db_path, window=20, keep_first=True), history, s)
+        close_writer(get_engine(db_path))
+    proc, url = _start_service(base_url, workdir, db_path, workers)
+
+    latencies, ttfts = [], []
+    errors = [0]
+
+    async def user(http, s):
+        for t in range(turns):
+            body = {"message": _user_message(s, history // 2 + t), "stream": True,
+                    "system_prompt": "You are PowerAI, a friendly, concise AI assistant."}
+            t0 = time.perf_counter()
+            first = None
+            try:
+                async with http.post(f"{url}/v1/sessions/svc-{s}/turns", json=body) as resp:
+                    ok = False
+                    async for line in resp.content:
+                        if first is None and line.startswith(b"data:"):
+                            first = time.perf_counter() - t0
+                        if line.startswith(b"event: done"):
+                            ok = True
+                        elif line.startswith(b"event: error"):
+                            break
+                if not ok:
+                    raise RuntimeError("turn failed")
+            except Exception:
+                errors[0] += 1
+                continue
+            latencies.append(time.perf_counter() - t0)
+            ttfts.append(first)
+
+    async def run_all():
+        connector = aiohttp.TCPConnector(limit=0)
+        timeout = aiohttp.ClientTimeout(total=300)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as http:
+            await asyncio.gather(*(user(http, s) for s in range(sessions)))
+
+    try:
+        started = time.perf_counter()
+        asyncio.run(run_all())
+        wall = time.perf_counter() - started
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+    ttfts.sort()
+    return {"unit": "turns/s", "ops": len(latencies), "wall_s": wall, "latencies": latencies,
+            "errors": errors[0], "ttft_p50_ms": ttfts[len(ttfts) // 2] * 1000 if ttfts else 0.0}
+
+
+# entry point -> (script, kind): "bot" reads stdin, "oneshot" runs to exit, "app" is Streamlit
+STARTUP_ENTRIES = {
+    "day8": ("day8_prompt_design/day8_prompt_design.py", "oneshot"),
+    "day9": ("day9_prompt_flow/day9_prompt_flow.py", "oneshot"),
+    "day10": ("day10_memory_bot/day10_memory_bot.py", "bot"),
+    "day11": ("day11_memory_persist/day11_memory_persist.py", "bot"),
+    "assistant": ("Day5_Assistant/app.py", "app"),
+    "memorychat": ("PowerAI_MemoryChat/PowerAI_MemoryChat.py", "app"),
+}
+
+# first page, then one chat turn, in a fresh interpreter (AppTest: no browser, no server)
+_APP_PROBE = """
+import sys
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=120)
+at.run()
+if at.exception:
+    sys.exit(f"first run: {at.exception[0].message}")
+print("READY", flush=True)
+at.chat_input[0].set_value("hello").run()
+if at.exception:
+    sys.exit(f"turn: {at.exception[0].message}")
+print("TURN", flush=True)
+"""
+
+
+def _read_until(proc, marker: bytes, timeout: float) -> bytes:
+    import selectors
+
+    seen = b""
+    deadline = time.perf_counter() + timeout
+    with selectors.DefaultSelector() as sel:
+        sel.register(proc.stdout, selectors.EVENT_READ)
+        while marker not in seen:
+            left = deadline - time.perf_counter()
+            if left <= 0 or not sel.select(left):
+                raise TimeoutError(f"no {marker!r} after {timeout}s")
+            chunk = os.read(proc.stdout.fileno(), 65536)
+            if not chunk:
+                raise RuntimeError(f"exited before {marker!r}: {seen[-300:]!r}")
+            seen += chunk
+    return seen
+
+
+def startup(base_url, workdir, entry="day10", runs=5, client=False, timeout=120.0):
+    import subprocess
+
+    script, kind = STARTUP_ENTRIES[entry]
+    env = dict(os.environ, OPENAI_API_KEY="stub", OPENAI_BASE_URL=base_url, OPENAI_API_BASE=base_url,
+               POWERAI_MAINTENANCE="off", PYTHONUNBUFFERED="1")
+    service_proc = None
+    if client:  # the app as a thin client of chat_service.py
+        service_proc, env["POWERAI_CHAT_SERVICE_URL"] = _start_service(
+            base_url, workdir, os.path.join(workdir, "service.db"))
+    path = os.path.join(BASE_DIR, script)
+    if kind == "app":
+        cmd = [sys.executable, "-c", _APP_PROBE, path]
+        ready, done, first_input = b"READY", b"TURN", None
+    elif kind == "bot":
+        cmd = [sys.executable, path]
+        ready, done, first_input = b"You:", b"You:", b"hello\n"
+    else:
+        cmd = [sys.executable, path]
+        ready, done, first_input = None, None, None
+
+    latencies, firsts = [], []
+    errors = 0
+    started = time.perf_counter()
+    try:
+        for i in range(runs):
+            cwd = os.path.join(workdir, f"run{i}")  # fresh DB / cache files every run
+            os.makedirs(cwd)
+            t0 = time.perf_counter()
+            proc = subprocess.Popen(cmd, cwd=cwd, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                    stderr=subprocess.DEVNULL)
+            try:
+                if ready is None:
+                    proc.communicate(timeout=timeout)
+                    if proc.returncode:
+                        raise RuntimeError(f"exit {proc.returncode}")
+                    latencies.append(time.perf_counter() - t0)
+                    continue
+                out = _read_until(proc, ready, timeout)
+                latencies.append(time.perf_counter() - t0)
+                if first_input:
+                    proc.stdin.write(first_input)
+                    proc.stdin.flush()
+                    out = out[out.index(ready) + len(ready):]
+                if done not in out:
+                    _read_until(proc, done, timeout)
+                firsts.append(time.perf_counter() - t0)
+                if kind == "bot":
+                    proc.stdin.write(b"exit\n")
+                    proc.stdin.flush()
+                proc.wait(timeout=timeout)
+            except Exception:
+                errors += 1
+            finally:
+                if proc.poll() is None:
+                    proc.kill()
+                    proc.wait()
+    finally:
+        if service_proc is not None:
+            service_proc.terminate()
+            service_proc.wait(timeout=10)
+    firsts.sort()
+    return {"unit": "starts/s", "ops": len(latencies), "wall_s": time.perf_counter() - started,
+            "latencies": latencies, "errors": errors,
+            "first_reply_p50_ms": firsts[len(firsts) // 2] * 1000 if firsts else 0.0}
+
+
+def day9(base_url, workdir, queries=40, concurrency=8):
+    from day9_prompt_flow import build_pipeline
+    from powerai_core.resources import get_llm
+
+    llm = get_llm("gpt-4o-mini", temperature=0.7, api_key="stub", base_url=base_url, priority="batch")
+    pipeline = build_pipeline(llm)
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def run(i):
+        t0 = time.perf_counter()
+        try:
+            pipeline.invoke({"user_input": _user_message(i, i)})
+        except Exception:
+            with lock:
+                errors[0] += 1
+            return
+        with lock:
+            latencies.append(time.perf_counter() - t0)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(run, range(queries)))
+    return {"unit": "queries/s", "ops": len(latencies), "wall_s": time.perf_counter() - started,
+            "latencies": latencies, "errors": errors[0]}
+
+
+# ---------------------------
+# Offline memories
+# ---------------------------
+def _offline_run(turn_fn, history, turns):
+    for i in range(history):
+        turn_fn(_user_message(0, i))
+    latencies = []
+    started = time.perf_counter()
+    for i in range(history, history + turns):
+        t0 = time.perf_counter()
+        turn_fn(_user_message(0, i))
+        latencies.append(time.perf_counter() - t0)
+    return {"unit": "turns/s", "ops": turns, "wall_s": time.perf_counter() - started,
+            "latencies": latencies, "errors": 0}
+
+
+def day3(workdir=None, base_url=None, history=0, turns=20000):
+    from day3_memory_offline import ConversationMemory, chat_turn
+
+    mem = ConversationMemory()
+    return _offline_run(lambda text: chat_turn(mem, text), history, turns)
+
+
+def day4(workdir=None, base_url=None, history=0, turns=5000):
+    from day4_memory_buffer_offline import IncrementalContext, chat_turn
+    from langchain.memory import ConversationBufferMemory
+
+    memory = ConversationBufferMemory(memory_key="history", return_messages=True)
+    context = IncrementalContext()
+    return _offline_run(lambda text: chat_turn(memory, context, text), history, turns)
+
+
+SCENARIOS = {"memorychat": memorychat, "service": service, "startup": startup, "day9": day9,
+             "day3": day3, "day4": day4}
+NEEDS_SERVER = {"memorychat", "service", "startup", "day9"}
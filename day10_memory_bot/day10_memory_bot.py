@@ -1,22 +1,39 @@
-from langchain_openai import ChatOpenAI
-from langchain.chains import ConversationChain
-from langchain.memory import ConversationBufferMemory
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
 import os
+import sys
+
+# Shared helpers live in ../powerai_core
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+from powerai_core.startup import background
 
 # Load .env variables
 load_dotenv()
 api_key = os.getenv("OPENAI_API_KEY")
 
-# Initialize GPT-4o mini
-llm = ChatOpenAI(openai_api_key=api_key, model="gpt-4o-mini")
 
-# Memory buffer for conversation context
-memory = ConversationBufferMemory()
+def build_conversation():
+    # langchain / langchain_openai are imported here, not at the top: see startup.py
+    from langchain.chains import ConversationChain
+    from powerai_core.memory_modes import IN_MEMORY_MODES, build_memory, memory_settings_from_env
+    from powerai_core.resources import get_llm
+
+    # Initialize GPT-4o mini (shared client, paced by the powerai_core scheduler)
+    llm = get_llm("gpt-4o-mini", api_key=api_key)
+
+    # Memory for conversation context: full buffer by default,
+    # POWERAI_MEMORY=budget keeps it under POWERAI_TOKEN_BUDGET tokens
+    # (no SQL history here, so no retrieval mode)
+    memory_mode, token_budget = memory_settings_from_env(IN_MEMORY_MODES)
+    memory = build_memory(memory_mode, llm=llm, token_budget=token_budget)
+
+    # Create conversation chain
+    return ConversationChain(llm=llm, memory=memory, verbose=True)
+
 
-# Create conversation chain
-conversation = ConversationChain(llm=llm, memory=memory, verbose=True)
+# Built in the background while the user types the first message
+conversation = background(build_conversation, name="day10.chain")
 
 print("✅ PowerAI Memory Bot ready to chat!")
 
@@ -25,5 +42,5 @@ while True:
     if user_input.lower() in ["exit", "quit", "bye"]:
         print("👋 Goodbye from PowerAI!")
         break
-    response = conversation.invoke({"input": user_input})
+    response = conversation.get().invoke({"input": user_input})
     print("PowerAI:", response["response"])
@@ -0,0 +1,132 @@
+# compact_benchmark.py
+# File size and "fit the newest N tokens" latency of the history store, with
+# the message JSON in the plain `message` column (rows written before the
+# compact columns) vs role / tokens / compressed payload (powerai_core/history.py):
+#
+#   - same sessions and messages in both files; AI rows carry OpenAI-style
+#     response_metadata, like the ones ChatOpenAI returns
+#   - python:  last 200 messages -> decode -> count tokens newest-first
+#              (what a token-aware trim over SQLChatMessageHistory has to do)
+#   - sql:     history.last_records_within(budget): one SUM() OVER window query,
+#              only the rows that fit are decoded
+#
+#   python day11_memory_persist/compact_benchmark.py
+#   python day11_memory_persist/compact_benchmark.py --rows 2000000 --sessions 4000 --budget 3000
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+# Shared helpers live in ../powerai_core
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from powerai_core.history import WindowedSQLHistory, compact_row, message_tokens, records_to_messages
+from powerai_core.resources import get_engine
+
+WORDS = ("agent memory session token budget summary window retrieval index vector prompt chain model "
+         "sqlite python langchain streamlit cache latency user answer question context").split()
+
+
+def message_json(kind, content, rnd):
+    data = {"content": content, "additional_kwargs": {}, "response_metadata": {}, "type": kind,
+            "name": None, "id": None, "example": False}
+    if kind == "ai":
+        p, c = rnd.randint(200, 3000), rnd.randint(20, 400)
+        data.update(response_metadata={
+            "token_usage": {"completion_tokens": c, "prompt_tokens": p, "total_tokens": p + c,
+                            "completion_tokens_details": None, "prompt_tokens_details": None},
+            "model_name": "gpt-4o-mini-2024-07-18", "system_fingerprint": f"fp_{rnd.getrandbits(40):010x}",
+            "finish_reason": "stop", "logprobs": None},
+            id=f"run-{rnd.getrandbits(128):032x}", tool_calls=[], invalid_tool_calls=[],
+            usage_metadata={"input_tokens": p, "output_tokens": c, "total_tokens": p + c})
+    return json.dumps({"type": kind, "data": data})
+
+
+def load(path, sessions, rows, compact, seed=7):
+    """`rows` messages round-robin over `sessions`; compact=False leaves role/tokens/payload NULL."""
+    WindowedSQLHistory("setup", connection=get_engine(path))  # table + index
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    sql = "INSERT INTO message_store (session_id, message, role, tokens, payload) VALUES (?, ?, ?, ?, ?)"
+    batch = []
+    for i in range(rows):
+        kind = "human" if (i // sessions) % 2 == 0 else "ai"
+        words = rnd.randint(8, 40) if kind == "human" else rnd.randint(40, 250)
+        raw = message_json(kind, " ".join(rnd.choice(WORDS) for _ in range(words)), rnd)
+        if compact:
+            r = compact_row(raw)
+            batch.append((f"s{i % sessions}", r["message"], r["role"], r["tokens"], r["payload"]))
+        else:
+            batch.append((f"s{i % sessions}", raw, None, None, None))
+        if len(batch) >= 100_000:
+            conn.executemany(sql, batch)
+            conn.commit()
+            batch = []
+    if batch:
+        conn.executemany(sql, batch)
+        conn.commit()
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+
+
+def python_fit(history, budget, scan=200):
+    messages = records_to_messages(history.last_records(scan))
+    used, keep = 0, []
+    for m in reversed(messages):
+        used += message_tokens(m.content)
+        if used > budget and keep:
+            break
+        keep.append(m)
+    return keep[::-1]
+
+
+def time_fits(path, sessions, reads, budget):
+    names = [f"s{s}" for s in range(sessions)]
+    py, sql, kept = [], [], []
+    for _ in range(reads):
+        h = WindowedSQLHistory(random.choice(names), connection=get_engine(path))
+        t0 = time.perf_counter()
+        python_fit(h, budget)
+        py.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        kept.append(len(records_to_messages(h.last_records_within(budget))))
+        sql.append(time.perf_counter() - t0)
+    med = lambda xs: sorted(xs)[len(xs) // 2] * 1000
+    return med(py), med(sql), sorted(kept)[len(kept) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plain vs compact history rows: size and token-window reads")
+    parser.add_argument("--rows", type=int, default=300_000)
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--reads", type=int, default=200)
+    parser.add_argument("--budget", type=int, default=2000, help="token budget of the window")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="powerai_compact_")
+    try:
+        print(f"{'layout':<9}{'load s':>8}{'file MB':>9}{'python ms':>11}{'sql ms':>8}{'msgs':>6}")
+        for compact in (False, True):
+            path = os.path.join(workdir, f"{'compact' if compact else 'plain'}.db")
+            t0 = time.perf_counter()
+            load(path, args.sessions, args.rows, compact)
+            load_s = time.perf_counter() - t0
+            py_ms, sql_ms, kept = time_fits(path, args.sessions, args.reads, args.budget)
+            print(f"{'compact' if compact else 'plain':<9}{load_s:>8.1f}{os.path.getsize(path) / 1e6:>9.1f}"
+                  f"{py_ms:>11.3f}{sql_ms:>8.3f}{kept:>6}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
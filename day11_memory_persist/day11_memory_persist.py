@@ -1,10 +1,13 @@
 # day11_memory_persist.py
 import os
+import sys
 from dotenv import load_dotenv
-from langchain_community.chat_message_histories import SQLChatMessageHistory
-from langchain.memory import ConversationBufferMemory
-from langchain.chains import ConversationChain
-from langchain_openai import ChatOpenAI
+
+# Shared helpers live in ../powerai_core
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+from powerai_core.startup import background
 
 # Load environment variables
 load_dotenv()
@@ -14,32 +17,58 @@ api_key = os.getenv("OPENAI_API_KEY")
 DB_PATH = "chat_memory.db"
 table_name = "chat_history"
 
-# Create a persistent SQL chat history (NEW syntax)
-history = SQLChatMessageHistory(
-    session_id="user1",  # 👈 required new parameter
-    connection=f"sqlite:///{DB_PATH}",
-    table_name=table_name
-)
 
-# Memory setup
-memory = ConversationBufferMemory(chat_memory=history, return_messages=True)
+def build_session():
+    # SQLAlchemy / langchain / langchain_openai are imported here, not at the top: see startup.py
+    from langchain.chains import ConversationChain
+    from powerai_core.maintenance import start_maintenance
+    from powerai_core.persistence import WriteBehindSQLHistory
+    from powerai_core.memory_modes import build_memory, memory_settings_from_env
+    from powerai_core.resources import get_llm
+
+    # Create a persistent SQL chat history (NEW syntax)
+    # WindowedSQLHistory = SQLChatMessageHistory + (session_id, id) index and keyset reads,
+    # which retrieval mode (POWERAI_MEMORY=retrieval) uses to index only new messages.
+    # The write-behind variant also turns on WAL and saves each turn on a background
+    # writer; its own reads wait for those writes, and pending ones flush on exit.
+    history = WriteBehindSQLHistory(
+        session_id="user1",  # 👈 required new parameter
+        connection=f"sqlite:///{DB_PATH}",
+        table_name=table_name
+    )
+    # Retention / archive / vacuum in the background (nothing is deleted unless POWERAI_RETENTION_* is set)
+    start_maintenance(history.engine, table_name)
+
+    # LLM setup (shared client, paced by the powerai_core scheduler)
+    llm = get_llm("gpt-4o-mini", temperature=0.7, api_key=api_key)
+
+    # Memory setup: POWERAI_MEMORY=budget caps the replayed history at POWERAI_TOKEN_BUDGET tokens,
+    # POWERAI_MEMORY=retrieval sends only relevant past messages + the recent window
+    memory_mode, token_budget = memory_settings_from_env()
+    memory = build_memory(memory_mode, chat_memory=history, llm=llm,
+                          token_budget=token_budget, return_messages=True)
+
+    # Conversation chain
+    conversation = ConversationChain(
+        llm=llm,
+        memory=memory,
+        verbose=True
+    )
+    return history, conversation
 
-# LLM setup
-llm = ChatOpenAI(api_key=api_key, model="gpt-4o-mini", temperature=0.7)
 
-# Conversation chain
-conversation = ConversationChain(
-    llm=llm,
-    memory=memory,
-    verbose=True
-)
+# History + chain are built in the background while the user types the first message
+session = background(build_session, name="day11.session")
 
 # Chat loop
 print("💬 Persistent Chat Memory Enabled! Type 'exit' to quit.\n")
 while True:
     user_input = input("You: ")
     if user_input.lower() == "exit":
+        if session.ready():  # nothing can be pending before the history exists
+            session.get()[0].flush()
         print("👋 Goodbye! Memory saved to SQLite database.")
         break
+    conversation = session.get()[1]
     response = conversation.predict(input=user_input)
     print("Assistant:", response)
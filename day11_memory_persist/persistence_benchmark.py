@@ -0,0 +1,104 @@
+# persistence_benchmark.py
+# Messages/sec persisted by N concurrent writer threads (one session each),
+# each saving human+AI turns the way ConversationChain's memory does:
+#
+#   baseline      SQLChatMessageHistory on a default-journal file, one commit per turn
+#   wal           same commits, WAL + synchronous=NORMAL (tune_sqlite)
+#   write-behind  WriteBehindSQLHistory: turns queued, group-committed by one writer
+#                 (timing includes the final flush)
+#
+#   python day11_memory_persist/persistence_benchmark.py
+#   python day11_memory_persist/persistence_benchmark.py --writers 1 8 64 --seconds 5
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+# Shared helpers live in ../powerai_core
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from sqlalchemy import create_engine
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_community.chat_message_histories import SQLChatMessageHistory
+
+from powerai_core.persistence import WriteBehindSQLHistory, close_writer, tune_sqlite
+
+MODES = ("baseline", "wal", "write-behind")
+
+
+def make_engine(path, mode):
+    engine = create_engine(f"sqlite:///{path}", pool_size=70, max_overflow=10,
+                           connect_args={"check_same_thread": False})
+    if mode != "baseline":
+        tune_sqlite(engine)
+    return engine
+
+
+def run(mode, writers, seconds, workdir):
+    path = os.path.join(workdir, f"{mode}-{writers}.db")
+    engine = make_engine(path, mode)
+    cls = WriteBehindSQLHistory if mode == "write-behind" else SQLChatMessageHistory
+    histories = [cls(session_id=f"s{i}", connection=engine) for i in range(writers)]
+    counts = [0] * writers
+    errors = [0] * writers
+    start = threading.Barrier(writers + 1)
+    stop_at = [0.0]
+
+    def work(i):
+        history = histories[i]
+        start.wait()
+        turn = 0
+        while time.perf_counter() < stop_at[0]:
+            try:
+                history.add_messages([HumanMessage(content=f"question {turn} from s{i}"),
+                                      AIMessage(content=f"answer {turn} " + "lorem ipsum " * 20)])
+                counts[i] += 2
+            except Exception:
+                errors[i] += 1  # e.g. "database is locked" on the baseline
+            turn += 1
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(writers)]
+    for t in threads:
+        t.start()
+    stop_at[0] = time.perf_counter() + seconds
+    t0 = time.perf_counter()
+    start.wait()
+    for t in threads:
+        t.join()
+    batches = ""
+    if mode == "write-behind":
+        writer = histories[0].writer
+        writer.flush(timeout=None)
+        batches = f"avg batch {writer.stats()['avg_batch']}"
+    elapsed = time.perf_counter() - t0
+    close_writer(engine)
+    engine.dispose()
+    return sum(counts), sum(errors), elapsed, batches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat history persistence throughput")
+    parser.add_argument("--writers", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument("--seconds", type=float, default=3.0, help="write phase per run")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="powerai_persist_bench_")
+    print(f"{'mode':<14}{'writers':>8}{'messages':>10}{'msg/s':>10}{'errors':>8}  notes")
+    try:
+        for writers in args.writers:
+            for mode in args.modes:
+                messages, errors, elapsed, notes = run(mode, writers, args.seconds, workdir)
+                print(f"{mode:<14}{writers:>8}{messages:>10}{messages / elapsed:>10.0f}{errors:>8}  {notes}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+# persistence_crash_check.py
+# Crash-durability check for the write-behind history (powerai_core/persistence.py).
+#
+# Each round starts a child process that writes turns from several sessions
+# through WriteBehindSQLHistory and prints an ACK after every history.flush().
+# The parent SIGKILLs the child at a random moment, reopens the database and
+# checks that:
+#   - PRAGMA integrity_check is "ok"
+#   - every acknowledged turn is present
+#   - each session holds a gap-free prefix of its turns (no lost middle rows,
+#     no half turn: human and AI messages of a turn commit together)
+#
+#   python day11_memory_persist/persistence_crash_check.py            # 10 rounds
+#   python day11_memory_persist/persistence_crash_check.py --rounds 50 --sessions 16
+
+import argparse
+import json
+import os
+import random
+import shutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Shared helpers live in ../powerai_core
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+ACK_EVERY = 5  # turns between flushes
+
+
+def child(db_path, sessions):
+    from langchain_core.messages import AIMessage, HumanMessage
+    from powerai_core.persistence import WriteBehindSQLHistory
+    from powerai_core.resources import get_engine
+
+    engine = get_engine(db_path)
+    print_lock = threading.Lock()
+
+    def writer(history):
+        name = history.session_id
+        turn = 0
+        while True:
+            history.add_messages([HumanMessage(content=f"{name} human {turn}"),
+                                  AIMessage(content=f"{name} ai {turn}")])
+            turn += 1
+            if turn % ACK_EVERY == 0:
+                history.flush()
+                with print_lock:
+                    print(f"ACK {name} {turn}", flush=True)
+
+    # histories are created up front: concurrent CREATE TABLE checks race on a new file
+    histories = [WriteBehindSQLHistory(session_id=f"s{i}", connection=engine) for i in range(sessions)]
+    for history in histories:
+        threading.Thread(target=writer, args=(history,), daemon=True).start()
+    while True:
+        time.sleep(1)
+
+
+def verify(db_path, acked):
+    from powerai_core.history import row_json
+
+    problems = []
+    conn = sqlite3.connect(db_path)
+    try:
+        status = conn.execute("PRAGMA integrity_check").fetchone()[0]
+        if status != "ok":
+            problems.append(f"integrity_check: {status}")
+        rows = conn.execute("SELECT session_id, message, payload FROM message_store ORDER BY id").fetchall()
+    finally:
+        conn.close()
+
+    per_session = {}
+    for session_id, message, payload in rows:
+        per_session.setdefault(session_id, []).append(json.loads(row_json(message, payload))["data"]["content"])
+
+    for name, contents in per_session.items():
+        if len(contents) % 2:
+            problems.append(f"{name}: half a turn stored ({len(contents)} messages)")
+        expected = [f"{name} {kind} {t}" for t in range(len(contents) // 2 + 1) for kind in ("human", "ai")]
+        if contents != expected[:len(contents)]:
+            problems.append(f"{name}: rows are not a gap-free prefix")
+    for name, turns in acked.items():
+        stored = len(per_session.get(name, [])) // 2
+        if stored < turns:
+            problems.append(f"{name}: {turns} turns acknowledged but only {stored} stored")
+    return problems, sum(len(v) for v in per_session.values())
+
+
+def run_round(index, sessions, rnd):
+    workdir = tempfile.mkdtemp(prefix="powerai_crash_")
+    db_path = os.path.join(workdir, "crash.db")
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--child", db_path,
+                             "--sessions", str(sessions)],
+                            stdout=subprocess.PIPE, text=True)
+    acked = {}
+
+    def read_acks():
+        for line in proc.stdout:
+            parts = line.split()
+            if len(parts) == 3 and parts[0] == "ACK":
+                acked[parts[1]] = max(acked.get(parts[1], 0), int(parts[2]))
+
+    reader = threading.Thread(target=read_acks, daemon=True)
+    reader.start()
+    time.sleep(rnd.uniform(0.8, 2.5))  # child startup is ~0.5s (imports)
+    proc.send_signal(signal.SIGKILL)
+    proc.wait()
+    reader.join(5)
+
+    problems, stored = verify(db_path, dict(acked))
+    shutil.rmtree(workdir, ignore_errors=True)
+    acked_turns = sum(acked.values())
+    status = "ok" if not problems else "FAIL"
+    print(f"round {index:>3}: {status}  acknowledged {acked_turns * 2:>6} msgs, stored {stored:>6}")
+    for p in problems:
+        print("   -", p)
+    return not problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kill -9 durability check for write-behind persistence")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=3)
+    parser.add_argument("--child", metavar="DB", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.sessions)
+        return
+    if not hasattr(signal, "SIGKILL"):
+        sys.exit("needs SIGKILL (Unix)")
+
+    rnd = random.Random(args.seed)
+    passed = sum(run_round(i + 1, args.sessions, rnd) for i in range(args.rounds))
+    print(f"\n{passed}/{args.rounds} rounds passed")
+    sys.exit(0 if passed == args.rounds else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+# retention_benchmark.py
+# Hot-session query latency as the history table grows, before and after a
+# maintenance pass (powerai_core/maintenance.py):
+#
+#   - half the sessions are "cold" (last written 60 simulated days ago), half hot
+#   - reads timed on hot sessions: the chain's window (last 20 + pinned note),
+#     a transcript page with [SYSTEM NOTE] filtered in SQL, has_messages()
+#   - Hard Reset (history.clear()) of one session: indexed DELETE
+#   - maintenance: cap 200 messages per session, archive sessions idle > 30 days,
+#     incremental vacuum
+#
+#   python day11_memory_persist/retention_benchmark.py
+#   python day11_memory_persist/retention_benchmark.py --rows 1000000 10000000 --sessions 20000
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+# Shared helpers live in ../powerai_core
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from powerai_core.history import WindowedSQLHistory, compact_row
+from powerai_core.maintenance import DAY, Maintainer, RetentionPolicy
+from powerai_core.resources import get_engine
+
+
+def message_json(kind, content):
+    return json.dumps({"type": kind, "data": {"content": content, "additional_kwargs": {},
+                                              "response_metadata": {}, "type": kind, "name": None, "id": None}})
+
+
+def message_columns(kind, content):
+    """(message, role, tokens, payload) as the history writes them."""
+    row = compact_row(message_json(kind, content))
+    return row["message"], row["role"], row["tokens"], row["payload"]
+
+
+def load(path, sessions, rows):
+    """Bulk-load `rows` messages over `sessions` sessions; the first half of the sessions first."""
+    WindowedSQLHistory("setup", connection=get_engine(path))  # table + index, incremental auto_vacuum
+    note = message_columns("ai", "[SYSTEM NOTE]\nYou are PowerAI.")
+    human = message_columns("human", "How do agents keep memory between sessions? " * 2)
+    ai = message_columns("ai", "They persist it: " + "lorem ipsum " * 30)
+    sql = "INSERT INTO message_store (session_id, message, role, tokens, payload) VALUES (?, ?, ?, ?, ?)"
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    per_session = max(2, rows // sessions)
+    half = sessions // 2
+    for phase in (range(half), range(half, sessions)):
+        batch = [(f"s{s}", *note) for s in phase]
+        for i in range(per_session - 1):
+            msg = human if i % 2 == 0 else ai
+            batch.extend((f"s{s}", *msg) for s in phase)
+            if len(batch) >= 200_000:
+                conn.executemany(sql, batch)
+                conn.commit()
+                batch = []
+        if batch:
+            conn.executemany(sql, batch)
+            conn.commit()
+        yield  # caller records a watermark between the phases
+    conn.close()
+
+
+def time_reads(path, sessions, reads):
+    hot = [f"s{s}" for s in range(sessions // 2, sessions)]
+    window, page, exists = [], [], []
+    for _ in range(reads):
+        h = WindowedSQLHistory(random.choice(hot), connection=get_engine(path), window=20, keep_first=True)
+        t0 = time.perf_counter()
+        _ = h.messages
+        window.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        h.last_records(31, skip_notes=True)
+        page.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        h.has_messages()
+        exists.append(time.perf_counter() - t0)
+    victim = WindowedSQLHistory(random.choice(hot), connection=get_engine(path))
+    t0 = time.perf_counter()
+    victim.clear()
+    clear = time.perf_counter() - t0
+    med = lambda xs: sorted(xs)[len(xs) // 2] * 1000
+    return {"window_ms": med(window), "page_ms": med(page), "exists_ms": med(exists), "clear_ms": clear * 1000}
+
+
+def file_mb(path):
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p)) / 1e6
+
+
+def run(rows, sessions, reads, workdir):
+    path = os.path.join(workdir, f"store-{rows}.db")
+    t0 = time.perf_counter()
+    now = time.time()
+    m = None
+    for phase, _ in enumerate(load(path, sessions, rows)):
+        if phase == 0:
+            m = Maintainer(get_engine(path), policy=RetentionPolicy(max_messages=200, archive_after_days=30),
+                           archive_dir=os.path.join(workdir, f"archive-{rows}"))
+            m.ensure_schema()
+            m.watermark(now - 60 * DAY)  # cold half: last written 60 days ago
+    load_s = time.perf_counter() - t0
+    before = time_reads(path, sessions, reads)
+    size_before = file_mb(path)
+    t0 = time.perf_counter()
+    stats = m.run_once(now=now, time_budget=3600)
+    maint_s = time.perf_counter() - t0
+    after = time_reads(path, sessions, reads)
+    return load_s, before, size_before, maint_s, stats, after, file_mb(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hot-session latency vs table size, before/after maintenance")
+    parser.add_argument("--rows", type=int, nargs="+", default=[200_000, 2_000_000])
+    parser.add_argument("--sessions", type=int, default=4000)
+    parser.add_argument("--reads", type=int, default=200)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="powerai_retention_")
+    try:
+        print(f"{'rows':>10} {'phase':<7}{'window ms':>10}{'page ms':>9}{'exists ms':>10}{'clear ms':>9}{'file MB':>9}")
+        for rows in args.rows:
+            load_s, before, mb0, maint_s, stats, after, mb1 = run(rows, args.sessions, args.reads, workdir)
+            for label, r, mb in (("before", before, mb0), ("after", after, mb1)):
+                print(f"{rows:>10} {label:<7}{r['window_ms']:>10.3f}{r['page_ms']:>9.3f}"
+                      f"{r['exists_ms']:>10.3f}{r['clear_ms']:>9.2f}{mb:>9.1f}")
+            print(f"{'':>10} load {load_s:.1f}s, maintenance {maint_s:.1f}s: {stats['summarized_rows']} rows "
+                  f"summarized in {stats['compacted']} sessions, {stats['archived']} sessions archived "
+                  f"({stats['archived_rows']} rows), {stats['vacuumed_pages']} pages vacuumed")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
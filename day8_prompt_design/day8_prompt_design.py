@@ -1,12 +1,11 @@
-from langchain.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI
-from langchain.chains import LLMChain
 import os
+import sys
 from dotenv import load_dotenv
 
-load_dotenv()
-
-llm = ChatOpenAI(model="gpt-4o-mini")
+# Shared helpers live in ../powerai_core
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
 
 template = """
 You are PowerAI, an AI mentor helping students learn LangChain.
@@ -14,12 +13,30 @@ User question: {user_input}
 Answer clearly in 3 short paragraphs.
 """
 
-prompt = PromptTemplate(
-    input_variables=["user_input"],
-    template=template
-)
 
-chain = LLMChain(llm=llm, prompt=prompt)
+def main():
+    # langchain / langchain_openai load here, so importing this file stays cheap
+    from langchain.prompts import PromptTemplate
+    from langchain.chains import LLMChain
+    from powerai_core.llm_cache import get_response_cache
+    from powerai_core.resources import get_llm
+
+    load_dotenv()
+
+    # Fixed prompt, so reruns are served from the response cache (POWERAI_CACHE=off to skip)
+    llm = get_llm(model="gpt-4o-mini", cache=True, priority="batch")
+
+    prompt = PromptTemplate(
+        input_variables=["user_input"],
+        template=template
+    )
+
+    chain = LLMChain(llm=llm, prompt=prompt)
+
+    response = chain.run("What is conversational design in AI?")
+    print(response)
+    print(get_response_cache().format_stats())
+
 
-response = chain.run("What is conversational design in AI?")
-print(response)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+# day9_batch.py
+# Batch mode for the Day 9 intent -> outline -> response pipeline.
+#
+# Reads queries from a JSONL file and runs many pipelines at once on asyncio:
+#   - at most --concurrency LLM calls are in flight (one shared semaphore)
+#   - each query walks the three stages on its own, so stage-2 calls for early
+#     queries overlap stage-1 calls for later ones (no stage-wide barrier)
+#   - only a bounded number of queries are admitted at a time, so huge input
+#     files are streamed, not loaded
+#   - results are written as JSONL in completion order, with per-stage latency
+#   - --mode fused answers each query with one structured call (day9_fused.py)
+#
+# Input lines: {"user_input": "..."} (or "query"/"question"), an optional "id",
+# or a bare JSON string. A line that is not valid input becomes an error record
+# (with its "line" number) instead of stopping the batch.
+#
+#   python day9_prompt_flow/day9_batch.py queries.jsonl -o results.jsonl --concurrency 32
+#   python day9_prompt_flow/day9_batch.py queries.jsonl --fake --fake-latency 0.2   # offline
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Iterable, Iterator, Optional
+
+from dotenv import load_dotenv
+
+from day9_prompt_flow import BASE_DIR, build_stage_chains  # also puts ../powerai_core on sys.path
+from day9_fused import arun_fused
+
+INPUT_FIELDS = ("user_input", "query", "question")
+
+
+# ---------------------------
+# Input / output
+# ---------------------------
+def read_queries(lines: Iterable[str]) -> Iterator[dict]:
+    """
+    JSONL lines -> {"index", "id", "user_input"}; blank lines are skipped, a bad
+    line yields {"index", "id", "line", "error"} instead.
+    """
+    index = 0
+    for lineno, raw in enumerate(lines, 1):
+        raw = raw.strip()
+        if not raw:
+            continue
+        try:
+            item = json.loads(raw)
+            if isinstance(item, str):
+                item = {"user_input": item}
+            text = next((item[f] for f in INPUT_FIELDS if item.get(f)), None) if isinstance(item, dict) else None
+            if text is None:
+                raise ValueError(f"expected a string or an object with one of {INPUT_FIELDS}")
+        except ValueError as e:
+            yield {"index": index, "id": index, "line": lineno, "error": f"{type(e).__name__}: {e}"}
+        else:
+            yield {"index": index, "id": item.get("id", index), "user_input": str(text)}
+        index += 1
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+# ---------------------------
+# Pipeline
+# ---------------------------
+async def run_fused_item(llm, chains, item: dict, sem: asyncio.Semaphore) -> dict:
+    """One fused call per query (the staged fallback runs under the same slot)."""
+    record = dict(item)
+    started = time.perf_counter()
+    try:
+        async with sem:
+            t_call = time.perf_counter()
+            record.update(await arun_fused(llm, item["user_input"], stage_chains=chains))
+        record["latency"] = {"fused": round(time.perf_counter() - t_call, 4),
+                             "queued": round(t_call - started, 4)}
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+        record["latency"] = {}
+    record["latency"]["total"] = round(time.perf_counter() - started, 4)
+    return record
+
+
+async def run_item(chains, item: dict, sem: asyncio.Semaphore) -> dict:
+    """Run one query through every stage; errors are recorded, not raised."""
+    record = dict(item)
+    record["latency"] = {}
+    values = {"user_input": item["user_input"]}
+    started = time.perf_counter()
+    waited = 0.0
+    try:
+        for chain in chains:
+            t_wait = time.perf_counter()
+            async with sem:
+                t_call = time.perf_counter()
+                waited += t_call - t_wait
+                out = await chain.ainvoke(values)
+            record["latency"][chain.output_key] = round(time.perf_counter() - t_call, 4)
+            values[chain.output_key] = out[chain.output_key]
+            record[chain.output_key] = out[chain.output_key]
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["latency"]["queued"] = round(waited, 4)
+    record["latency"]["total"] = round(time.perf_counter() - started, 4)
+    return record
+
+
+async def run_batch(llm, queries: Iterable[dict], out, concurrency: int = 16,
+                    max_pending: Optional[int] = None, mode: str = "staged") -> dict:
+    """
+    Stream `queries` through the pipeline, writing each result line to `out` as
+    soon as it finishes. Returns a small summary dict.
+    """
+    chains = build_stage_chains(llm)
+    sem = asyncio.Semaphore(concurrency)
+    max_pending = max_pending or concurrency * 2
+    pending = set()
+    totals, items, errors = [], 0, 0
+    started = time.perf_counter()
+
+    def emit(record):
+        nonlocal items, errors
+        items += 1
+        errors += "error" in record
+        if "line" not in record:  # bad input lines stay out of the latency percentiles
+            totals.append(record["latency"]["total"])
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out.flush()
+
+    for item in queries:
+        if len(pending) >= max_pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                emit(task.result())
+        if "error" in item:  # unreadable input line: recorded, nothing to run
+            emit(dict(item, latency={"total": 0.0}))
+        elif mode == "fused":
+            pending.add(asyncio.ensure_future(run_fused_item(llm, chains, item, sem)))
+        else:
+            pending.add(asyncio.ensure_future(run_item(chains, item, sem)))
+
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            emit(task.result())
+
+    wall = time.perf_counter() - started
+    totals.sort()
+    return {
+        "items": items,
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "items_per_s": round(items / wall, 2) if wall else 0.0,
+        "p50_s": round(percentile(totals, 50), 3),
+        "p95_s": round(percentile(totals, 95), 3),
+    }
+
+
+# ---------------------------
+# CLI
+# ---------------------------
+def make_llm(args):
+    if args.fake:
+        from powerai_core.fake_llm import FakeStreamingChatModel
+        return FakeStreamingChatModel(first_token_latency=args.fake_latency)
+    load_dotenv(os.path.join(BASE_DIR, ".env"))
+    from powerai_core.resources import get_llm
+    return get_llm(model=args.model, cache=True if args.cache else None, priority="batch")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Day 9 pipeline over a JSONL file of queries")
+    parser.add_argument("input", help="JSONL file of queries ('-' for stdin)")
+    parser.add_argument("-o", "--output", default="-", help="results JSONL ('-' for stdout)")
+    parser.add_argument("--concurrency", type=int, default=16, help="max LLM calls in flight")
+    parser.add_argument("--max-pending", type=int, default=None,
+                        help="max queries admitted at once (default: 2 x concurrency)")
+    parser.add_argument("--mode", choices=("staged", "fused"), default="staged")
+    parser.add_argument("--model", default=os.getenv("MODEL_NAME", "gpt-4o-mini"))
+    parser.add_argument("--cache", action="store_true", help="serve repeated prompts from the response cache")
+    parser.add_argument("--fake", action="store_true", help="use the offline fake model (no API key)")
+    parser.add_argument("--fake-latency", type=float, default=0.2, help="seconds per fake LLM call")
+    args = parser.parse_args()
+
+    llm = make_llm(args)
+    src = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        summary = asyncio.run(run_batch(llm, read_queries(src), out, args.concurrency,
+                                          args.max_pending, args.mode))
+    finally:
+        if src is not sys.stdin:
+            src.close()
+        if out is not sys.stdout:
+            out.close()
+    print(json.dumps(summary), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
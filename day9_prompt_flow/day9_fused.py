@@ -0,0 +1,134 @@
+# day9_fused.py
+# Single-call ("fused") mode for the Day 9 intent -> outline -> response flow.
+#
+# The staged pipeline makes three round trips and waits for each full
+# completion before the next starts. The fused mode asks the model for all
+# three fields in one JSON object, so it pays one round trip and never re-sends
+# the intent/outline as prompt input. If the reply is not valid JSON with the
+# expected keys, it falls back to the staged chains for that query.
+#
+#     result = run_fused(llm, "How do I start with LangChain?")
+#     result["final_response"], result["mode"]   # "fused" or "staged-fallback"
+
+from typing import Any, Dict, List, Optional
+
+from langchain.prompts import PromptTemplate
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.output_parsers import JsonOutputParser
+
+from day9_prompt_flow import STAGES, build_stage_chains
+
+FUSED_KEYS = tuple(key for key, _ in STAGES)  # ("intent", "outline", "final_response")
+
+fused_prompt = PromptTemplate(
+    input_variables=["user_input"],
+    template=(
+        "You are PowerAI. Work through these three steps for the user input below:\n"
+        "1. intent: analyze the intent of the user input and explain it briefly.\n"
+        "2. outline: based on that intent, create a 3-point outline explaining the steps clearly.\n"
+        "3. final_response: convert the outline into a friendly PowerAI-style response "
+        "with emojis and clarity.\n\n"
+        'Reply with ONLY a JSON object with the string fields "intent", "outline" and "final_response".\n\n'
+        "User: {user_input}"
+    ),
+)
+
+_parser = JsonOutputParser()
+
+
+class UsageTally(BaseCallbackHandler):
+    """Sums token usage and counts LLM calls for everything run with it."""
+
+    def __init__(self):
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def on_llm_end(self, response, **kwargs: Any) -> None:
+        self.calls += 1
+        for generations in response.generations:
+            for gen in generations:
+                usage = getattr(getattr(gen, "message", None), "usage_metadata", None) or {}
+                self.input_tokens += usage.get("input_tokens", 0)
+                self.output_tokens += usage.get("output_tokens", 0)
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+
+def _as_text(value) -> str:
+    if isinstance(value, list):  # models sometimes return the outline as a list
+        return "\n".join(str(v) for v in value)
+    return str(value)
+
+
+def parse_fused(text: str) -> Dict[str, str]:
+    """Model reply -> {"intent", "outline", "final_response"}; raises ValueError if unusable."""
+    try:
+        data = _parser.parse(text)
+    except Exception as e:
+        raise ValueError(f"reply is not JSON: {e}") from e
+    if not isinstance(data, dict):
+        raise ValueError("reply is not a JSON object")
+    missing = [k for k in FUSED_KEYS if not data.get(k)]
+    if missing:
+        raise ValueError(f"reply is missing {missing}")
+    return {k: _as_text(data[k]) for k in FUSED_KEYS}
+
+
+def _json_mode(llm):
+    # ChatOpenAI can be told to emit a JSON object; other models get the prompt only
+    if any(cls.__name__ == "ChatOpenAI" for cls in type(llm).__mro__):
+        return llm.bind(response_format={"type": "json_object"})
+    return llm
+
+
+def _staged(stage_chains, user_input: str, config) -> Dict[str, str]:
+    values = {"user_input": user_input}
+    for chain in stage_chains:
+        values[chain.output_key] = chain.invoke(values, config=config)[chain.output_key]
+    return {k: values[k] for k in FUSED_KEYS}
+
+
+async def _astaged(stage_chains, user_input: str, config) -> Dict[str, str]:
+    values = {"user_input": user_input}
+    for chain in stage_chains:
+        values[chain.output_key] = (await chain.ainvoke(values, config=config))[chain.output_key]
+    return {k: values[k] for k in FUSED_KEYS}
+
+
+def run_fused(llm, user_input: str, stage_chains: Optional[List] = None,
+              callbacks: Optional[list] = None) -> Dict[str, str]:
+    """One structured call; the staged chains run only if the reply can't be parsed."""
+    config = {"callbacks": callbacks} if callbacks else None
+    reply = (fused_prompt | _json_mode(llm)).invoke({"user_input": user_input}, config=config)
+    try:
+        result = parse_fused(reply.content)
+        result["mode"] = "fused"
+    except ValueError as e:
+        result = _staged(stage_chains or build_stage_chains(llm), user_input, config)
+        result["mode"] = "staged-fallback"
+        result["fallback_reason"] = str(e)
+    return result
+
+
+async def arun_fused(llm, user_input: str, stage_chains: Optional[List] = None,
+                     callbacks: Optional[list] = None) -> Dict[str, str]:
+    config = {"callbacks": callbacks} if callbacks else None
+    reply = await (fused_prompt | _json_mode(llm)).ainvoke({"user_input": user_input}, config=config)
+    try:
+        result = parse_fused(reply.content)
+        result["mode"] = "fused"
+    except ValueError as e:
+        result = await _astaged(stage_chains or build_stage_chains(llm), user_input, config)
+        result["mode"] = "staged-fallback"
+        result["fallback_reason"] = str(e)
+    return result
+
+
+def run_staged(stage_chains, user_input: str, callbacks: Optional[list] = None) -> Dict[str, str]:
+    """The original three-call path, with the same return shape as run_fused()."""
+    result = _staged(stage_chains, user_input, {"callbacks": callbacks} if callbacks else None)
+    result["mode"] = "staged"
+    return result
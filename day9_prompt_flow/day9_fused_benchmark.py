@@ -0,0 +1,125 @@
+# day9_fused_benchmark.py
+# Compare the staged (3 calls) and fused (1 structured call) Day 9 modes on a
+# fixed query set against a mocked model, offline and deterministic.
+#
+# The mock charges a fixed per-call overhead plus a per-output-token delay, and
+# answers the fused prompt with a JSON object holding the same three texts the
+# staged calls produce, so the comparison isolates round trips and re-sent input.
+#
+#   python day9_prompt_flow/day9_fused_benchmark.py
+#   python day9_prompt_flow/day9_fused_benchmark.py --call-overhead 0.3 --bad-json-rate 0.1
+
+import argparse
+import json
+import random
+import statistics
+import time
+
+from day9_prompt_flow import build_stage_chains  # also puts ../powerai_core on sys.path
+from day9_fused import UsageTally, run_fused, run_staged
+from powerai_core.fake_llm import FakeStreamingChatModel
+
+QUERIES = [
+    "How can I start learning LangChain for my own AI startup?",
+    "What is the difference between a chain and an agent?",
+    "How do I give my chatbot long-term memory?",
+    "Which vector database should a small team pick?",
+    "How do I stream tokens into a Streamlit app?",
+    "What should I test before deploying an LLM app?",
+    "How do I keep OpenAI costs under control?",
+    "Can you explain prompt templates with an example?",
+    "How do I call external tools from an LLM?",
+    "What is retrieval augmented generation?",
+]
+
+
+def _words(rnd, n):
+    vocab = ("learn", "build", "python", "langchain", "memory", "prompt", "agent", "deploy",
+             "test", "stream", "tokens", "users", "data", "simple", "clear", "step")
+    return " ".join(rnd.choice(vocab) for _ in range(n))
+
+
+def mock_texts(seed_text):
+    """Deterministic intent/outline/response texts (fixed word counts) for one seed."""
+    rnd = random.Random(seed_text)
+    return {
+        "intent": "The user wants to " + _words(rnd, 30) + ".",
+        "outline": "\n".join(f"{i}. {_words(rnd, 20)}" for i in (1, 2, 3)),
+        "final_response": "🚀 " + _words(rnd, 110) + " ✅",
+    }
+
+
+def make_mock_responder(bad_json_rate=0.0, seed=11):
+    rnd = random.Random(seed)
+
+    def responder(messages):
+        prompt = str(messages[-1].content)
+        user_input = prompt.rsplit("User: ", 1)[-1].split("\n")[0]
+        if "JSON object" in prompt:
+            if rnd.random() < bad_json_rate:
+                return "Sure! Here is what you asked for: " + mock_texts(user_input)["final_response"]
+            return json.dumps(mock_texts(user_input), ensure_ascii=False)
+        # staged prompts: same-sized text for whichever stage is asking
+        stage = ("intent" if prompt.startswith("Analyze") else
+                 "outline" if prompt.startswith("Based on") else "final_response")
+        return mock_texts(user_input)[stage]
+
+    return responder
+
+
+def run_mode(mode, llm, chains):
+    tally = UsageTally()
+    latencies, fallbacks = [], 0
+    for q in QUERIES:
+        t0 = time.perf_counter()
+        if mode == "fused":
+            result = run_fused(llm, q, stage_chains=chains, callbacks=[tally])
+        else:
+            result = run_staged(chains, q, callbacks=[tally])
+        latencies.append(time.perf_counter() - t0)
+        fallbacks += result["mode"] == "staged-fallback"
+    return {
+        "calls": tally.calls,
+        "input_tokens": tally.input_tokens,
+        "output_tokens": tally.output_tokens,
+        "total_tokens": tally.total_tokens,
+        "mean_s": statistics.mean(latencies),
+        "p95_s": sorted(latencies)[int(0.95 * (len(latencies) - 1))],
+        "fallbacks": fallbacks,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fused vs staged Day 9 pipeline (mocked model)")
+    parser.add_argument("--call-overhead", type=float, default=0.15, help="seconds per LLM call")
+    parser.add_argument("--token-latency", type=float, default=0.001, help="seconds per output token")
+    parser.add_argument("--bad-json-rate", type=float, default=0.0,
+                        help="share of fused replies that are not JSON (exercises the fallback)")
+    args = parser.parse_args()
+
+    llm = FakeStreamingChatModel(responder=make_mock_responder(args.bad_json_rate),
+                                 first_token_latency=args.call_overhead,
+                                 token_latency=args.token_latency)
+    chains = build_stage_chains(llm)
+
+    results = {mode: run_mode(mode, llm, chains) for mode in ("staged", "fused")}
+    staged, fused = results["staged"], results["fused"]
+
+    print(f"{len(QUERIES)} queries, call overhead {args.call_overhead}s, "
+          f"bad JSON rate {args.bad_json_rate:.0%}\n")
+    print(f"{'mode':<8}{'calls':>7}{'in tok':>9}{'out tok':>9}{'total':>9}{'mean s':>9}{'p95 s':>9}{'fallbk':>8}")
+    for mode, r in results.items():
+        print(f"{mode:<8}{r['calls']:>7}{r['input_tokens']:>9}{r['output_tokens']:>9}"
+              f"{r['total_tokens']:>9}{r['mean_s']:>9.3f}{r['p95_s']:>9.3f}{r['fallbacks']:>8}")
+
+    def saved(a, b):
+        return f"{(1 - b / a):.0%}" if a else "n/a"
+
+    print(f"\nfused vs staged: latency -{saved(staged['mean_s'], fused['mean_s'])}, "
+          f"tokens -{saved(staged['total_tokens'], fused['total_tokens'])}, "
+          f"input tokens -{saved(staged['input_tokens'], fused['input_tokens'])}, "
+          f"calls -{saved(staged['calls'], fused['calls'])}")
+
+
+if __name__ == "__main__":
+    main()
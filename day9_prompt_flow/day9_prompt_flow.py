@@ -1,43 +1,82 @@
 from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain, SequentialChain
-from langchain_openai import ChatOpenAI
+import argparse
 import os
+import sys
 from dotenv import load_dotenv
 
-load_dotenv()
+# Shared helpers live in ../powerai_core
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
 
-llm = ChatOpenAI(model="gpt-4o-mini")
+from powerai_core.llm_cache import get_response_cache
+from powerai_core.resources import get_llm
 
 # Step 1: Understand intent
 intent_prompt = PromptTemplate(
     input_variables=["user_input"],
     template="Analyze the intent of this user input and explain it briefly:\n\nUser: {user_input}"
 )
-intent_chain = LLMChain(llm=llm, prompt=intent_prompt, output_key="intent")
 
 # Step 2: Generate structured outline
 outline_prompt = PromptTemplate(
     input_variables=["intent"],
     template="Based on this intent: {intent}, create a 3-point outline explaining the steps clearly."
 )
-outline_chain = LLMChain(llm=llm, prompt=outline_prompt, output_key="outline")
 
 # Step 3: Final conversational reply
 response_prompt = PromptTemplate(
     input_variables=["outline"],
     template="Convert this outline into a friendly PowerAI-style response with emojis and clarity:\n\n{outline}"
 )
-response_chain = LLMChain(llm=llm, prompt=response_prompt, output_key="final_response")
 
-# Combine all chains
-overall_chain = SequentialChain(
-    chains=[intent_chain, outline_chain, response_chain],
-    input_variables=["user_input"],
-    output_variables=["final_response"]
+# (output_key, prompt) in pipeline order; each stage reads the previous stage's output
+STAGES = (
+    ("intent", intent_prompt),
+    ("outline", outline_prompt),
+    ("final_response", response_prompt),
 )
 
-# Run it!
-user_query = "How can I start learning LangChain for my own AI startup?"
-result = overall_chain({"user_input": user_query})
 
-print("🤖 PowerAI says:\n", result["final_response"])
+def build_stage_chains(llm):
+    """One LLMChain per stage: [intent_chain, outline_chain, response_chain]."""
+    return [LLMChain(llm=llm, prompt=prompt, output_key=key) for key, prompt in STAGES]
+
+
+def build_pipeline(llm):
+    # Combine all chains
+    return SequentialChain(
+        chains=build_stage_chains(llm),
+        input_variables=["user_input"],
+        output_variables=["final_response"]
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Day 9 intent -> outline -> response flow")
+    parser.add_argument("--mode", choices=("staged", "fused"), default="staged",
+                        help="fused: one structured call, staged chains only as fallback")
+    args = parser.parse_args()
+
+    load_dotenv()
+
+    # Fixed prompts, so reruns are served from the response cache (POWERAI_CACHE=off to skip)
+    llm = get_llm(model="gpt-4o-mini", cache=True, priority="batch")
+
+    # Run it!
+    user_query = "How can I start learning LangChain for my own AI startup?"
+    if args.mode == "fused":
+        from day9_fused import run_fused
+        result = run_fused(llm, user_query)
+        print(f"(mode: {result['mode']})")
+    else:
+        overall_chain = build_pipeline(llm)
+        result = overall_chain({"user_input": user_query})
+
+    print("🤖 PowerAI says:\n", result["final_response"])
+    print(get_response_cache().format_stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+# powerai_core — shared building blocks for the PowerAI scripts and apps.
+#
+# Each Day folder runs as a standalone script, so this package stays light:
+# nothing heavy is imported here. Import the submodule you need, e.g.
+#
+#     from powerai_core.history import WindowedSQLHistory
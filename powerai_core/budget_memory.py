@@ -0,0 +1,332 @@
+# budget_memory.py
+# Token-budgeted conversation memory with tiered rolling summaries.
+#
+# ConversationBufferMemory sends the whole transcript every turn, so prompts grow
+# without bound. TokenBudgetMemory grows the Day 3 idea (window + summary +
+# entities) into something that respects a hard token budget:
+#
+#   [entities]  Persona → name: Vikas | likes: LangChain | tools: Python
+#   [tier 2]    summary of summaries (oldest, most compressed)
+#   [tier 1]    one summary per chunk of older messages
+#   [recent]    newest messages, verbatim, newest-first until their share is used
+#
+# When the summaries no longer fit, the oldest `fan_in` tier-k summaries are
+# merged into one tier-(k+1) summary. Token counts are cached per message, so the
+# budget check only tokenizes messages it has not seen before. What has been
+# folded is tracked by row id (WindowedSQLHistory.records(); list position for
+# in-memory histories), so compaction or rows from other processes never make
+# a message fold twice.
+
+import bisect
+import hashlib
+import math
+import re
+from collections import OrderedDict
+from textwrap import shorten
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain_core.messages import BaseMessage, SystemMessage, get_buffer_string
+
+from powerai_core.telemetry import timed
+
+
+# ---------------------------
+# Token counting (cached)
+# ---------------------------
+def approx_token_count(text: str) -> int:
+    """~4 characters per token, the usual rule of thumb for English with OpenAI tokenizers."""
+    return max(1, math.ceil(len(text) / 4)) if text else 0
+
+
+class CachedTokenCounter:
+    """
+    Memoizes token counts by message fingerprint. If the real tokenizer fails
+    (e.g. tiktoken can't fetch its vocabulary offline) it falls back to the
+    approximation for good.
+    """
+
+    def __init__(self, count_fn: Optional[Callable[[str], int]] = None, max_entries: int = 50_000):
+        self.count_fn = count_fn or approx_token_count
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+        self.computed = 0
+
+    def count_text(self, text: str) -> int:
+        try:
+            return self.count_fn(text)
+        except Exception:
+            self.count_fn = approx_token_count
+            return approx_token_count(text)
+
+    def count(self, message: BaseMessage) -> int:
+        key = message_fingerprint(message)
+        n = self._cache.get(key)
+        if n is None:
+            n = self.count_text(str(message.content)) + 4  # + role/format overhead
+            self.computed += 1
+            self._cache[key] = n
+            if len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return n
+
+
+def message_fingerprint(message: BaseMessage) -> str:
+    data = f"{message.type}\x00{message.content}".encode("utf-8", "ignore")
+    return hashlib.blake2b(data, digest_size=12).hexdigest()
+
+
+# ---------------------------
+# Summarizers
+# ---------------------------
+def extractive_summarizer(texts: List[str], max_chars: int) -> str:
+    """Offline summary: compact bullets, like Day 3's update_summary."""
+    joined = " • ".join(t.strip().replace("\n", " ") for t in texts if t.strip())
+    return shorten(joined, width=max(40, max_chars), placeholder=" ...")
+
+
+def llm_summarizer(llm) -> Callable[[List[str], int], str]:
+    """Summarize with a chat model; falls back to the extractive summary on errors."""
+    def summarize(texts: List[str], max_chars: int) -> str:
+        prompt = (
+            "Summarize this conversation excerpt for your own memory. Keep names, "
+            f"preferences, decisions and open questions. At most {max_chars} characters.\n\n"
+            + "\n".join(texts)
+        )
+        try:
+            out = llm.invoke(prompt)
+            return str(getattr(out, "content", out)).strip()[: max_chars + 200]
+        except Exception:
+            return extractive_summarizer(texts, max_chars)
+    return summarize
+
+
+# ---------------------------
+# Entities (Day 3 patterns, one compiled pass)
+# ---------------------------
+# zero-width lookaheads so "my name is X and I like Y" yields both facts
+_ENTITY_RE = re.compile(
+    r"(?=\bmy name is (?P<name>[A-Za-z][A-Za-z ]+?)(?:\s+and\b|[^A-Za-z ]|$))"
+    r"|(?=\bI (?:like|love|prefer)\s+(?P<like>[A-Za-z0-9\-_ ]+))"
+    r"|(?=\bI (?:use|work with)\s+(?P<tool>[A-Za-z0-9\-_ ]+))",
+    re.I,
+)
+
+
+_SUMMARY_HEADER = "Summary of earlier conversation:\n"
+_HEADER_TOKENS = approx_token_count(_SUMMARY_HEADER) + 4
+
+
+def _short_role(message: BaseMessage) -> str:
+    return {"human": "U", "ai": "A", "system": "S"}.get(message.type, message.type[:1].upper())
+
+
+# ---------------------------
+# Memory
+# ---------------------------
+class TokenBudgetMemory(BaseChatMemory):
+    """
+    max_token_limit: total tokens the history may occupy in the prompt
+    recent_share:    fraction of the budget reserved for verbatim recent messages
+    chunk_size:      messages folded into each tier-1 summary
+    fan_in:          summaries merged into one summary of the next tier
+    summarizer:      fn(texts, max_chars) -> str (offline extractive by default)
+    max_entity_values: newest likes / tools kept for the persona card
+    """
+
+    memory_key: str = "history"
+    human_prefix: str = "Human"
+    ai_prefix: str = "AI"
+    max_token_limit: int = 1500
+    recent_share: float = 0.6
+    chunk_size: int = 8
+    fan_in: int = 4
+    summary_chars: int = 400
+    max_entity_values: int = 5
+    summarizer: Callable[[List[str], int], str] = extractive_summarizer
+    token_counter: CachedTokenCounter = None  # type: ignore[assignment]
+
+    # rolling state (kept in process; rebuilt lazily from history after restarts)
+    tiers: List[List[str]] = []
+    entities: Dict[str, Any] = {}
+    summarized_through: int = 0  # id of the newest message folded into a summary
+    persona_chars: Optional[int] = None  # set by _compress when the card itself must shrink
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        if self.token_counter is None:
+            self.token_counter = CachedTokenCounter()
+        self.tiers = [[]]
+        self.entities = {}
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    # ---- budget assembly ----
+    def _visible(self) -> Tuple[List[int], List[BaseMessage]]:
+        """Ids (ascending) and messages of what the history shows."""
+        records = getattr(self.chat_memory, "records", None)
+        if callable(records):
+            from powerai_core.history import records_to_messages
+
+            rows = records()
+            return [i for i, _ in rows], records_to_messages(rows)
+        messages = self.chat_memory.messages
+        # in-memory history: append-only until cleared, so positions work as ids
+        return list(range(1, len(messages) + 1)), messages
+
+    def _unsummarized_start(self, ids: List[int]) -> int:
+        """Index of the first message not yet folded into a summary."""
+        if ids and ids[-1] < self.summarized_through:
+            # ids only grow: the history was cleared behind our back
+            self.clear_state()
+        return bisect.bisect_right(ids, self.summarized_through)
+
+    def _split_recent(self, messages: List[BaseMessage], start: int) -> int:
+        """Index where the verbatim tail begins (always keeps the newest message)."""
+        budget = int(self.max_token_limit * self.recent_share)
+        used = 0
+        split = len(messages)
+        for i in range(len(messages) - 1, start - 1, -1):
+            used += self.token_counter.count(messages[i])
+            if used > budget and split < len(messages):
+                break
+            split = i
+        return split
+
+    @timed("memory.summarize")
+    def _fold(self, ids: List[int], messages: List[BaseMessage], start: int, end: int) -> None:
+        """Summarize messages[start:end] (leaving the verbatim window), chunk by chunk."""
+        for i in range(start, end, self.chunk_size):
+            chunk = messages[i:min(i + self.chunk_size, end)]
+            for m in chunk:
+                if m.type == "human":
+                    self._extract_entities(str(m.content))
+            texts = [f"{_short_role(m)}: {m.content}" for m in chunk]
+            self.tiers[0].append(self.summarizer(texts, self.summary_chars))
+        self.summarized_through = ids[end - 1]
+
+    def _compress(self, limit: int) -> None:
+        """Merge oldest summaries upward, then shorten the persona card, until the summary block fits `limit` tokens."""
+        self.persona_chars = None
+        while self._summary_tokens() > limit:
+            level = next((k for k, tier in enumerate(self.tiers) if len(tier) >= 2), None)
+            if level is not None:
+                merge = self.tiers[level][: self.fan_in]
+                del self.tiers[level][: self.fan_in]
+                if level + 1 == len(self.tiers):
+                    self.tiers.append([])
+                self.tiers[level + 1].append(self.summarizer(merge, self.summary_chars))
+                continue
+            filled = [k for k, tier in enumerate(self.tiers) if tier]
+            if len(filled) >= 2:
+                # one summary per tier: fold the two oldest into the highest tier
+                top, below = filled[-1], filled[-2]
+                merged = [self.tiers[top].pop(), self.tiers[below].pop()]
+                self.tiers[top].append(self.summarizer(merged, self.summary_chars))
+                continue
+            # a single summary is still too big: shorten it in place
+            if filled and len(self.tiers[filled[0]][-1]) > 40:
+                tier = self.tiers[filled[0]]
+                tier[-1] = shorten(tier[-1], width=max(40, len(tier[-1]) // 2), placeholder=" ...")
+                continue
+            # last resort: the persona card
+            card = len(self.persona_card())
+            if card <= 40:
+                break  # build_context drops the summary block if it still does not fit
+            self.persona_chars = max(40, card // 2)
+
+    def _summary_tokens(self) -> int:
+        text = self.summary_text()
+        return self.token_counter.count_text(text) if text else 0
+
+    def summary_text(self) -> str:
+        lines = []
+        persona = self.persona_card()
+        if persona:
+            lines.append(persona)
+        # highest (oldest, most compressed) tier first, so the text reads in time order
+        for tier in reversed(self.tiers):
+            lines.extend(tier)
+        return "\n".join(lines)
+
+    def _fit_message(self, message: BaseMessage, limit: int) -> BaseMessage:
+        """A copy of `message` cut down to `limit` tokens (for a newest message over the whole budget)."""
+        content = str(message.content)
+        while content and self.token_counter.count_text(content) + 4 > limit:
+            content = content[: len(content) * 3 // 4]
+        return message.copy(update={"content": content})
+
+    def build_context(self) -> Tuple[str, List[BaseMessage]]:
+        """Summary text and verbatim messages; together never over max_token_limit."""
+        ids, messages = self._visible()
+        start = self._unsummarized_start(ids)
+        split = self._split_recent(messages, start)
+        if split > start:
+            self._fold(ids, messages, start, split)
+        recent = messages[split:]
+        recent_tokens = sum(self.token_counter.count(m) for m in recent)
+        if recent and recent_tokens > self.max_token_limit:
+            # _split_recent keeps the newest message even when it alone is over budget
+            recent = [self._fit_message(recent[-1], self.max_token_limit)]
+            recent_tokens = self.token_counter.count(recent[0])
+        limit = max(0, self.max_token_limit - recent_tokens - _HEADER_TOKENS)
+        self._compress(limit)
+        summary = self.summary_text()
+        if summary and self.token_counter.count_text(summary) > limit:
+            summary = ""  # not even the shortest summary fits next to the recent messages
+        return summary, recent
+
+    @timed("memory.load")
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        summary, recent = self.build_context()
+        if self.return_messages:
+            head = [SystemMessage(content=_SUMMARY_HEADER + summary)] if summary else []
+            return {self.memory_key: head + recent}
+        body = get_buffer_string(recent, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix)
+        if summary:
+            body = f"{_SUMMARY_HEADER}{summary}\n{body}"
+        return {self.memory_key: body}
+
+    # ---- entities ----
+    def _extract_entities(self, text: str) -> None:
+        for m in _ENTITY_RE.finditer(text):
+            if m.group("name") and "name" not in self.entities:
+                self.entities["name"] = m.group("name").strip()
+            elif m.group("like"):
+                self._remember("likes", m.group("like").strip())
+            elif m.group("tool"):
+                self._remember("tools", m.group("tool").strip())
+
+    def _remember(self, kind: str, value: str) -> None:
+        # insertion-ordered dict as an ordered set: newest last, oldest dropped past the cap
+        values = self.entities.setdefault(kind, {})
+        values.pop(value, None)
+        values[value] = None
+        while len(values) > self.max_entity_values:
+            del values[next(iter(values))]
+
+    def persona_card(self) -> str:
+        if not self.entities:
+            return ""
+        likes = ", ".join(self.entities.get("likes", ())) or "—"
+        tools = ", ".join(self.entities.get("tools", ())) or "—"
+        card = f"Persona → name: {self.entities.get('name', 'User')} | likes: {likes} | tools: {tools}"
+        if self.persona_chars is not None and len(card) > self.persona_chars:
+            card = shorten(card, width=self.persona_chars, placeholder=" ...")
+        return card
+
+    def clear_state(self) -> None:
+        """Forget summaries and entities (the history itself is left alone)."""
+        self.tiers = [[]]
+        self.entities = {}
+        self.summarized_through = 0
+        self.persona_chars = None
+
+    def clear(self) -> None:
+        super().clear()
+        self.clear_state()
@@ -0,0 +1,140 @@
+# chat_client.py
+# Thin synchronous client for chat_service.py, used by the Streamlit apps when
+# POWERAI_CHAT_SERVICE_URL is set (e.g. http://127.0.0.1:8765).
+#
+#     client = get_chat_client(url)
+#     for text in client.stream_turn("vikas", "hi", timings, system_prompt="..."):
+#         ...
+#     client.messages("vikas", limit=50)
+#
+# One pooled requests.Session per service URL, shared by every rerun and browser
+# session of the Streamlit process.
+
+import json
+import os
+import threading
+from typing import Dict, Iterator, List, Optional
+
+import requests
+
+
+class ChatServiceError(RuntimeError):
+    """The service answered with an error (or an error event mid-stream)."""
+
+
+class ChatServiceClient:
+    def __init__(self, base_url: str, timeout: float = 120.0, pool_size: int = 16):
+        from requests.adapters import HTTPAdapter
+
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _url(self, path: str) -> str:
+        return f"{self.base_url}{path}"
+
+    def _session_url(self, session_id: str, what: str) -> str:
+        return self._url(f"/v1/sessions/{requests.utils.quote(session_id, safe='')}/{what}")
+
+    @staticmethod
+    def _headers(api_key: Optional[str]) -> dict:
+        return {"Authorization": f"Bearer {api_key}"} if api_key else {}
+
+    @staticmethod
+    def _check(resp) -> None:
+        if resp.status_code >= 400:
+            try:
+                detail = resp.json().get("error", resp.text)
+            except ValueError:
+                detail = resp.text
+            raise ChatServiceError(f"{resp.status_code}: {detail}")
+
+    def health(self) -> dict:
+        resp = self.session.get(self._url("/health"), timeout=5)
+        self._check(resp)
+        return resp.json()
+
+    def messages(self, session_id: str, limit: int = 50, before_id: Optional[int] = None,
+                 skip_notes: bool = False) -> List[dict]:
+        params = {"limit": limit, "skip_notes": int(skip_notes)}
+        if before_id is not None:
+            params["before_id"] = before_id
+        resp = self.session.get(self._session_url(session_id, "messages"),
+                                params=params, timeout=self.timeout)
+        self._check(resp)
+        return resp.json()["messages"]
+
+    def transcript_pages(self, session_id: str):
+        """transcript.load_transcript() page fetcher backed by the service ([SYSTEM NOTE] rows skipped)."""
+        from powerai_core.transcript import TranscriptBlock
+
+        def fetch(limit, before_id):
+            return [TranscriptBlock(m["id"], m["role"], m["content"])
+                    for m in self.messages(session_id, limit, before_id, skip_notes=True)]
+
+        return fetch
+
+    def reset(self, session_id: str) -> None:
+        resp = self.session.delete(self._session_url(session_id, "messages"),
+                                   timeout=self.timeout)
+        self._check(resp)
+
+    def send_turn(self, session_id: str, message: str, api_key: Optional[str] = None, **config) -> dict:
+        """One non-streamed turn -> {"reply": ..., "timings": {...}}."""
+        resp = self.session.post(self._session_url(session_id, "turns"),
+                                 json={"message": message, "stream": False, **config},
+                                 headers=self._headers(api_key), timeout=self.timeout)
+        self._check(resp)
+        return resp.json()
+
+    def stream_turn(self, session_id: str, message: str, timings=None, api_key: Optional[str] = None,
+                    **config) -> Iterator[str]:
+        """Yield reply chunks as the service streams them; fills `timings` (TurnTimings) at the end."""
+        resp = self.session.post(self._session_url(session_id, "turns"),
+                                 json={"message": message, "stream": True, **config},
+                                 headers=self._headers(api_key), stream=True, timeout=self.timeout)
+        with resp:
+            self._check(resp)
+            event = "message"
+            for line in resp.iter_lines(decode_unicode=True):
+                if not line:
+                    event = "message"
+                    continue
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                    continue
+                if not line.startswith("data:"):
+                    continue
+                data = json.loads(line[5:].strip())
+                if event == "error":
+                    raise ChatServiceError(data.get("error", "stream failed"))
+                if event == "done":
+                    if timings is not None:
+                        for k, v in (data.get("timings") or {}).items():
+                            setattr(timings, k, v)
+                    return
+                yield data.get("delta", "")
+        raise ChatServiceError("stream ended without a done event")
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_clients: Dict[str, ChatServiceClient] = {}
+_clients_lock = threading.Lock()
+
+
+def service_url() -> str:
+    return os.getenv("POWERAI_CHAT_SERVICE_URL", "").strip()
+
+
+def get_chat_client(base_url: Optional[str] = None) -> ChatServiceClient:
+    url = (base_url or service_url()).rstrip("/")
+    with _clients_lock:
+        client = _clients.get(url)
+        if client is None:
+            client = _clients[url] = ChatServiceClient(url)
+        return client
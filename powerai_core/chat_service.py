@@ -0,0 +1,342 @@
+# chat_service.py
+# Asyncio chat service: owns sessions, memory and model calls behind a local
+# HTTP/SSE API, so the Streamlit apps can be thin clients (chat_client.py).
+#
+#   GET    /health                               -> {"ok": true, "sessions": n, "pid": ...}
+#   GET    /metrics                              -> Prometheus text (telemetry.py)
+#   GET    /v1/sessions/{sid}/messages?limit=50&before_id=123&skip_notes=1
+#                                                -> {"messages": [{"id", "role", "content"}, ...]}
+#                                                   role: "user" | "assistant"
+#   DELETE /v1/sessions/{sid}/messages           -> wipe the session's history
+#   POST   /v1/sessions/{sid}/turns              -> one chat turn
+#          {"message": "...", "stream": true, "system_prompt": "...", "memory_mode": "buffer",
+#           "token_budget": 1500, "temperature": 0.4}
+#          stream=false -> {"reply": "...", "timings": {...}}
+#          stream=true  -> text/event-stream: "data: {"delta": "..."}" per chunk, then
+#                          "event: done" with {"reply", "timings"} (or "event: error")
+#
+# The OpenAI key comes from the service's OPENAI_API_KEY, or per request from
+# "Authorization: Bearer sk-...". Turns of one session run one at a time (in
+# order); different sessions run concurrently on the event loop, with SQLite
+# reads/writes in worker threads.
+#
+#   python -m powerai_core.chat_service --db powerai_memory.db --port 8765
+#   python -m powerai_core.chat_service --workers 4      # SO_REUSEPORT, shared WAL store
+#   python -m powerai_core.chat_service --openai-base-url http://127.0.0.1:8089/v1   # stub server
+#
+# With several workers every process serves any session: history lives in the
+# shared SQLite/WAL file, the rate limiter shares POWERAI_SCHEDULER_STATE. A
+# turn's rows are committed before its reply / "done" event is sent, so a client
+# that waits for the reply can send its next turn to any worker. The per-session
+# turn lock is per process, though: clients that send overlapping turns for one
+# session must be routed to a single worker (e.g. a proxy hashing the session id).
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+# Shared helpers live in ../powerai_core
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from powerai_core.history import SYSTEM_NOTE_PREFIX
+from powerai_core.maintenance import start_maintenance
+from powerai_core.resources import ResourceCache, get_engine, get_llm, get_session_history, key_fingerprint
+from powerai_core.transcript import forget_transcript, history_pages
+CHAIN_WINDOW = 20    # messages sent to the model (plus the pinned [SYSTEM NOTE])
+BUDGET_WINDOW = 200  # messages the token-budget memory may fold into summaries
+
+
+class ChatSession:
+    """One (session, settings) pair: its chain and the history under it."""
+
+    def __init__(self, chain, history):
+        self.chain = chain
+        self.history = history
+
+
+class ChatService:
+    """
+    db_path:   SQLite file for every session's history (WAL, write-behind)
+    model:     chat model name
+    api_key:   default OpenAI key (requests may bring their own)
+    base_url:  OpenAI-compatible endpoint (None = api.openai.com)
+    """
+
+    def __init__(self, db_path: str, model: str = "gpt-4o-mini", api_key: Optional[str] = None,
+                 base_url: Optional[str] = None, max_sessions: int = 2048):
+        self.db_path = os.path.abspath(db_path)
+        self.model = model
+        self.api_key = api_key
+        self.base_url = base_url
+        self.sessions = ResourceCache("chat_sessions", max_items=max_sessions, idle_ttl=1800)
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.turns = 0
+        self.active = 0
+
+    # ---- sessions ----
+    def lock_for(self, session_id: str) -> asyncio.Lock:
+        lock = self._locks.get(session_id)
+        if lock is None:
+            if len(self._locks) > 4 * self.sessions.max_items:
+                for sid in [s for s, lk in self._locks.items() if not lk.locked()]:
+                    del self._locks[sid]
+            lock = self._locks[session_id] = asyncio.Lock()
+        return lock
+
+    def history(self, session_id: str, memory_mode: str = "buffer"):
+        window = CHAIN_WINDOW if memory_mode == "buffer" else BUDGET_WINDOW
+        return get_session_history(session_id, self.db_path, window=window, keep_first=True)
+
+    def _build_session(self, session_id: str, api_key: Optional[str], cfg: dict) -> ChatSession:
+        """Blocking (SQLite): run in a worker thread."""
+        from langchain.chains import ConversationChain
+        from powerai_core.memory_modes import build_memory
+
+        mode = cfg["memory_mode"]
+        llm = get_llm(self.model, temperature=cfg["temperature"], api_key=api_key,
+                      **({"base_url": self.base_url} if self.base_url else {}))
+        history = self.history(session_id, mode)
+        if cfg["system_prompt"] and not history.has_messages():
+            history.add_ai_message(f"{SYSTEM_NOTE_PREFIX}\n{cfg['system_prompt']}")
+        memory = build_memory(mode, chat_memory=history, llm=llm, token_budget=cfg["token_budget"],
+                              return_messages=True)
+        return ChatSession(ConversationChain(llm=llm, memory=memory, verbose=False), history)
+
+    async def session(self, session_id: str, api_key: Optional[str], cfg: dict) -> ChatSession:
+        key = (session_id, key_fingerprint(api_key), cfg["memory_mode"], cfg["token_budget"],
+               cfg["temperature"], cfg["system_prompt"])
+        # built under the cache's lock for this key only: a slow build (history
+        # restore, index checks) does not hold up lookups of other sessions
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: self.sessions.get_or_create(
+            key, lambda: self._build_session(session_id, api_key, cfg)))
+
+    def forget(self, session_id: str) -> None:
+        with self.sessions._lock:
+            for key in [k for k in self.sessions._items if k[0] == session_id]:
+                self.sessions.pop(key)
+
+    # ---- operations ----
+    async def turn(self, session_id: str, message: str, api_key: Optional[str], cfg: dict, timings):
+        """Async generator of reply chunks; memory is saved once the reply is complete."""
+        from powerai_core.streaming import astream_turn
+
+        async with self.lock_for(session_id):
+            sess = await self.session(session_id, api_key, cfg)
+            self.active += 1
+            try:
+                async for text in astream_turn(sess.chain, message, timings):
+                    yield text
+                # the turn's rows are committed before the caller sends "done" / the reply
+                await asyncio.to_thread(sess.history.flush)
+                self.turns += 1
+            finally:
+                self.active -= 1
+
+    def _read(self, session_id: str, limit: int, before_id: Optional[int], skip_notes: bool) -> list:
+        history = self.history(session_id)
+        history.writer.flush()  # rows queued by this session's other history views, too
+        return [block._asdict() for block in history_pages(history, skip_notes)(limit, before_id)]
+
+    def _clear(self, session_id: str) -> None:
+        from powerai_core.retrieval import clear_index
+
+        history = self.history(session_id)
+        history.writer.flush()
+        history.clear()
+        clear_index(history)
+        forget_transcript(history)
+
+    async def messages(self, session_id: str, limit: int, before_id: Optional[int],
+                       skip_notes: bool = False) -> list:
+        return await asyncio.to_thread(self._read, session_id, limit, before_id, skip_notes)
+
+    async def reset(self, session_id: str) -> None:
+        async with self.lock_for(session_id):
+            await asyncio.to_thread(self._clear, session_id)
+            self.forget(session_id)
+
+
+# ---------------------------
+# HTTP layer (aiohttp)
+# ---------------------------
+DEFAULTS = {"memory_mode": "buffer", "token_budget": 1500, "temperature": 0.4, "system_prompt": ""}
+
+
+def turn_config(body: dict) -> dict:
+    from powerai_core.memory_modes import MEMORY_MODES
+
+    cfg = dict(DEFAULTS)
+    for k in DEFAULTS:
+        if body.get(k) is not None:
+            cfg[k] = body[k]
+    if cfg["memory_mode"] not in MEMORY_MODES:
+        raise ValueError(f"memory_mode must be one of {MEMORY_MODES}")
+    cfg["token_budget"] = int(cfg["token_budget"])
+    cfg["temperature"] = float(cfg["temperature"])
+    cfg["system_prompt"] = str(cfg["system_prompt"] or "")
+    return cfg
+
+
+def build_app(service: ChatService):
+    from aiohttp import web
+    from powerai_core import telemetry
+    from powerai_core.streaming import TurnTimings
+
+    routes = web.RouteTableDef()
+
+    def request_key(request) -> Optional[str]:
+        auth = request.headers.get("Authorization", "")
+        return auth[7:].strip() if auth.lower().startswith("bearer ") else service.api_key
+
+    def bad_request(msg: str):
+        return web.json_response({"error": msg}, status=400)
+
+    @routes.get("/health")
+    async def health(request):
+        return web.json_response({"ok": True, "pid": os.getpid(), "sessions": len(service.sessions),
+                                  "active_turns": service.active, "turns": service.turns})
+
+    @routes.get("/metrics")
+    async def metrics(request):
+        return web.Response(text=telemetry.prometheus_text(), content_type="text/plain")
+
+    @routes.get("/v1/sessions/{sid}/messages")
+    async def get_messages(request):
+        try:
+            limit = min(500, int(request.query.get("limit", 50)))
+            before = request.query.get("before_id")
+            before_id = int(before) if before else None
+        except ValueError:
+            return bad_request("limit and before_id must be integers")
+        skip_notes = request.query.get("skip_notes", "0").lower() in ("1", "true", "yes")
+        msgs = await service.messages(request.match_info["sid"], limit, before_id, skip_notes)
+        return web.json_response({"messages": msgs})
+
+    @routes.delete("/v1/sessions/{sid}/messages")
+    async def delete_messages(request):
+        await service.reset(request.match_info["sid"])
+        return web.json_response({"ok": True})
+
+    @routes.post("/v1/sessions/{sid}/turns")
+    async def post_turn(request):
+        try:
+            body = await request.json()
+            message = str(body["message"])
+            cfg = turn_config(body)
+        except (ValueError, KeyError, TypeError) as e:
+            return bad_request(f"bad turn request: {e}")
+        api_key = request_key(request)
+        if not api_key:
+            return web.json_response({"error": "no OpenAI API key"}, status=401)
+        sid = request.match_info["sid"]
+        timings = TurnTimings()
+        turn = telemetry.begin_turn("service", session=sid, stream=bool(body.get("stream")))
+        try:
+            if not body.get("stream"):
+                try:
+                    parts = [t async for t in service.turn(sid, message, api_key, cfg, timings)]
+                except Exception as e:
+                    return web.json_response({"error": f"{type(e).__name__}: {e}"}, status=502)
+                return web.json_response({"reply": "".join(parts), "timings": timings.as_dict()})
+
+            resp = web.StreamResponse(headers={"Content-Type": "text/event-stream",
+                                               "Cache-Control": "no-cache"})
+            await resp.prepare(request)
+            parts = []
+            try:
+                async for text in service.turn(sid, message, api_key, cfg, timings):
+                    parts.append(text)
+                    await resp.write(f"data: {json.dumps({'delta': text})}\n\n".encode("utf-8"))
+                done = {"reply": "".join(parts), "timings": timings.as_dict()}
+                await resp.write(f"event: done\ndata: {json.dumps(done)}\n\n".encode("utf-8"))
+            except (ConnectionResetError, asyncio.CancelledError):
+                raise  # client went away: nothing is saved for a half answer
+            except Exception as e:
+                err = {"error": f"{type(e).__name__}: {e}"}
+                await resp.write(f"event: error\ndata: {json.dumps(err)}\n\n".encode("utf-8"))
+            await resp.write_eof()
+            return resp
+        finally:
+            turn.end()
+
+    app = web.Application()
+    app.add_routes(routes)
+    return app
+
+
+async def serve(service: ChatService, host: str, port: int, reuse_port: bool = False,
+                threads: int = 64) -> None:
+    from aiohttp import web
+
+    # SQLite reads/writes and session builds run here; size it for many sessions
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=threads))
+    runner = web.AppRunner(build_app(service), access_log=None)
+    # every worker starts one; the lease in the database lets a single one run at a time
+    start_maintenance(get_engine(service.db_path))
+    await runner.setup()
+    site = web.TCPSite(runner, host, port, reuse_port=reuse_port or None)
+    await site.start()
+    print(f"PowerAI chat service on http://{host}:{port} (pid {os.getpid()}, db {service.db_path})",
+          flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+def _sigterm(signum, frame):
+    raise KeyboardInterrupt  # unwind like Ctrl+C, so the finally below stops the workers too
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PowerAI async chat service (HTTP/SSE)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--db", default="powerai_memory.db", help="SQLite file for chat histories")
+    parser.add_argument("--model", default=os.getenv("MODEL_NAME", "gpt-4o-mini"))
+    parser.add_argument("--openai-base-url", default=os.getenv("OPENAI_BASE_URL"),
+                        help="OpenAI-compatible endpoint (e.g. the stub server)")
+    parser.add_argument("--workers", type=int, default=1, help="processes sharing the port (SO_REUSEPORT)")
+    parser.add_argument("--threads", type=int, default=64, help="worker threads per process for SQLite")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    signal.signal(signal.SIGTERM, _sigterm)
+    children = []
+    if args.workers > 1 and not args.worker:
+        # one rate limit for all workers unless the caller chose a state file
+        os.environ.setdefault("POWERAI_SCHEDULER_STATE", os.path.abspath(args.db) + ".scheduler.json")
+        argv = ["--host", args.host, "--port", str(args.port), "--db", os.path.abspath(args.db),
+                "--model", args.model, "--threads", str(args.threads), "--worker"]
+        if args.openai_base_url:
+            argv += ["--openai-base-url", args.openai_base_url]
+        children = [subprocess.Popen([sys.executable, "-m", "powerai_core.chat_service", *argv],
+                                     cwd=BASE_DIR, env=dict(os.environ)) for _ in range(args.workers - 1)]
+    service = ChatService(args.db, model=args.model, api_key=os.getenv("OPENAI_API_KEY"),
+                          base_url=args.openai_base_url)
+    try:
+        asyncio.run(serve(service, args.host, args.port, reuse_port=args.workers > 1 or args.worker,
+                          threads=args.threads))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for child in children:
+            child.terminate()
+        for child in children:
+            child.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
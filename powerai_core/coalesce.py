@@ -0,0 +1,336 @@
+# coalesce.py
+# In-flight request coalescing for chat model calls.
+#
+# When several sessions send the exact same request at the same moment (new
+# sessions all start from the same [SYSTEM NOTE] and say "hi"), only the first
+# one goes upstream; the others wait for it and get a copy of its result:
+#
+#   _generate / _agenerate -> followers receive a copy of the leader's ChatResult
+#   _stream / _astream     -> followers replay the leader's chunks from the start
+#                             and then follow along as new chunks arrive
+#
+# "Identical" means same model class and params (model, temperature, base url,
+# API key hash, stop, call kwargs) and the same normalized message list, so a
+# follower gets exactly what it would have asked for. Only requests that overlap
+# in time are merged; finished requests are the response cache's job.
+#
+# CoalescingModelMixin goes in front of the model class (and in front of the
+# scheduler, so only the leader takes a permit). POWERAI_COALESCE=off disables it.
+
+import asyncio
+import concurrent.futures
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from powerai_core.llm_cache import cache_key
+
+
+def coalescing_enabled() -> bool:
+    return os.getenv("POWERAI_COALESCE", "on").strip().lower() not in ("off", "0", "false", "no")
+
+
+class _Abandoned(Exception):
+    """The leader went away before finishing (e.g. its task was cancelled)."""
+
+
+class Flight:
+    """One upstream call in progress and everything its followers need."""
+
+    def __init__(self, key: str, kind: str):
+        self.key = key
+        self.kind = kind                    # "generate" | "stream"
+        self.followers = 0
+        self.future: concurrent.futures.Future = concurrent.futures.Future()  # generate result
+        self.chunks: List[Any] = []         # stream chunks so far
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._cond = threading.Condition()
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+
+    # ---- leader side (stream) ----
+    def push(self, chunk) -> None:
+        with self._cond:
+            self.chunks.append(chunk)
+            self._cond.notify_all()
+            self._wake_async()
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+            self._wake_async()
+
+    def _wake_async(self) -> None:
+        waiters, self._async_waiters = self._async_waiters, []
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass  # that loop is closed; its waiter is gone too
+
+    # ---- follower side (stream) ----
+    def replay(self):
+        i = 0
+        while True:
+            with self._cond:
+                while i >= len(self.chunks) and not self.done:
+                    self._cond.wait()
+                if i < len(self.chunks):
+                    chunk = self.chunks[i]
+                    i += 1
+                elif self.error is not None:
+                    raise self.error
+                else:
+                    return
+            yield _copy_chunk(chunk)
+
+    async def areplay(self):
+        loop = asyncio.get_running_loop()
+        i = 0
+        while True:
+            with self._cond:
+                if i < len(self.chunks):
+                    chunk = self.chunks[i]
+                    i += 1
+                elif self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                else:
+                    event = asyncio.Event()
+                    self._async_waiters.append((loop, event))
+                    chunk = None
+            if chunk is None:
+                await event.wait()
+                continue
+            yield _copy_chunk(chunk)
+
+
+def _copy_chunk(chunk):
+    # BaseChatModel.stream() stamps a run id on each chunk's message; give every
+    # caller its own message object
+    return chunk.copy(update={"message": chunk.message.copy()})
+
+
+class Coalescer:
+    """Registry of in-flight calls by request key, with counters."""
+
+    def __init__(self):
+        self._flights: Dict[Tuple[str, str], Flight] = {}
+        self._lock = threading.Lock()
+        self.issued = 0          # calls that went upstream
+        self.coalesced = 0       # calls served by someone else's upstream call
+        self.max_fanout = 0      # most callers served by one upstream call
+
+    def join(self, kind: str, key: str) -> Tuple[Flight, bool]:
+        """(flight, is_leader): the leader makes the call, followers wait on the flight."""
+        with self._lock:
+            flight = self._flights.get((kind, key))
+            if flight is not None:
+                flight.followers += 1
+                self.coalesced += 1
+                self.max_fanout = max(self.max_fanout, flight.followers + 1)
+                return flight, False
+            flight = self._flights[(kind, key)] = Flight(key, kind)
+            self.issued += 1
+            return flight, True
+
+    def land(self, flight: Flight) -> None:
+        """Stop accepting followers for this flight (its result is on its way)."""
+        with self._lock:
+            if self._flights.get((flight.kind, flight.key)) is flight:
+                del self._flights[(flight.kind, flight.key)]
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
+
+    def stats(self) -> dict:
+        calls = self.issued + self.coalesced
+        return {"issued": self.issued, "coalesced": self.coalesced, "in_flight": self.in_flight(),
+                "max_fanout": self.max_fanout,
+                "coalesced_ratio": self.coalesced / calls if calls else 0.0}
+
+    def format_stats(self) -> str:
+        s = self.stats()
+        return (f"Coalescing: {s['issued']} calls issued, {s['coalesced']} coalesced "
+                f"({s['coalesced_ratio']:.0%}), max fan-out {s['max_fanout']}")
+
+
+_coalescer = Coalescer()
+
+
+def get_coalescer() -> Coalescer:
+    return _coalescer
+
+
+# ---------------------------
+# Chat model integration
+# ---------------------------
+def _secret_fingerprint(llm) -> str:
+    from powerai_core.resources import key_fingerprint
+
+    secret = getattr(llm, "openai_api_key", None)
+    if secret is not None and hasattr(secret, "get_secret_value"):
+        secret = secret.get_secret_value()
+    return key_fingerprint(secret)
+
+
+def request_key(llm, messages, stop=None, **kwargs) -> str:
+    """Same model + params + messages -> same key (the API key is in as a hash)."""
+    return cache_key(type(llm).__name__, None, messages, llm=llm._get_llm_string(stop=stop, **kwargs),
+                     key=_secret_fingerprint(llm))
+
+
+class CoalescingModelMixin:
+    """Merges identical concurrent _generate/_stream calls (sync and async) into one."""
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if not coalescing_enabled():
+            return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        coalescer = get_coalescer()
+        key = request_key(self, messages, stop, **kwargs)
+        while True:
+            flight, leader = coalescer.join("generate", key)
+            if leader:
+                try:
+                    result = super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+                except Exception as e:
+                    flight.future.set_exception(e)
+                    raise
+                except BaseException:
+                    flight.future.set_exception(_Abandoned())
+                    raise
+                else:
+                    flight.future.set_result(result)
+                    return result
+                finally:
+                    coalescer.land(flight)
+            try:
+                return flight.future.result().copy(deep=True)
+            except _Abandoned:
+                continue  # the leader was interrupted: try again, possibly as leader
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if not coalescing_enabled():
+            return await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        coalescer = get_coalescer()
+        key = request_key(self, messages, stop, **kwargs)
+        while True:
+            flight, leader = coalescer.join("generate", key)
+            if leader:
+                try:
+                    result = await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+                except Exception as e:
+                    flight.future.set_exception(e)
+                    raise
+                except BaseException:  # cancelled
+                    flight.future.set_exception(_Abandoned())
+                    raise
+                else:
+                    flight.future.set_result(result)
+                    return result
+                finally:
+                    coalescer.land(flight)
+            try:
+                result = await asyncio.shield(asyncio.wrap_future(flight.future))
+                return result.copy(deep=True)
+            except _Abandoned:
+                continue
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        if not coalescing_enabled():
+            yield from super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+            return
+        coalescer = get_coalescer()
+        flight, leader = coalescer.join("stream", request_key(self, messages, stop, **kwargs))
+        if not leader:
+            yield from flight.replay()
+            return
+        upstream = super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+        finished = False
+        try:
+            for chunk in upstream:
+                flight.push(chunk)
+                yield chunk
+            finished = True
+            flight.finish()
+        except Exception as e:
+            finished = True
+            flight.finish(e)
+            raise
+        finally:
+            coalescer.land(flight)
+            if not finished:
+                if flight.followers:
+                    # our caller stopped reading (e.g. a Streamlit rerun); finish the
+                    # stream in the background for whoever is replaying it
+                    threading.Thread(target=_drain, args=(upstream, flight), daemon=True,
+                                     name="powerai-coalesce-drain").start()
+                else:
+                    flight.finish(_Abandoned())
+                    upstream.close()
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        if not coalescing_enabled():
+            async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                yield chunk
+            return
+        coalescer = get_coalescer()
+        flight, leader = coalescer.join("stream", request_key(self, messages, stop, **kwargs))
+        if not leader:
+            async for chunk in flight.areplay():
+                yield chunk
+            return
+        upstream = super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs)
+        finished = False
+        try:
+            async for chunk in upstream:
+                flight.push(chunk)
+                yield chunk
+            finished = True
+            flight.finish()
+        except Exception as e:
+            finished = True
+            flight.finish(e)
+            raise
+        finally:
+            coalescer.land(flight)
+            if not finished:
+                if flight.followers:
+                    asyncio.ensure_future(_adrain(upstream, flight))
+                else:
+                    flight.finish(_Abandoned())
+
+
+def _drain(upstream, flight: Flight) -> None:
+    try:
+        for chunk in upstream:
+            flight.push(chunk)
+        flight.finish()
+    except Exception as e:
+        flight.finish(e)
+
+
+async def _adrain(upstream, flight: Flight) -> None:
+    try:
+        async for chunk in upstream:
+            flight.push(chunk)
+        flight.finish()
+    except Exception as e:
+        flight.finish(e)
+
+
+_classes: Dict[type, type] = {}
+_classes_lock = threading.Lock()
+
+
+def coalescing_class(base: type) -> type:
+    """`base` chat model class with CoalescingModelMixin in front (built once per base)."""
+    with _classes_lock:
+        cls = _classes.get(base)
+        if cls is None:
+            cls = _classes[base] = type(f"Coalescing{base.__name__}", (CoalescingModelMixin, base), {})
+        return cls
@@ -0,0 +1,109 @@
+# fake_llm.py
+# A local, offline chat model that streams word by word with configurable latency.
+#
+# Use it anywhere a ChatOpenAI would go (ConversationChain, LLMChain, .stream())
+# to exercise streaming, batching and benchmarks without an API key:
+#
+#     llm = FakeStreamingChatModel(first_token_latency=0.3, token_latency=0.02)
+
+import asyncio
+import re
+import time
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+_TOKEN_RE = re.compile(r"\S+\s*|\s+")
+
+
+def split_tokens(text: str) -> List[str]:
+    """Word-ish pieces, whitespace kept so "".join(pieces) == text."""
+    return _TOKEN_RE.findall(text)
+
+
+def echo_responder(messages: List[BaseMessage]) -> str:
+    last = messages[-1].content if messages else ""
+    return f"(offline) You said: {str(last)[-140:]}"
+
+
+class FakeStreamingChatModel(BaseChatModel):
+    """
+    responses:           fixed replies to cycle through (takes precedence), or
+    responder:           fn(messages) -> reply text (default: echo the last message)
+    first_token_latency: seconds before the first chunk (network + prefill)
+    token_latency:       seconds between chunks
+    """
+
+    responses: Optional[List[str]] = None
+    responder: Callable[[List[BaseMessage]], str] = echo_responder
+    first_token_latency: float = 0.0
+    token_latency: float = 0.0
+    model_name: str = "fake-streaming"
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-streaming-chat-model"
+
+    @property
+    def _identifying_params(self):
+        return {"model_name": self.model_name}
+
+    # ---- reply selection ----
+    def _reply(self, messages: List[BaseMessage]) -> str:
+        i = self.calls
+        self.calls += 1
+        if self.responses:
+            return self.responses[i % len(self.responses)]
+        return self.responder(messages)
+
+    @staticmethod
+    def _usage(messages: List[BaseMessage], reply: str):
+        prompt_tokens = sum(len(split_tokens(str(m.content))) for m in messages)
+        completion_tokens = len(split_tokens(reply))
+        return {
+            "input_tokens": prompt_tokens,
+            "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    def _result(self, messages, reply) -> ChatResult:
+        msg = AIMessage(content=reply, usage_metadata=self._usage(messages, reply))
+        return ChatResult(generations=[ChatGeneration(message=msg)],
+                          llm_output={"token_usage": msg.usage_metadata})
+
+    # ---- sync ----
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        reply = self._reply(messages)
+        time.sleep(self.first_token_latency + self.token_latency * len(split_tokens(reply)))
+        return self._result(messages, reply)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        reply = self._reply(messages)
+        time.sleep(self.first_token_latency)
+        for i, piece in enumerate(split_tokens(reply)):
+            if i and self.token_latency:
+                time.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            if run_manager:
+                run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+
+    # ---- async ----
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        reply = self._reply(messages)
+        await asyncio.sleep(self.first_token_latency + self.token_latency * len(split_tokens(reply)))
+        return self._result(messages, reply)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        reply = self._reply(messages)
+        await asyncio.sleep(self.first_token_latency)
+        for i, piece in enumerate(split_tokens(reply)):
+            if i and self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            if run_manager:
+                await run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
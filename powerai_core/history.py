@@ -0,0 +1,385 @@
+# history.py
+# SQLite chat history with windowed, keyset-paginated reads.
+#
+# SQLChatMessageHistory.messages loads the whole session on every call. For
+# long-lived sessions that is thousands of rows per Streamlit rerun. This
+# backend keeps the same table layout (id, session_id, message JSON) but adds a
+# composite (session_id, id, tokens) index and reads only the slice a caller asks for:
+#
+#   history.last_messages(20)             -> newest 20 messages, oldest first
+#   history.messages_before(msg_id, 20)   -> the 20 messages before msg_id
+#   history.messages_within(1500)         -> newest messages that fit 1500 tokens
+#   history.messages                      -> last `window` messages (for memory)
+#
+# skip_notes=True drops the seeded "[SYSTEM NOTE]" rows in the query itself,
+# so transcript pages come back full without a Python-side filter.
+#
+# ids never go backwards: SQLite hands out max(id) + 1, so deleting the newest
+# rows would let new messages reuse their ids. Deletes that remove the top id
+# leave a one-row marker (ID_FLOOR_SESSION) at it instead.
+#
+# Each row also stores, computed once at write time:
+#
+#   role     message type ("human", "ai", ...), "note" for "[SYSTEM NOTE]" rows
+#   tokens   estimated prompt tokens (content ~4 chars/token + 4 per message)
+#   payload  the message JSON, zlib-compressed against a dictionary of the
+#            LangChain boilerplate (message is then NULL; a message too short
+#            to shrink stays in `message`)
+#
+# so "the newest messages that fit N tokens" is one SUM() OVER window query
+# (history.last_records_within(n), or max_tokens= for .messages) and nothing
+# is decoded to filter notes. Rows from before these columns keep their JSON in
+# `message` and read the same way (maintenance.py rewrites them in the
+# background); row_json() is the one decoder every raw reader goes through.
+# POWERAI_HISTORY_COMPRESS=off keeps new JSON in `message` (role and tokens are
+# still written): ~10 us less per row read, ~4x more disk.
+
+import json
+import math
+import os
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import Column, Integer, LargeBinary, Text, and_, delete, exists, func, inspect, or_, select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import declarative_base
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+from langchain_community.chat_message_histories import SQLChatMessageHistory
+from langchain_community.chat_message_histories.sql import BaseMessageConverter
+
+from powerai_core.telemetry import span
+
+
+SYSTEM_NOTE_PREFIX = "[SYSTEM NOTE]"
+# message column is json.dumps(message_to_dict(m)): {"type": ..., "data": {"content": ...}}
+SYSTEM_NOTE_PATTERN = f'%"content": "{SYSTEM_NOTE_PREFIX}%'
+
+
+ID_FLOOR_SESSION = "__powerai_id_floor__"
+
+
+def session_index_name(table_name: str) -> str:
+    return f"ix_{table_name}_session_id_id"
+
+
+def session_index_ddl(table_name: str, session_column: str = "session_id") -> str:
+    # tokens in the index: the running token sum never touches the table rows
+    # (files from before the column keep a (session, id) index until maintenance.py rebuilds it)
+    return (f"CREATE INDEX IF NOT EXISTS {session_index_name(table_name)} "
+            f"ON {table_name} ({session_column}, id, tokens)")
+
+
+def keep_id_floor(conn, table_name: str, top_id: Optional[int]) -> None:
+    """After a delete in `conn`'s transaction: if MAX(id) dropped below top_id, pin it with a marker row."""
+    if not top_id:
+        return
+    if (conn.execute(text(f"SELECT MAX(id) FROM {table_name}")).scalar() or 0) >= top_id:
+        return
+    conn.execute(text(f"DELETE FROM {table_name} WHERE session_id = :s"), {"s": ID_FLOOR_SESSION})
+    conn.execute(text(f"INSERT INTO {table_name} (id, session_id, message) VALUES (:i, :s, :m)"),
+                 {"i": top_id, "s": ID_FLOOR_SESSION, "m": '{"type": "ai", "data": {"content": ""}}'})
+
+
+# ---------------------------
+# Compact rows
+# ---------------------------
+NOTE_ROLE = "note"
+PAYLOAD_ZLIB = 1  # first payload byte: format version
+COMPACT_COLUMNS = (("role", "TEXT"), ("tokens", "INTEGER"), ("payload", "BLOB"))
+COMPRESS = os.getenv("POWERAI_HISTORY_COMPRESS", "on").strip().lower() not in ("0", "off", "false", "no")
+# rows older than the token column: estimate from the JSON length minus its ~160 bytes of
+# boilerplate (a rowid lookup, evaluated only for those rows)
+LEGACY_TOKENS = "(SELECT max(length(legacy.message) - 160, 0) / 4 + 4 FROM {t} AS legacy WHERE legacy.id = {t}.id)"
+
+# zlib preset dictionary: what every message_to_dict() JSON repeats (most common last)
+_ZDICT = (
+    '"logprobs": null, "system_fingerprint": "fp_", "model_name": "gpt-4o-mini-2024-07-18", '
+    '"finish_reason": "stop", "token_usage": {"completion_tokens": , "prompt_tokens": , '
+    '"total_tokens": , "completion_tokens_details": null, "prompt_tokens_details": null}, '
+    '"usage_metadata": {"input_tokens": , "output_tokens": , "total_tokens": }, "id": "run-'
+    '", "example": false, "tool_calls": [], "invalid_tool_calls": [], "usage_metadata": null}} '
+    '"[SYSTEM NOTE]\\n", "additional_kwargs": {}, "response_metadata": {}, "type": "human", '
+    '"name": null, "id": null, "example": false}} '
+    '{"type": "human", "data": {"content": "'
+    '", "additional_kwargs": {}, "response_metadata": {}, "type": "ai", "name": null, "id": null, '
+    '{"type": "ai", "data": {"content": "'
+).encode("utf-8")
+
+
+def message_tokens(content: Any) -> int:
+    """Prompt tokens of one message, as budget_memory's default counter estimates them."""
+    body = str(content)
+    return (max(1, math.ceil(len(body) / 4)) if body else 0) + 4
+
+
+def compact_row(raw: str, data: Optional[dict] = None) -> Dict[str, Any]:
+    """message JSON -> column values {message, role, tokens, payload} (data = json.loads(raw) if at hand)."""
+    if data is None:
+        data = json.loads(raw)
+    content = data.get("data", {}).get("content", "")
+    role = data.get("type", "ai")
+    if isinstance(content, str) and content.startswith(SYSTEM_NOTE_PREFIX):
+        role = NOTE_ROLE
+    plain = {"message": raw, "role": role, "tokens": message_tokens(content), "payload": None}
+    if not COMPRESS:
+        return plain
+    encoded = raw.encode("utf-8")
+    z = zlib.compressobj(6, zlib.DEFLATED, -15, zdict=_ZDICT)
+    payload = bytes((PAYLOAD_ZLIB,)) + z.compress(encoded) + z.flush()
+    if len(payload) >= len(encoded):  # tiny message: compression would only add bytes
+        return plain
+    return dict(plain, message=None, payload=payload)
+
+
+def row_json(message: Optional[str], payload: Optional[bytes]) -> str:
+    """The stored message JSON, from whichever column holds it."""
+    if payload is None:
+        return message
+    if payload[0] != PAYLOAD_ZLIB:
+        raise ValueError(f"unknown history payload format {payload[0]}")
+    z = zlib.decompressobj(-15, zdict=_ZDICT)
+    return (z.decompress(memoryview(payload)[1:]) + z.flush()).decode("utf-8")
+
+
+def ensure_compact_columns(conn, table_name: str) -> None:
+    """ALTER an existing table to add role / tokens / payload (no-op when present)."""
+    have = {c["name"] for c in inspect(conn).get_columns(table_name)}
+    for name, kind in COMPACT_COLUMNS:
+        if name not in have:
+            try:
+                conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {name} {kind}"))
+            except OperationalError as e:  # another process added it first
+                if "duplicate column" not in str(e):
+                    raise
+
+
+def create_compact_model(table_name: str, DynamicBase: Any) -> Any:
+    class Message(DynamicBase):  # type: ignore[valid-type, misc]
+        __tablename__ = table_name
+        id = Column(Integer, primary_key=True)
+        session_id = Column(Text)
+        message = Column(Text)
+        role = Column(Text)
+        tokens = Column(Integer)
+        payload = Column(LargeBinary)
+
+    return Message
+
+
+class CompactMessageConverter(BaseMessageConverter):
+    """SQLChatMessageHistory converter that writes role / tokens / compressed payload."""
+
+    def __init__(self, table_name: str):
+        self.model_class = create_compact_model(table_name, declarative_base())
+
+    def from_sql_model(self, sql_message: Any) -> BaseMessage:
+        return messages_from_dict([json.loads(row_json(sql_message.message, sql_message.payload))])[0]
+
+    def to_sql_model(self, message: BaseMessage, session_id: str) -> Any:
+        data = message_to_dict(message)
+        return self.model_class(session_id=session_id, **compact_row(json.dumps(data), data))
+
+    def get_sql_model_class(self) -> Any:
+        return self.model_class
+
+
+def records_to_messages(records) -> List[BaseMessage]:
+    """(id, message_json) rows -> LangChain messages."""
+    if not records:
+        return []
+    return messages_from_dict([json.loads(m) for _, m in records])
+
+
+class WindowedSQLHistory(SQLChatMessageHistory):
+    """
+    Drop-in SQLChatMessageHistory that never reads a whole session by accident.
+
+    window:     how many messages `.messages` returns (None = all, like the parent).
+    max_tokens: also cap `.messages` to the newest rows whose stored token
+                counts fit this budget (always at least the newest one).
+    keep_first: also return the session's first message when it falls outside
+                the window, so a seeded "[SYSTEM NOTE]" keeps steering the model.
+    """
+
+    def __init__(self, session_id, connection=None, table_name="message_store",
+                 window: Optional[int] = None, keep_first: bool = False,
+                 max_tokens: Optional[int] = None, **kwargs):
+        kwargs.setdefault("custom_message_converter", CompactMessageConverter(table_name))
+        super().__init__(session_id=session_id, connection=connection,
+                         table_name=table_name, **kwargs)
+        self.table_name = table_name
+        self.window = window
+        self.max_tokens = max_tokens
+        self.keep_first = keep_first
+        self._within_cache: Dict[Tuple[bool, bool], Any] = {}
+        self._ensure_schema()
+        self._restore_archived()
+
+    # ---- schema ----
+    def _ensure_schema(self):
+        with self.engine.begin() as conn:
+            ensure_compact_columns(conn, self.table_name)
+            conn.execute(text(session_index_ddl(self.table_name, self.session_id_field_name)))
+
+    def _restore_archived(self):
+        # maintenance.py moves idle sessions to an archive file; bring this one back
+        from powerai_core.maintenance import restore_if_archived
+
+        restore_if_archived(self.engine, self.table_name, self.session_id)
+
+    # ---- keyset reads ----
+    def _session_filter(self):
+        return getattr(self.sql_model_class, self.session_id_field_name) == self.session_id
+
+    def _notes_filter(self):
+        model = self.sql_model_class
+        return or_(model.role != NOTE_ROLE,
+                   and_(model.role.is_(None), model.message.notlike(SYSTEM_NOTE_PATTERN)))
+
+    def _select_rows(self):
+        model = self.sql_model_class
+        return select(model.id, model.message, model.payload)
+
+    def _fetch(self, stmt) -> List[Tuple[int, str]]:
+        with self.engine.connect() as conn:
+            return [(r[0], row_json(r[1], r[2])) for r in conn.execute(stmt)]
+
+    def last_records(self, n: int, before_id: Optional[int] = None,
+                     skip_notes: bool = False) -> List[Tuple[int, str]]:
+        """
+        Raw (id, message_json) rows, oldest first. Walks the (session_id, id)
+        index backwards, so the cost is O(n) no matter how long the session is.
+        """
+        model = self.sql_model_class
+        stmt = self._select_rows().where(self._session_filter())
+        if before_id is not None:
+            stmt = stmt.where(model.id < before_id)
+        if skip_notes:
+            stmt = stmt.where(self._notes_filter())
+        stmt = stmt.order_by(model.id.desc()).limit(n)
+        with span("history.read"):
+            rows = self._fetch(stmt)
+        rows.reverse()
+        return rows
+
+    def last_ids(self, n: int, before_id: Optional[int] = None,
+                 skip_notes: bool = False) -> List[Tuple[int, Optional[int]]]:
+        """(id, tokens) of the rows last_records() would return: index + two columns, no decode."""
+        model = self.sql_model_class
+        stmt = select(model.id, model.tokens).where(self._session_filter())
+        if before_id is not None:
+            stmt = stmt.where(model.id < before_id)
+        if skip_notes:
+            stmt = stmt.where(self._notes_filter())
+        stmt = stmt.order_by(model.id.desc()).limit(n)
+        with span("history.read", ids_only=True), self.engine.connect() as conn:
+            rows = [(r[0], r[1]) for r in conn.execute(stmt)]
+        rows.reverse()
+        return rows
+
+    def _within_sql(self, before: bool, skip_notes: bool):
+        key = (before, skip_notes)
+        stmt = self._within_cache.get(key)
+        if stmt is None:
+            t, s = self.table_name, self.session_id_field_name
+            where = (" AND id < :before" if before else "") + (
+                f" AND (role != '{NOTE_ROLE}' OR (role IS NULL AND message NOT LIKE :notes))" if skip_notes else "")
+            stmt = self._within_cache[key] = text(
+                f"SELECT id, message, payload FROM {t} WHERE {s} = :s AND id IN ("
+                " SELECT id FROM ("
+                "  SELECT id, tokens, SUM(tokens) OVER (ORDER BY id DESC ROWS UNBOUNDED PRECEDING) AS running"
+                f"  FROM (SELECT id, COALESCE(tokens, {LEGACY_TOKENS.format(t=t)}) AS tokens FROM {t}"
+                f"        WHERE {s} = :s{where} ORDER BY id DESC LIMIT :n))"
+                " WHERE running <= :budget OR running = tokens) ORDER BY id")
+        return stmt
+
+    def last_records_within(self, max_tokens: int, before_id: Optional[int] = None,
+                            skip_notes: bool = False, max_rows: int = 1000) -> List[Tuple[int, str]]:
+        """
+        The newest rows whose stored token counts add up to <= max_tokens
+        (always at least the newest row), oldest first. One query: a running
+        SUM(tokens) newest-first over the last max_rows index entries, then
+        only the rows that fit are read from the table.
+        """
+        stmt = self._within_sql(before_id is not None, skip_notes)
+        params = {"s": self.session_id, "before": before_id, "notes": SYSTEM_NOTE_PATTERN,
+                  "n": max_rows, "budget": max_tokens}
+        with span("history.read", max_tokens=max_tokens), self.engine.connect() as conn:
+            return [(r[0], row_json(r[1], r[2])) for r in conn.execute(stmt, params)]
+
+    def records_after(self, after_id: int, limit: int = 500) -> List[Tuple[int, str]]:
+        """Rows newer than after_id, oldest first (for incremental consumers)."""
+        model = self.sql_model_class
+        return self._fetch(self._select_rows()
+                           .where(self._session_filter(), model.id > after_id)
+                           .order_by(model.id.asc()).limit(limit))
+
+    def records_by_ids(self, ids) -> List[Tuple[int, str]]:
+        ids = list(ids)
+        if not ids:
+            return []
+        model = self.sql_model_class
+        return self._fetch(self._select_rows()
+                           .where(self._session_filter(), model.id.in_(ids))
+                           .order_by(model.id.asc()))
+
+    def first_record(self) -> Optional[Tuple[int, str]]:
+        model = self.sql_model_class
+        rows = self._fetch(self._select_rows().where(self._session_filter())
+                           .order_by(model.id.asc()).limit(1))
+        return rows[0] if rows else None
+
+    def last_messages(self, n: int) -> List[BaseMessage]:
+        return self._to_messages(self.last_records(n))
+
+    def messages_before(self, before_id: int, n: int) -> List[BaseMessage]:
+        return self._to_messages(self.last_records(n, before_id=before_id))
+
+    def messages_within(self, max_tokens: int) -> List[BaseMessage]:
+        return self._to_messages(self.last_records_within(max_tokens))
+
+    def has_messages(self) -> bool:
+        """Cheap EXISTS check (used instead of `if not history.messages`)."""
+        stmt = select(exists().where(self._session_filter()))
+        with self.engine.connect() as conn:
+            return bool(conn.execute(stmt).scalar())
+
+    _to_messages = staticmethod(records_to_messages)
+
+    # ---- writes ----
+    def add_message(self, message: BaseMessage) -> None:
+        with span("history.write"):
+            super().add_message(message)
+
+    def clear(self) -> None:
+        """Delete this session's rows (indexed), keeping the id floor."""
+        model = self.sql_model_class
+        with self.engine.begin() as conn:
+            top = conn.execute(select(func.max(model.id))).scalar()
+            conn.execute(delete(model).where(self._session_filter()))
+            keep_id_floor(conn, self.table_name, top)
+
+    def add_messages(self, messages) -> None:
+        with span("history.write"):
+            super().add_messages(messages)
+
+    # ---- memory-facing view ----
+    def records(self) -> List[Tuple[int, str]]:
+        """The (id, message_json) rows behind `.messages`, oldest first."""
+        if self.max_tokens is not None:
+            records = self.last_records_within(self.max_tokens, max_rows=self.window or 1000)
+        elif self.window is None:
+            model = self.sql_model_class
+            return self._fetch(self._select_rows().where(self._session_filter()).order_by(model.id.asc()))
+        else:
+            records = self.last_records(self.window)
+        if self.keep_first and records:
+            first = self.first_record()
+            if first and first[0] < records[0][0]:
+                records.insert(0, first)
+        return records
+
+    @property
+    def messages(self) -> List[BaseMessage]:  # type: ignore[override]
+        with span("history.messages"):
+            return self._to_messages(self.records())
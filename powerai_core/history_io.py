@@ -0,0 +1,472 @@
+# history_io.py
+# Streaming bulk export / import of the SQLite chat stores.
+#
+# SQLChatMessageHistory.messages loads a whole session into memory; this moves
+# whole tables instead, at constant memory:
+#
+#   export   one cursor per worker walks the (session_id, id) index over its
+#            slice of sessions and streams rows out CHUNK at a time, so every
+#            session comes out contiguous and in id order. --workers N splits
+#            the sessions into N slices and writes N part files in parallel.
+#   import   reads the files back and inserts them in large transactions
+#            (BATCH rows each) through one writer: SQLite has one writer anyway.
+#
+#   python -m powerai_core.history_io export --db powerai_memory.db --out chats.jsonl.gz --workers 4
+#   python -m powerai_core.history_io export --db chat_memory.db --table chat_history \
+#       --session user1 --since 2024-06-01 --out user1.parquet
+#   python -m powerai_core.history_io import --db new.db chats.part*.jsonl.gz
+#
+# Formats (by extension): .jsonl, .jsonl.gz, .parquet (needs pyarrow). A row is
+# {"session_id": ..., "id": ..., "message": <the stored message JSON>}; export
+# writes the JSON as stored (decompressed, never re-encoded) and import
+# computes each row's role / tokens / compressed payload (history.compact_row).
+#
+# The tables have no timestamp column: --since/--until go through the id
+# watermarks maintenance.py records, so their resolution is the maintenance
+# interval (POWERAI_MAINTENANCE_INTERVAL). --include-archived also exports
+# sessions maintenance.py moved to its archive files.
+#
+# An import that fails midway keeps the batches it already committed (rows
+# commit in file order) and says how many: rerun it with --skip <that number>
+# to carry on where it stopped.
+
+import argparse
+import gzip
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+
+# Shared helpers live in ../powerai_core
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from powerai_core.history import ID_FLOOR_SESSION, compact_row, row_json
+
+CHUNK = 5_000       # rows per cursor fetch / parquet row group
+BATCH = 50_000      # rows per import transaction
+IN_LIMIT = 500      # explicit sessions per IN (...) query
+
+Row = Tuple[str, int, str]  # (session_id, id, message json)
+
+
+class HistoryIOError(RuntimeError):
+    """Export / import cannot run (missing pyarrow, no watermarks, ...)."""
+
+
+class PartialImportError(HistoryIOError):
+    """An import failed after `committed` rows were committed; resume with skip=committed."""
+
+    def __init__(self, message: str, committed: int):
+        resume = (f"{committed} rows were committed, rerun with --skip {committed} to import the rest"
+                  if committed else "nothing was committed")
+        super().__init__(f"{message}; {resume}")
+        self.committed = committed
+
+
+# ---------------------------
+# Row encoding
+# ---------------------------
+_decoder = json.JSONDecoder()
+_SID_KEY = '{"session_id": '
+_ID_KEY = ', "id": '
+_MSG_KEY = ', "message": '
+
+
+def encode_line(session_id: str, msg_id: int, message: str, quoted: Optional[str] = None) -> str:
+    # message is already JSON: splice it in instead of a loads/dumps round trip
+    return f'{_SID_KEY}{quoted or json.dumps(session_id)}{_ID_KEY}{msg_id}{_MSG_KEY}{message}}}\n'
+
+
+def decode_line(line: str) -> Row:
+    """Inverse of encode_line; falls back to a full parse for lines written by other tools."""
+    if line.startswith(_SID_KEY):
+        try:
+            session_id, pos = _decoder.raw_decode(line, len(_SID_KEY))
+            if line.startswith(_ID_KEY, pos):
+                id_end = line.index(",", pos + len(_ID_KEY))
+                msg_id = int(line[pos + len(_ID_KEY):id_end])
+                if line.startswith(_MSG_KEY, id_end):
+                    message = line[id_end + len(_MSG_KEY):].rstrip()
+                    if message.endswith("}}"):
+                        return session_id, msg_id, message[:-1]
+        except ValueError:
+            pass
+    rec = json.loads(line)
+    message = rec["message"]
+    return rec["session_id"], int(rec["id"]), message if isinstance(message, str) else json.dumps(message)
+
+
+def file_format(path: str) -> str:
+    name = path.lower()
+    for ext in (".jsonl.gz", ".jsonl", ".parquet"):
+        if name.endswith(ext):
+            return ext
+    raise ValueError(f"{path}: expected .jsonl, .jsonl.gz or .parquet")
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise HistoryIOError("Parquet needs pyarrow: pip install pyarrow") from None
+    return pyarrow, pyarrow.parquet
+
+
+def part_path(out: str, index: int, parts: int) -> str:
+    if parts == 1:
+        return out
+    ext = file_format(out)
+    return f"{out[:-len(ext)]}.part{index:02d}{ext}"
+
+
+class RowWriter:
+    """Appends row chunks to one .jsonl / .jsonl.gz / .parquet file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.format = file_format(path)
+        self.rows = 0
+        self._parquet = None
+        if self.format == ".parquet":
+            pa, pq = _pyarrow()
+            self._pa = pa
+            schema = pa.schema([("session_id", pa.string()), ("id", pa.int64()), ("message", pa.string())])
+            self._parquet = pq.ParquetWriter(path, schema, compression="zstd")
+        elif self.format == ".jsonl.gz":
+            self._file = gzip.open(path, "wt", encoding="utf-8", compresslevel=3)
+        else:
+            self._file = open(path, "w", encoding="utf-8")
+
+    def write(self, rows: Sequence[Row]) -> None:
+        if not rows:
+            return
+        if self._parquet is not None:
+            sids, ids, messages = zip(*rows)
+            self._parquet.write_table(self._pa.table(
+                {"session_id": list(sids), "id": list(ids), "message": list(messages)},
+                schema=self._parquet.schema))
+        else:
+            quoted = {s: json.dumps(s) for s in {r[0] for r in rows}}  # sessions come in runs
+            self._file.write("".join([encode_line(s, i, m, quoted[s]) for s, i, m in rows]))
+        self.rows += len(rows)
+
+    def close(self) -> None:
+        if self._parquet is not None:
+            self._parquet.close()
+        else:
+            self._file.close()
+
+
+def read_rows(path: str, chunk: int = CHUNK) -> Iterator[List[Row]]:
+    """Chunks of (session_id, id, message) from one exported file."""
+    fmt = file_format(path)
+    if fmt == ".parquet":
+        _, pq = _pyarrow()
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk,
+                                                         columns=["session_id", "id", "message"]):
+            cols = batch.to_pydict()
+            yield list(zip(cols["session_id"], cols["id"], cols["message"]))
+        return
+    opener = gzip.open if fmt == ".jsonl.gz" else open
+    rows: List[Row] = []
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                rows.append(decode_line(line))
+                if len(rows) >= chunk:
+                    yield rows
+                    rows = []
+    if rows:
+        yield rows
+
+
+# ---------------------------
+# Export
+# ---------------------------
+def parse_time(value: Optional[str]) -> Optional[float]:
+    """Epoch seconds, or an ISO date / datetime (local time)."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def id_range(engine, table: str, since: Optional[float], until: Optional[float]) -> Tuple[int, Optional[int]]:
+    """(after_id, upto_id) for a time range, from maintenance.py's watermarks."""
+    if since is None and until is None:
+        return 0, None
+    from powerai_core.maintenance import Maintainer
+
+    m = Maintainer(engine, table)
+    with engine.connect() as conn:
+        has_marks = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='powerai_watermarks'")).first()
+    if not has_marks:
+        raise HistoryIOError("--since/--until need the id watermarks maintenance.py records "
+                             "(run python -m powerai_core.maintenance once, then wait an interval)")
+    # rows after the last watermark at/before `since` (may include a few slightly older ones)
+    after = m.id_before(since) if since is not None else 0
+    upto = m.id_before(until) if until is not None else None
+    return after, upto
+
+
+def table_columns(engine, table: str) -> List[str]:
+    """Column names of `table` ([] when it does not exist)."""
+    with engine.connect() as conn:
+        return [r[1] for r in conn.exec_driver_sql(f"PRAGMA table_info({table})")]
+
+
+def archived_sessions(engine, table: str) -> List[Tuple[str, str]]:
+    """(session_id, archive file) for sessions maintenance.py has archived."""
+    with engine.connect() as conn:
+        if not conn.execute(text("SELECT 1 FROM sqlite_master WHERE type='table' "
+                                 "AND name='powerai_sessions'")).first():
+            return []
+        return [tuple(r) for r in conn.execute(text(
+            "SELECT session_id, archive_path FROM powerai_sessions WHERE table_name=:t "
+            "AND archive_path IS NOT NULL ORDER BY session_id"), {"t": table})]
+
+
+def plan_slices(engine, table: str, sessions: Optional[List[str]], workers: int) -> List[dict]:
+    """Split the sessions into `workers` contiguous slices of the (session_id, id) index."""
+    if sessions:
+        names = sorted(set(sessions) - {ID_FLOOR_SESSION})
+    else:
+        with engine.connect() as conn:
+            names = [r[0] for r in conn.execute(text(
+                f"SELECT DISTINCT session_id FROM {table} WHERE session_id != :f ORDER BY session_id"),
+                {"f": ID_FLOOR_SESSION})]
+    if not names:
+        return []
+    workers = max(1, min(workers, len(names)))
+    step = -(-len(names) // workers)
+    slices = []
+    for i in range(0, len(names), step):
+        part = names[i:i + step]
+        slices.append({"explicit": part if sessions else None, "lo": part[0], "hi": part[-1]})
+    return slices
+
+
+def _slice_queries(table: str, piece: dict, after: int, upto: Optional[int],
+                   legacy: bool = False) -> Iterator[Tuple[str, dict]]:
+    # legacy: a table from before the compact columns (export does not ALTER the source)
+    cols = "session_id, id, message, " + ("NULL AS payload" if legacy else "payload")
+    where = "id > :after" + (" AND id <= :upto" if upto is not None else "")
+    params = {"after": after, "upto": upto}
+    order = "ORDER BY session_id, id"
+    if piece["explicit"] is None:
+        yield (f"SELECT {cols} FROM {table} WHERE session_id >= :lo AND session_id <= :hi "
+               f"AND session_id != :f AND {where} {order}",
+               dict(params, lo=piece["lo"], hi=piece["hi"], f=ID_FLOOR_SESSION))
+        return
+    names = piece["explicit"]
+    for i in range(0, len(names), IN_LIMIT):
+        group = names[i:i + IN_LIMIT]
+        marks = ", ".join(f":s{j}" for j in range(len(group)))
+        yield (f"SELECT {cols} FROM {table} WHERE session_id IN ({marks}) AND {where} {order}",
+               dict(params, **{f"s{j}": s for j, s in enumerate(group)}))
+
+
+def export_slice(db_path: str, table: str, piece: dict, path: str, after: int = 0,
+                 upto: Optional[int] = None, archives: Sequence[Tuple[str, str]] = (),
+                 legacy: bool = False) -> int:
+    """Stream one slice of sessions (plus their archive files) into `path`; returns rows written."""
+    from powerai_core.resources import get_engine
+
+    engine = get_engine(db_path)
+    writer = RowWriter(path)
+    try:
+        with engine.connect() as conn:
+            raw = conn.connection.dbapi_connection  # plain sqlite3 cursor: rows arrive as tuples
+            for sql, params in _slice_queries(table, piece, after, upto, legacy):
+                cursor = raw.execute(sql, params)
+                try:
+                    while True:
+                        rows = cursor.fetchmany(CHUNK)
+                        if not rows:
+                            break
+                        writer.write([(s, i, row_json(m, p)) for s, i, m, p in rows])
+                finally:
+                    cursor.close()
+        for session_id, archive in archives:
+            if not os.path.exists(archive):
+                continue
+            rows = []
+            with gzip.open(archive, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    rec = json.loads(line)
+                    if rec["id"] > after and (upto is None or rec["id"] <= upto):
+                        rows.append((session_id, rec["id"], rec["message"]))
+                    if len(rows) >= CHUNK:
+                        writer.write(rows)
+                        rows = []
+            writer.write(rows)
+    finally:
+        writer.close()
+    return writer.rows
+
+
+def export_history(db_path: str, out: str, table: str = "message_store", sessions: Optional[List[str]] = None,
+                   since: Optional[float] = None, until: Optional[float] = None, workers: int = 1,
+                   include_archived: bool = False) -> List[Tuple[str, int]]:
+    """Export a table to `out` (or N part files); returns [(path, rows), ...]."""
+    from powerai_core.resources import get_engine
+
+    file_format(out)
+    engine = get_engine(db_path)
+    columns = table_columns(engine, table)
+    if not columns:
+        raise HistoryIOError(f"{db_path} has no table {table}")
+    legacy = "payload" not in columns
+    after, upto = id_range(engine, table, since, until)
+    slices = plan_slices(engine, table, sessions, workers)
+    archives = archived_sessions(engine, table) if include_archived else []
+    if sessions:
+        wanted = set(sessions)
+        archives = [a for a in archives if a[0] in wanted]
+    if not slices:
+        slices = [{"explicit": [], "lo": "", "hi": ""}]
+    # archived sessions go with the slice whose range covers them (the last one otherwise)
+    per_slice = [[] for _ in slices]
+    for session_id, archive in archives:
+        index = next((i for i, p in enumerate(slices) if session_id <= p["hi"]), len(slices) - 1)
+        per_slice[index].append((session_id, archive))
+    paths = [part_path(out, i, len(slices)) for i in range(len(slices))]
+    jobs = [(db_path, table, piece, path, after, upto, per_slice[i], legacy)
+            for i, (piece, path) in enumerate(zip(slices, paths))]
+    if len(jobs) == 1:
+        counts = [export_slice(*jobs[0])]
+    else:
+        # spawn, not fork: a forked child would share the parent's pooled SQLite connections
+        with ProcessPoolExecutor(max_workers=len(jobs), mp_context=multiprocessing.get_context("spawn")) as pool:
+            counts = list(pool.map(export_slice, *zip(*jobs)))
+    return list(zip(paths, counts))
+
+
+# ---------------------------
+# Import
+# ---------------------------
+def import_history(db_path: str, paths: Sequence[str], table: str = "message_store",
+                   sessions: Optional[List[str]] = None, keep_ids: bool = False,
+                   batch: int = BATCH, skip: int = 0) -> int:
+    """
+    Insert exported rows into `table`, `batch` rows per transaction.
+    keep_ids=False appends (new ids, order within each session kept);
+    keep_ids=True reuses the exported ids, for migrating into an empty table.
+    skip: leave out the first `skip` selected rows (resuming a failed import).
+    Raises PartialImportError carrying the number of rows already committed.
+    """
+    from sqlalchemy.exc import IntegrityError
+
+    from powerai_core.history import WindowedSQLHistory
+    from powerai_core.resources import get_engine
+
+    engine = get_engine(db_path)
+    WindowedSQLHistory(ID_FLOOR_SESSION, connection=engine, table_name=table)  # table + session index
+    wanted = set(sessions) if sessions else None
+    columns = "session_id, message, role, tokens, payload"
+
+    def values(m):
+        row = compact_row(m)
+        return row["message"], row["role"], row["tokens"], row["payload"]
+
+    if keep_ids:
+        sql = f"INSERT INTO {table} (id, {columns}) VALUES (?, ?, ?, ?, ?, ?)"
+        shape = lambda s, i, m: (i, s, *values(m))
+    else:
+        sql = f"INSERT INTO {table} ({columns}) VALUES (?, ?, ?, ?, ?)"
+        shape = lambda s, i, m: (s, *values(m))
+    pending: list = []
+    total = 0
+    to_skip = skip
+
+    def flush():
+        nonlocal pending, total
+        if pending:
+            with engine.begin() as conn:
+                conn.exec_driver_sql(sql, pending)
+            total += len(pending)
+            pending = []
+
+    path = None
+    try:
+        for path in paths:
+            for rows in read_rows(path):
+                selected = [r for r in rows if r[0] != ID_FLOOR_SESSION and (wanted is None or r[0] in wanted)]
+                if to_skip:
+                    dropped = min(to_skip, len(selected))
+                    selected, to_skip = selected[dropped:], to_skip - dropped
+                pending.extend(shape(s, i, m) for s, i, m in selected)
+                if len(pending) >= batch:
+                    flush()
+        flush()
+    except IntegrityError as e:
+        raise PartialImportError(f"id clash while importing {path} with --keep-ids ({e.orig}); "
+                                 "import without it to append", skip + total) from e
+    except Exception as e:
+        raise PartialImportError(f"import stopped in {path}: {type(e).__name__}: {e}", skip + total) from e
+    return total
+
+
+# ---------------------------
+# CLI
+# ---------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Stream PowerAI chat histories to/from JSONL or Parquet")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    exp = sub.add_parser("export", help="table -> .jsonl / .jsonl.gz / .parquet")
+    exp.add_argument("--db", default="powerai_memory.db")
+    exp.add_argument("--table", default="message_store")
+    exp.add_argument("--out", required=True, help="with --workers N: <name>.partNN.<ext>")
+    exp.add_argument("--session", action="append", help="only this session (repeatable)")
+    exp.add_argument("--since", help="ISO date/datetime or epoch seconds")
+    exp.add_argument("--until", help="ISO date/datetime or epoch seconds")
+    exp.add_argument("--workers", type=int, default=1, help="parallel slices of sessions")
+    exp.add_argument("--include-archived", action="store_true", help="also sessions in maintenance archives")
+
+    imp = sub.add_parser("import", help=".jsonl / .jsonl.gz / .parquet files -> table")
+    imp.add_argument("paths", nargs="+")
+    imp.add_argument("--db", default="powerai_memory.db")
+    imp.add_argument("--table", default="message_store")
+    imp.add_argument("--session", action="append", help="only this session (repeatable)")
+    imp.add_argument("--keep-ids", action="store_true", help="reuse exported ids (empty target table)")
+    imp.add_argument("--batch", type=int, default=BATCH, help="rows per transaction")
+    imp.add_argument("--skip", type=int, default=0, help="skip the rows a failed import already committed")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    try:
+        if args.command == "export":
+            if not os.path.exists(args.db):
+                raise HistoryIOError(f"{args.db} does not exist")
+            results = export_history(args.db, args.out, args.table, args.session, parse_time(args.since),
+                                     parse_time(args.until), args.workers, args.include_archived)
+            rows = sum(n for _, n in results)
+            for path, n in results:
+                print(f"{path}: {n} rows, {os.path.getsize(path) / 1e6:.1f} MB")
+        else:
+            rows = import_history(args.db, args.paths, args.table, args.session, args.keep_ids, args.batch,
+                                  args.skip)
+            print(f"{args.db}:{args.table}: imported {rows} rows")
+    except (HistoryIOError, ValueError) as e:
+        sys.exit(f"{args.command} failed: {e}")
+    seconds = time.perf_counter() - started
+    print(f"{rows} rows in {seconds:.1f}s ({rows / max(seconds, 1e-9):,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+# llm_cache.py
+# Persistent response cache shared by every chain and script.
+#
+# Key:   sha256 of (model + call params incl. temperature, normalized messages)
+# Tier 1: in-process LRU (instant)
+# Tier 2: SQLite file with TTL and size-based eviction (survives restarts)
+#
+# Policy: deterministic calls (temperature 0) are cached by default; the fixed
+# prompt scripts (Day1, day8, day9) opt in with cache=True. POWERAI_CACHE=all
+# caches every call, POWERAI_CACHE=off disables the cache everywhere, and
+# POWERAI_CACHE_PATH moves the file.
+#
+# LangChain models plug in through LangChainResponseCache (ChatOpenAI(cache=...));
+# raw OpenAI/REST calls use ResponseCache.get()/put() with the same keys.
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Iterable, List, Optional
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CACHE_PATH = os.path.join(BASE_DIR, ".powerai_cache", "llm_responses.db")
+
+
+# ---------------------------
+# Keys
+# ---------------------------
+def _role_of(message) -> str:
+    if isinstance(message, dict):
+        return str(message.get("role") or message.get("type") or "")
+    return str(getattr(message, "type", getattr(message, "role", "")))
+
+
+def _content_of(message) -> str:
+    content = message.get("content", "") if isinstance(message, dict) else getattr(message, "content", "")
+    if not isinstance(content, str):
+        content = json.dumps(content, sort_keys=True)
+    return content.replace("\r\n", "\n").strip()
+
+
+_ROLE_ALIASES = {"human": "user", "ai": "assistant"}
+
+
+def normalize_messages(messages: Iterable[Any]) -> List[List[str]]:
+    """[[role, content], ...] with unified role names and trimmed content."""
+    out = []
+    for m in messages:
+        role = _role_of(m)
+        out.append([_ROLE_ALIASES.get(role, role), _content_of(m)])
+    return out
+
+
+def cache_key(model: str, temperature: Optional[float], messages: Iterable[Any], **params: Any) -> str:
+    payload = {
+        "model": model,
+        "temperature": None if temperature is None else float(temperature),
+        "messages": normalize_messages(messages),
+        "params": params,
+    }
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# ---------------------------
+# Two-tier store
+# ---------------------------
+class ResponseCache:
+    """
+    memory_items: size of the in-process LRU tier
+    ttl:          seconds an entry stays valid (None = forever)
+    max_rows:     SQLite tier cap; least recently used rows go first
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, memory_items: int = 512,
+                 ttl: Optional[float] = 7 * 24 * 3600, max_rows: int = 50_000):
+        self.path = path
+        self.memory_items = memory_items
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self._lru: "OrderedDict[str, tuple]" = OrderedDict()   # key -> (value, created)
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_responses_accessed ON responses (accessed)")
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl is not None and now - created > self.ttl
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            hit = self._lru.get(key)
+            if hit is not None and not self._expired(hit[1], now):
+                self._lru.move_to_end(key)
+                self.memory_hits += 1
+                return hit[0]
+            row = self._conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or self._expired(row[1], now):
+                self._lru.pop(key, None)
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._remember(key, row[0], row[1])
+            self.disk_hits += 1
+            return row[0]
+
+    def put(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            self._remember(key, value, now)
+            self._puts += 1
+            if self._puts % 100 == 0:
+                self._evict(now)
+
+    def _remember(self, key, value, created):
+        self._lru[key] = (value, created)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.memory_items:
+            self._lru.popitem(last=False)
+
+    def _evict(self, now: float) -> None:
+        if self.ttl is not None:
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        over = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_rows
+        if over > 0:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY accessed ASC LIMIT ?)", (over,)
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._lru.clear()
+            self._conn.execute("DELETE FROM responses")
+
+    # ---- reporting ----
+    def stats(self) -> dict:
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+        }
+
+    def format_stats(self) -> str:
+        s = self.stats()
+        return (f"LLM cache: {s['memory_hits'] + s['disk_hits']} hits "
+                f"({s['memory_hits']} memory, {s['disk_hits']} disk), {s['misses']} misses, "
+                f"hit ratio {s['hit_ratio']:.0%}")
+
+
+# ---------------------------
+# LangChain adapter
+# ---------------------------
+class LangChainResponseCache(BaseCache):
+    """BaseCache on top of ResponseCache (pass as ChatOpenAI(cache=...))."""
+
+    def __init__(self, store: ResponseCache):
+        self.store = store
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        # prompt is the serialized message list; normalize it like raw calls
+        try:
+            messages = [m.get("kwargs", m) for m in json.loads(prompt)]
+        except (ValueError, TypeError, AttributeError):
+            messages = [{"role": "prompt", "content": prompt}]
+        return cache_key("langchain", None, messages, llm=llm_string)
+
+    def lookup(self, prompt: str, llm_string: str):
+        raw = self.store.get(self._key(prompt, llm_string))
+        if raw is None:
+            return None
+        try:
+            return [loads(g) for g in json.loads(raw)]
+        except Exception:
+            return None  # unreadable entry (library upgrade): treat as a miss
+
+    def update(self, prompt: str, llm_string: str, return_val) -> None:
+        self.store.put(self._key(prompt, llm_string), json.dumps([dumps(g) for g in return_val]))
+
+    def clear(self, **kwargs: Any) -> None:
+        self.store.clear()
+
+
+# ---------------------------
+# Shared instance + policy
+# ---------------------------
+_shared_store: Optional[ResponseCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    global _shared_store
+    with _shared_lock:
+        if _shared_store is None:
+            _shared_store = ResponseCache(os.getenv("POWERAI_CACHE_PATH", DEFAULT_CACHE_PATH))
+        return _shared_store
+
+
+def should_cache(temperature: Optional[float], cache: Optional[bool] = None) -> bool:
+    """
+    POWERAI_CACHE=off always wins (kill switch); otherwise cache=True/False from
+    the call site, then POWERAI_CACHE=all, then temperature == 0.
+    """
+    mode = os.getenv("POWERAI_CACHE", "auto").strip().lower()
+    if mode == "off":
+        return False
+    if cache is not None:
+        return cache
+    if mode == "all":
+        return True
+    return temperature is not None and float(temperature) == 0.0
+
+
+def langchain_cache_for(temperature: Optional[float], cache: Optional[bool] = None):
+    """Value for ChatOpenAI(cache=...): the shared cache, or False to skip caching."""
+    return LangChainResponseCache(get_response_cache()) if should_cache(temperature, cache) else False
+
+
+def cached_chat_completion(client, model: str, messages: list, temperature: Optional[float] = None,
+                           cache: Optional[bool] = None, **params: Any) -> str:
+    """openai.OpenAI().chat.completions.create(...) -> reply text, through the cache."""
+    store = get_response_cache() if should_cache(temperature, cache) else None
+    key = cache_key(model, temperature, messages, **params)
+    if store is not None:
+        hit = store.get(key)
+        if hit is not None:
+            return hit
+    kwargs = dict(params)
+    if temperature is not None:
+        kwargs["temperature"] = temperature
+    resp = client.chat.completions.create(model=model, messages=messages, **kwargs)
+    text = resp.choices[0].message.content
+    if store is not None and text is not None:
+        store.put(key, text)
+    return text
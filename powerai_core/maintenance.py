@@ -0,0 +1,663 @@
+# maintenance.py
+# Retention, compaction and archiving for the SQLite chat stores.
+#
+# message_store (PowerAI_MemoryChat, chat service) and chat_history (Day 11) are
+# append-only and grow forever. Maintainer.run_once() keeps them bounded:
+#
+#   1. watermark  record (now, max(id)). ids only grow, so every row with
+#                 id <= a watermark's max_id is older than that watermark:
+#                 row ages without a timestamp column on the hot table
+#   2. catalog    fold the rows added since the last run into powerai_sessions
+#                 (per session: last id, message count, archive state)
+#   3. retention  rows past max_messages, or older than max_age_days, are
+#                 replaced by ONE "[SUMMARY]" row that takes the id of the oldest
+#                 replaced row, so it sorts where they were; a session's pinned
+#                 first "[SYSTEM NOTE]" row is kept
+#   4. archive    sessions idle for archive_after_days move to
+#                 <archive_dir>/<table>/<session>-<hash>.jsonl.gz and leave the table;
+#                 opening the session's history again restores them
+#   5. compact    rows written before the role / tokens / payload columns
+#                 (history.py) are rewritten in rowid batches: compressed JSON,
+#                 precomputed token count; then an old (session_id, id) index
+#                 is rebuilt as (session_id, id, tokens)
+#   6. vacuum     PRAGMA incremental_vacuum in small steps, so freed pages go
+#                 back to the filesystem without one long exclusive lock
+#
+# Every step reads through the (session_id, id) index or the rowid and writes
+# one session per short transaction, so hot sessions stay fast as the table
+# grows. A lease row lets one process at a time do the work when several
+# (Streamlit, chat-service workers) share a file.
+#
+#   start_maintenance(engine)     # background thread, see the apps
+#   python -m powerai_core.maintenance --db powerai_memory.db --max-messages 500 --archive-after-days 30
+#   python -m powerai_core.maintenance --db chat_memory.db --table chat_history --restore user1
+#
+# Settings (env): POWERAI_RETENTION_MAX_MESSAGES, POWERAI_RETENTION_MAX_AGE_DAYS,
+# POWERAI_ARCHIVE_AFTER_DAYS, POWERAI_ARCHIVE_DIR, POWERAI_MAINTENANCE_INTERVAL,
+# POWERAI_MAINTENANCE=off. With none of the first three set nothing is deleted;
+# the thread only keeps the catalog and vacuums.
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import socket
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+# Shared helpers live in ../powerai_core
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from powerai_core.history import (ID_FLOOR_SESSION, SYSTEM_NOTE_PREFIX, compact_row, ensure_compact_columns,
+                                  keep_id_floor, row_json, session_index_ddl, session_index_name)
+from powerai_core.telemetry import span
+
+SUMMARY_PREFIX = "[SUMMARY]"
+DAY = 86400.0
+FOLD_CHUNK = 200_000     # rowid range per catalog transaction
+ARCHIVE_CHUNK = 5_000    # rows per archive read
+COMPACT_CHUNK = 2_000    # legacy rows rewritten per transaction
+_IDENT = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS powerai_watermarks ("
+    " table_name TEXT NOT NULL, ts REAL NOT NULL, max_id INTEGER NOT NULL,"
+    " PRIMARY KEY (table_name, ts))",
+    "CREATE TABLE IF NOT EXISTS powerai_sessions ("
+    " table_name TEXT NOT NULL, session_id TEXT NOT NULL,"
+    " last_id INTEGER NOT NULL DEFAULT 0, messages INTEGER NOT NULL DEFAULT 0,"
+    " compacted_through INTEGER NOT NULL DEFAULT 0,"
+    " archived_at REAL, archive_path TEXT,"
+    " PRIMARY KEY (table_name, session_id))",
+    "CREATE INDEX IF NOT EXISTS ix_powerai_sessions_cold"
+    " ON powerai_sessions (table_name, archived_at, last_id)",
+    "CREATE TABLE IF NOT EXISTS powerai_maintenance ("
+    " table_name TEXT PRIMARY KEY, folded_id INTEGER NOT NULL DEFAULT 0,"
+    " lease_owner TEXT, lease_until REAL NOT NULL DEFAULT 0, last_run REAL)",
+)
+
+
+class RetentionPolicy:
+    """
+    max_messages:       rows kept verbatim per session (None = no cap); compaction
+                        starts once a session is `slack` over it
+    max_age_days:       rows older than this are folded into the summary row
+    archive_after_days: sessions idle this long move to the archive
+    summary_chars:      length budget of the summary row
+    """
+
+    def __init__(self, max_messages: Optional[int] = None, max_age_days: Optional[float] = None,
+                 archive_after_days: Optional[float] = None, slack: float = 0.1,
+                 summary_chars: int = 1500):
+        self.max_messages = max_messages
+        self.max_age_days = max_age_days
+        self.archive_after_days = archive_after_days
+        self.slack = slack
+        self.summary_chars = summary_chars
+
+    @classmethod
+    def from_env(cls) -> "RetentionPolicy":
+        def num(name, cast):
+            value = os.getenv(name, "").strip()
+            return cast(value) if value else None
+
+        return cls(max_messages=num("POWERAI_RETENTION_MAX_MESSAGES", int),
+                   max_age_days=num("POWERAI_RETENTION_MAX_AGE_DAYS", float),
+                   archive_after_days=num("POWERAI_ARCHIVE_AFTER_DAYS", float))
+
+    def __repr__(self) -> str:
+        return (f"RetentionPolicy(max_messages={self.max_messages}, max_age_days={self.max_age_days}, "
+                f"archive_after_days={self.archive_after_days})")
+
+
+def _role_tag(message_type: str) -> str:
+    return {"human": "U", "ai": "A", "system": "S"}.get(message_type, message_type[:1].upper())
+
+
+def _content(raw: str) -> Tuple[str, str]:
+    data = json.loads(raw)
+    return data.get("type", "ai"), data.get("data", {}).get("content", "")
+
+
+def _decoded(rows) -> List[Tuple[int, str]]:
+    """(id, message, payload) rows -> (id, message json)."""
+    return [(r[0], row_json(r[1], r[2])) for r in rows]
+
+
+def _insert_sql(table: str, with_id: bool, verb: str = "INSERT") -> str:
+    cols = "session_id, message, role, tokens, payload"
+    if with_id:
+        return f"{verb} INTO {table} (id, {cols}) VALUES (:id, :s, :message, :role, :tokens, :payload)"
+    return f"{verb} INTO {table} ({cols}) VALUES (:s, :message, :role, :tokens, :payload)"
+
+
+def _summary_json(body: str) -> str:
+    from langchain_core.messages import AIMessage, message_to_dict
+
+    return json.dumps(message_to_dict(AIMessage(content=f"{SUMMARY_PREFIX}\n{body}")))
+
+
+def archive_file(archive_dir: str, table_name: str, session_id: str) -> str:
+    safe = re.sub(r"[^A-Za-z0-9_.-]", "_", session_id)[:60]
+    digest = hashlib.sha1(session_id.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(archive_dir, table_name, f"{safe}-{digest}.jsonl.gz")
+
+
+def default_archive_dir(engine) -> str:
+    return os.getenv("POWERAI_ARCHIVE_DIR") or f"{engine.url.database}.archive"
+
+
+class Maintainer:
+    """
+    Maintenance for one history table of one SQLite file.
+
+    summarize: (texts, max_chars) -> str, e.g. budget_memory.llm_summarizer(llm);
+               defaults to the offline extractive summary
+    """
+
+    def __init__(self, engine, table_name: str = "message_store", policy: Optional[RetentionPolicy] = None,
+                 archive_dir: Optional[str] = None, summarize: Optional[Callable[[List[str], int], str]] = None,
+                 vacuum_pages: int = 256, session_batch: int = 500):
+        if not _IDENT.match(table_name):
+            raise ValueError(f"bad table name: {table_name!r}")
+        from powerai_core.budget_memory import extractive_summarizer
+
+        self.engine = engine
+        self.table = table_name
+        self.policy = policy or RetentionPolicy()
+        self.archive_dir = archive_dir or default_archive_dir(engine)
+        self.summarize = summarize or extractive_summarizer
+        self.vacuum_pages = vacuum_pages
+        self.session_batch = session_batch
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{id(self):x}"
+        self.last_stats: Optional[dict] = None
+        self.last_error: Optional[BaseException] = None
+        self._legacy_after = 0  # rowid cursor of the legacy-row rewrite (new rows are never legacy)
+
+    # ---- schema / lease ----
+    def table_exists(self) -> bool:
+        with self.engine.connect() as conn:
+            return conn.execute(text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:n"),
+                                {"n": self.table}).first() is not None
+
+    def ensure_schema(self) -> None:
+        with self.engine.begin() as conn:
+            for ddl in SCHEMA:
+                conn.execute(text(ddl))
+            ensure_compact_columns(conn, self.table)
+            conn.execute(text(session_index_ddl(self.table)))
+            conn.execute(text("INSERT OR IGNORE INTO powerai_maintenance (table_name) VALUES (:t)"),
+                         {"t": self.table})
+
+    def acquire(self, ttl: float) -> bool:
+        now = time.time()
+        with self.engine.begin() as conn:
+            res = conn.execute(text(
+                "UPDATE powerai_maintenance SET lease_owner=:o, lease_until=:u "
+                "WHERE table_name=:t AND (lease_until < :now OR lease_owner = :o)"),
+                {"o": self.owner, "u": now + ttl, "t": self.table, "now": now})
+            return res.rowcount == 1
+
+    def release(self) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(text("UPDATE powerai_maintenance SET lease_until=0, last_run=:now "
+                              "WHERE table_name=:t AND lease_owner=:o"),
+                         {"t": self.table, "o": self.owner, "now": time.time()})
+
+    # ---- 1. watermarks ----
+    def watermark(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        with self.engine.begin() as conn:
+            max_id = conn.execute(text(f"SELECT COALESCE(MAX(id), 0) FROM {self.table}")).scalar()
+            conn.execute(text("INSERT OR REPLACE INTO powerai_watermarks VALUES (:t, :ts, :m)"),
+                         {"t": self.table, "ts": now, "m": max_id})
+        return max_id
+
+    def id_before(self, cutoff_ts: float) -> int:
+        """Every row with id <= this was written before cutoff_ts (0 = none known)."""
+        with self.engine.connect() as conn:
+            return conn.execute(text(
+                "SELECT COALESCE(MAX(max_id), 0) FROM powerai_watermarks WHERE table_name=:t AND ts <= :c"),
+                {"t": self.table, "c": cutoff_ts}).scalar()
+
+    # ---- 2. session catalog ----
+    def fold_catalog(self, upto_id: int) -> int:
+        """
+        Add rows (folded_id, upto_id] to powerai_sessions; returns rows folded.
+        An archived session that got new rows (written through a history
+        object opened before it was archived) is restored, not just unflagged.
+        """
+        with self.engine.connect() as conn:
+            lo = conn.execute(text("SELECT folded_id FROM powerai_maintenance WHERE table_name=:t"),
+                              {"t": self.table}).scalar() or 0
+        folded = 0
+        while lo < upto_id:
+            hi = min(lo + FOLD_CHUNK, upto_id)
+            with self.engine.begin() as conn:
+                rows = conn.execute(text(
+                    f"SELECT session_id, MAX(id), COUNT(*) FROM {self.table} "
+                    "WHERE id > :lo AND id <= :hi AND session_id != :floor GROUP BY session_id"),
+                    {"lo": lo, "hi": hi, "floor": ID_FLOOR_SESSION}).all()
+                if rows:
+                    conn.execute(text(
+                        "INSERT INTO powerai_sessions (table_name, session_id, last_id, messages) "
+                        "VALUES (:t, :s, :last, :n) ON CONFLICT (table_name, session_id) DO UPDATE SET "
+                        "last_id = MAX(last_id, excluded.last_id), messages = messages + excluded.messages"),
+                        [{"t": self.table, "s": s, "last": last, "n": n} for s, last, n in rows])
+                conn.execute(text("UPDATE powerai_maintenance SET folded_id=:hi WHERE table_name=:t"),
+                             {"hi": hi, "t": self.table})
+                revived = [r[0] for r in conn.execute(text(
+                    "SELECT session_id FROM powerai_sessions WHERE table_name=:t AND archive_path IS NOT NULL "
+                    f"AND session_id IN (SELECT session_id FROM {self.table} WHERE id > :lo AND id <= :hi)"),
+                    {"t": self.table, "lo": lo, "hi": hi})] if rows else []
+            for session_id in revived:
+                with span("maintenance.restore"):
+                    self.restore_session(session_id)
+            folded += sum(r[2] for r in rows)
+            lo = hi
+        return folded
+
+    # ---- 3. retention / compaction ----
+    def _candidates(self, age_cut: int) -> List[str]:
+        clauses, params = [], {"t": self.table, "n": self.session_batch}
+        if self.policy.max_messages:
+            clauses.append("messages > :cap")
+            # a compacted session holds note + summary + max_messages rows
+            params["cap"] = max(int(self.policy.max_messages * (1 + self.policy.slack)),
+                                self.policy.max_messages + 2)
+        if age_cut:
+            clauses.append("compacted_through < :cut")
+            params["cut"] = age_cut
+        if not clauses:
+            return []
+        with self.engine.connect() as conn:
+            return [r[0] for r in conn.execute(text(
+                "SELECT session_id FROM powerai_sessions WHERE table_name=:t AND archived_at IS NULL "
+                f"AND ({' OR '.join(clauses)}) LIMIT :n"), params)]
+
+    def _cold_sessions(self, cold_cut: int) -> List[str]:
+        with self.engine.connect() as conn:
+            return [r[0] for r in conn.execute(text(
+                "SELECT session_id FROM powerai_sessions WHERE table_name=:t AND archived_at IS NULL "
+                "AND last_id <= :c LIMIT :n"), {"t": self.table, "c": cold_cut, "n": self.session_batch})]
+
+    def compact_session(self, session_id: str, age_cut: int = 0) -> int:
+        """Fold this session's excess / old rows into its summary row; returns rows removed."""
+        t, keep = self.table, self.policy.max_messages
+        params = {"s": session_id}
+        with self.engine.begin() as conn:
+            first = _decoded(conn.execute(text(f"SELECT id, message, payload FROM {t} WHERE session_id=:s "
+                                               "ORDER BY id LIMIT 1"), params))
+            first = first[0] if first else None
+            if first is None:
+                conn.execute(text("UPDATE powerai_sessions SET messages=0 WHERE table_name=:t AND session_id=:s"),
+                             {"t": t, "s": session_id})
+                return 0
+            pinned = first[0] if _content(first[1])[1].startswith(SYSTEM_NOTE_PREFIX) else None
+            upper = 0  # fold rows with pinned < id < upper
+            if keep:
+                row = conn.execute(text(f"SELECT id FROM {t} WHERE session_id=:s ORDER BY id DESC "
+                                        "LIMIT 1 OFFSET :k"), {"s": session_id, "k": keep}).first()
+                upper = row[0] + 1 if row else 0
+            if age_cut:
+                upper = max(upper, age_cut + 1)
+            lo = pinned + 1 if pinned else 0
+            rows = _decoded(conn.execute(text(f"SELECT id, message, payload FROM {t} WHERE session_id=:s "
+                                              "AND id >= :lo AND id < :hi ORDER BY id"),
+                                         {"s": session_id, "lo": lo, "hi": upper})) if upper else []
+            removed, folded = 0, None
+            if len(rows) > 1 or (rows and not _content(rows[0][1])[1].startswith(SUMMARY_PREFIX)):
+                texts = []
+                for _, raw in rows:
+                    kind, content = _content(raw)
+                    if content.startswith(SUMMARY_PREFIX):
+                        texts.append(content[len(SUMMARY_PREFIX):].strip())
+                    else:
+                        texts.append(f"{_role_tag(kind)}: {content}")
+                summary = self.summarize(texts, self.policy.summary_chars)
+                top = conn.execute(text(f"SELECT MAX(id) FROM {t}")).scalar()
+                conn.execute(text(f"DELETE FROM {t} WHERE session_id=:s AND id >= :lo AND id <= :hi"),
+                             {"s": session_id, "lo": rows[0][0], "hi": rows[-1][0]})
+                conn.execute(text(_insert_sql(t, with_id=True)),
+                             {"id": rows[0][0], "s": session_id, **compact_row(_summary_json(summary))})
+                keep_id_floor(conn, t, top)
+                removed, folded = len(rows) - 1, (rows[0][0], rows[-1][0])
+            count = conn.execute(text(f"SELECT COUNT(*) FROM {t} WHERE session_id=:s"), params).scalar()
+            conn.execute(text(
+                "UPDATE powerai_sessions SET messages=:n, compacted_through=MAX(compacted_through, :c) "
+                "WHERE table_name=:t AND session_id=:s"),
+                {"n": count, "c": age_cut, "t": t, "s": session_id})
+        if folded:
+            # the first folded id now holds the summary: cached transcript bubbles are stale
+            from powerai_core.transcript import forget_blocks
+
+            forget_blocks(self.engine, t, session_id, *folded)
+        return removed
+
+    # ---- 4. archive ----
+    def archive_session(self, session_id: str, cold_cut: int) -> int:
+        """Move an idle session's rows to its archive file; returns rows moved (0 = not cold after all)."""
+        t = self.table
+        with self.engine.connect() as conn:
+            last = conn.execute(text(f"SELECT MAX(id) FROM {t} WHERE session_id=:s"), {"s": session_id}).scalar()
+        if last is None or last > cold_cut:  # catalog was stale (reset, or written since)
+            with self.engine.begin() as conn:
+                if last is None:
+                    conn.execute(text("DELETE FROM powerai_sessions WHERE table_name=:t AND session_id=:s"),
+                                 {"t": t, "s": session_id})
+                else:
+                    conn.execute(text("UPDATE powerai_sessions SET last_id=:l WHERE table_name=:t "
+                                      "AND session_id=:s"), {"l": last, "t": t, "s": session_id})
+            return 0
+        path = archive_file(self.archive_dir, t, session_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        moved, after = 0, 0
+        # append a gzip member: earlier archives of this session stay readable
+        with open(path, "ab") as raw_file:
+            with gzip.GzipFile(fileobj=raw_file, mode="ab") as out:
+                while True:
+                    with self.engine.connect() as conn:
+                        rows = _decoded(conn.execute(text(
+                            f"SELECT id, message, payload FROM {t} WHERE session_id=:s AND id > :a AND id <= :l "
+                            "ORDER BY id LIMIT :n"),
+                            {"s": session_id, "a": after, "l": last, "n": ARCHIVE_CHUNK}))
+                    if not rows:
+                        break
+                    out.write("".join(json.dumps({"id": i, "message": m}) + "\n" for i, m in rows).encode("utf-8"))
+                    moved += len(rows)
+                    after = rows[-1][0]
+            raw_file.flush()
+            os.fsync(raw_file.fileno())  # on disk before the rows leave the table
+        with self.engine.begin() as conn:
+            top = conn.execute(text(f"SELECT MAX(id) FROM {t}")).scalar()
+            conn.execute(text(f"DELETE FROM {t} WHERE session_id=:s AND id <= :l"), {"s": session_id, "l": last})
+            keep_id_floor(conn, t, top)
+            conn.execute(text("UPDATE powerai_sessions SET archived_at=:now, archive_path=:p, messages=0 "
+                              "WHERE table_name=:t AND session_id=:s"),
+                         {"now": time.time(), "p": path, "t": t, "s": session_id})
+        return moved
+
+    def restore_session(self, session_id: str) -> int:
+        """Bring an archived session back into the table (original ids where free)."""
+        path = archive_file(self.archive_dir, self.table, session_id)
+        with self.engine.connect() as conn:
+            row = conn.execute(text("SELECT archive_path FROM powerai_sessions WHERE table_name=:t "
+                                    "AND session_id=:s"), {"t": self.table, "s": session_id}).first()
+        if row and row[0]:
+            path = row[0]
+        if not os.path.exists(path):
+            with self.engine.begin() as conn:
+                conn.execute(text("UPDATE powerai_sessions SET archived_at=NULL, archive_path=NULL "
+                                  "WHERE table_name=:t AND session_id=:s"), {"t": self.table, "s": session_id})
+            return 0
+        records: Dict[int, str] = {}
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    rec = json.loads(line)
+                    records[rec["id"]] = rec["message"]
+        t = self.table
+        with self.engine.begin() as conn:
+            clashes = []
+            for msg_id in sorted(records):
+                res = conn.execute(text(_insert_sql(t, with_id=True, verb="INSERT OR IGNORE")),
+                                   {"id": msg_id, "s": session_id, **compact_row(records[msg_id])})
+                if res.rowcount == 0:
+                    clashes.append(msg_id)
+            for msg_id in clashes:  # id reused meanwhile: append (order among themselves kept)
+                conn.execute(text(_insert_sql(t, with_id=False)),
+                             {"s": session_id, **compact_row(records[msg_id])})
+            count = conn.execute(text(f"SELECT COUNT(*) FROM {t} WHERE session_id=:s"),
+                                 {"s": session_id}).scalar()
+            last = conn.execute(text(f"SELECT MAX(id) FROM {t} WHERE session_id=:s"), {"s": session_id}).scalar()
+            conn.execute(text("UPDATE powerai_sessions SET archived_at=NULL, archive_path=NULL, messages=:n, "
+                              "last_id=:l WHERE table_name=:t AND session_id=:s"),
+                         {"n": count, "l": last or 0, "t": t, "s": session_id})
+        os.remove(path)
+        return len(records)
+
+    # ---- 5. compact legacy rows ----
+    def compact_legacy(self, upto_id: int, deadline: float) -> int:
+        """Rewrite rows up to upto_id that predate the tokens / payload columns; returns rows rewritten."""
+        t, done = self.table, 0
+        while time.perf_counter() < deadline:
+            with self.engine.begin() as conn:
+                rows = conn.execute(text(
+                    f"SELECT id, message FROM {t} WHERE id > :a AND id <= :b AND tokens IS NULL "
+                    "AND message IS NOT NULL AND session_id != :floor ORDER BY id LIMIT :n"),
+                    {"a": self._legacy_after, "b": upto_id, "floor": ID_FLOOR_SESSION, "n": COMPACT_CHUNK}).all()
+                if rows:
+                    conn.execute(text(f"UPDATE {t} SET message=:message, role=:role, tokens=:tokens, "
+                                      "payload=:payload WHERE id=:id AND tokens IS NULL"),
+                                 [{"id": i, **compact_row(raw)} for i, raw in rows])
+            done += len(rows)
+            if len(rows) < COMPACT_CHUNK:
+                # caught up: rows written from now on already carry the columns
+                self.upgrade_session_index()
+                self._legacy_after = upto_id
+                break
+            self._legacy_after = rows[-1][0]
+        return done
+
+    def upgrade_session_index(self) -> bool:
+        """Rebuild a (session_id, id) index from before the tokens column as (session_id, id, tokens)."""
+        name = session_index_name(self.table)
+        with self.engine.connect() as conn:
+            columns = [r[2] for r in conn.exec_driver_sql(f"PRAGMA index_info({name})")]
+        if "tokens" in columns:
+            return False
+        with span("maintenance.reindex"), self.engine.begin() as conn:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+            conn.execute(text(session_index_ddl(self.table)))
+        return True
+
+    # ---- 6. vacuum ----
+    def vacuum(self, convert: bool = False, max_steps: int = 200) -> int:
+        """Incremental vacuum in steps of vacuum_pages; returns pages released."""
+        with self.engine.connect() as conn:
+            mode = conn.exec_driver_sql("PRAGMA auto_vacuum").scalar()
+        if mode != 2:
+            if not convert:
+                return 0
+            # one full VACUUM switches an existing file to incremental mode
+            with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+                conn.exec_driver_sql("VACUUM")
+            return 0
+        released = 0
+        raw = self.engine.raw_connection()
+        try:
+            db = raw.driver_connection
+            for _ in range(max_steps):
+                free = db.execute("PRAGMA freelist_count").fetchone()[0]
+                if not free:
+                    break
+                # executescript steps the pragma to the end; execute() frees a single page
+                db.executescript(f"PRAGMA incremental_vacuum({self.vacuum_pages});")
+                released += min(free, self.vacuum_pages)
+                time.sleep(0.01)  # let queued writers in between steps
+        finally:
+            raw.close()
+        return released
+
+    # ---- one pass ----
+    def run_once(self, now: Optional[float] = None, lease_ttl: float = 600.0,
+                 time_budget: float = 120.0) -> Optional[dict]:
+        """
+        One maintenance pass; None when the table is missing or another process
+        holds the lease. Sessions are handled session_batch at a time until none
+        are left or time_budget seconds have passed (the next pass continues).
+        """
+        if not self.table_exists():
+            return None
+        self.ensure_schema()
+        if not self.acquire(lease_ttl):
+            return None
+        now = time.time() if now is None else now
+        started = time.perf_counter()
+        stats = {"table": self.table, "compacted": 0, "summarized_rows": 0, "archived": 0,
+                 "archived_rows": 0, "rewritten_rows": 0}
+        try:
+            with span("maintenance.run"):
+                stats["max_id"] = self.watermark(now)
+                stats["folded"] = self.fold_catalog(stats["max_id"])
+                deadline = started + time_budget
+                # archive first: no point summarizing a session that is about to move out
+                cold_cut = 0
+                if self.policy.archive_after_days:
+                    cold_cut = self.id_before(now - self.policy.archive_after_days * DAY)
+                while cold_cut and time.perf_counter() < deadline:
+                    batch = self._cold_sessions(cold_cut)
+                    for sid in batch:
+                        moved = self.archive_session(sid, cold_cut)
+                        stats["archived"] += 1 if moved else 0
+                        stats["archived_rows"] += moved
+                    if len(batch) < self.session_batch:
+                        break
+                age_cut = self.id_before(now - self.policy.max_age_days * DAY) if self.policy.max_age_days else 0
+                while time.perf_counter() < deadline:
+                    batch = self._candidates(age_cut)
+                    for sid in batch:
+                        removed = self.compact_session(sid, age_cut)
+                        stats["compacted"] += 1 if removed else 0
+                        stats["summarized_rows"] += removed
+                    if len(batch) < self.session_batch:
+                        break
+                stats["rewritten_rows"] = self.compact_legacy(stats["max_id"], deadline)
+                stats["vacuumed_pages"] = self.vacuum()
+        finally:
+            self.release()
+        stats["seconds"] = round(time.perf_counter() - started, 3)
+        self.last_stats = stats
+        return stats
+
+    def stats(self) -> dict:
+        with self.engine.connect() as conn:
+            sessions, archived, messages = conn.execute(text(
+                "SELECT COUNT(*), COUNT(archived_at), COALESCE(SUM(messages), 0) FROM powerai_sessions "
+                "WHERE table_name=:t"), {"t": self.table}).first()
+            pages = conn.exec_driver_sql("PRAGMA page_count").scalar()
+            free = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+            page_size = conn.exec_driver_sql("PRAGMA page_size").scalar()
+        return {"sessions": sessions, "archived_sessions": archived, "messages": messages,
+                "file_mb": round(pages * page_size / 1e6, 1), "free_mb": round(free * page_size / 1e6, 1)}
+
+
+# ---------------------------
+# Restore on open
+# ---------------------------
+def restore_if_archived(engine, table_name: str, session_id: str) -> int:
+    """Called when a session's history is opened: unarchive it first (cheap PK lookup)."""
+    if engine.dialect.name != "sqlite":
+        return 0
+    with engine.connect() as conn:
+        if conn.execute(text("SELECT 1 FROM sqlite_master WHERE type='table' AND name='powerai_sessions'")).first() is None:
+            return 0
+        # archive_path, not archived_at: the file is what still holds the rows
+        row = conn.execute(text("SELECT archive_path FROM powerai_sessions WHERE table_name=:t AND session_id=:s"),
+                           {"t": table_name, "s": session_id}).first()
+    if not row or row[0] is None:
+        return 0
+    with span("maintenance.restore"):
+        return Maintainer(engine, table_name).restore_session(session_id)
+
+
+# ---------------------------
+# Background thread
+# ---------------------------
+_RUNNERS: Dict[tuple, Maintainer] = {}
+_RUNNERS_LOCK = threading.Lock()
+
+
+def maintenance_enabled() -> bool:
+    return os.getenv("POWERAI_MAINTENANCE", "on").strip().lower() not in ("off", "0", "false")
+
+
+def start_maintenance(engine, table_name: str = "message_store", policy: Optional[RetentionPolicy] = None,
+                      interval: Optional[float] = None, first_delay: float = 5.0) -> Optional[Maintainer]:
+    """One daemon thread per (file, table) per process; safe to call on every rerun."""
+    if not maintenance_enabled() or engine.dialect.name != "sqlite":
+        return None
+    key = (str(engine.url), table_name)
+    with _RUNNERS_LOCK:
+        if key in _RUNNERS:
+            return _RUNNERS[key]
+        maintainer = _RUNNERS[key] = Maintainer(engine, table_name, policy or RetentionPolicy.from_env())
+    interval = interval or float(os.getenv("POWERAI_MAINTENANCE_INTERVAL", 600))
+
+    def loop():
+        time.sleep(first_delay)
+        while True:
+            try:
+                maintainer.run_once(lease_ttl=interval)
+                maintainer.last_error = None
+            except Exception as e:  # a busy database or full disk: try again next round
+                maintainer.last_error = e
+            time.sleep(interval)
+
+    threading.Thread(target=loop, name="powerai-maintenance", daemon=True).start()
+    return maintainer
+
+
+# ---------------------------
+# CLI
+# ---------------------------
+def main():
+    parser = argparse.ArgumentParser(description="PowerAI chat store retention / archive / vacuum")
+    parser.add_argument("--db", default="powerai_memory.db")
+    parser.add_argument("--table", default="message_store")
+    parser.add_argument("--max-messages", type=int, help="rows kept verbatim per session")
+    parser.add_argument("--max-age-days", type=float, help="fold rows older than this into the summary")
+    parser.add_argument("--archive-after-days", type=float, help="archive sessions idle this long")
+    parser.add_argument("--archive-dir", help="default: <db>.archive/ or POWERAI_ARCHIVE_DIR")
+    parser.add_argument("--llm-summaries", action="store_true", help="summarize with gpt-4o-mini")
+    parser.add_argument("--convert-vacuum", action="store_true",
+                        help="one full VACUUM to switch an old file to incremental auto_vacuum")
+    parser.add_argument("--restore", metavar="SESSION_ID", help="unarchive one session and exit")
+    parser.add_argument("--stats", action="store_true", help="print catalog / file stats and exit")
+    args = parser.parse_args()
+
+    from powerai_core.resources import get_engine
+
+    env = RetentionPolicy.from_env()
+    policy = RetentionPolicy(
+        max_messages=args.max_messages if args.max_messages is not None else env.max_messages,
+        max_age_days=args.max_age_days if args.max_age_days is not None else env.max_age_days,
+        archive_after_days=args.archive_after_days if args.archive_after_days is not None else env.archive_after_days,
+    )
+    summarize = None
+    if args.llm_summaries:
+        from dotenv import load_dotenv
+        from powerai_core.budget_memory import llm_summarizer
+        from powerai_core.resources import get_llm
+
+        load_dotenv()
+        summarize = llm_summarizer(get_llm("gpt-4o-mini", temperature=0.2, api_key=os.getenv("OPENAI_API_KEY"),
+                                           priority="batch"))
+    engine = get_engine(args.db)
+    m = Maintainer(engine, args.table, policy, archive_dir=args.archive_dir, summarize=summarize)
+    if not m.table_exists():
+        sys.exit(f"{args.db} has no table {args.table}")
+    m.ensure_schema()
+    if args.restore:
+        print(f"restored {m.restore_session(args.restore)} rows for {args.restore}")
+    elif args.stats:
+        print(json.dumps(m.stats(), indent=2))
+    else:
+        if args.convert_vacuum:
+            m.vacuum(convert=True)
+        stats = m.run_once()
+        print(json.dumps(stats if stats else {"skipped": "another process holds the maintenance lease"}, indent=2))
+        print(json.dumps(m.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
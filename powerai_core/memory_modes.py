@@ -0,0 +1,58 @@
+# memory_modes.py
+# One place that turns a "memory mode" setting into a LangChain memory object,
+# so the CLI bots and the Streamlit apps offer the same choices.
+#
+#   buffer -> ConversationBufferMemory (full transcript, the original behaviour)
+#   budget -> TokenBudgetMemory (recent turns verbatim + tiered summaries, capped tokens)
+#   retrieval -> RetrievalMemory (top-k similar past messages + recent window;
+#                needs a WindowedSQLHistory, the vector index lives beside the DB)
+#
+# CLI scripts read the mode from the environment, limited to the modes they can
+# run (retrieval needs a SQL history; day10 keeps its history in memory):
+#   POWERAI_MEMORY=budget POWERAI_TOKEN_BUDGET=1200 python day10_memory_bot/day10_memory_bot.py
+#   POWERAI_SUMMARIZER=llm   -> summarize older turns with the chat model (default: offline)
+
+import os
+import sys
+
+MEMORY_MODES = ("buffer", "budget", "retrieval")
+IN_MEMORY_MODES = ("buffer", "budget")  # no WindowedSQLHistory to retrieve from
+DEFAULT_TOKEN_BUDGET = 1500
+
+
+def memory_settings_from_env(supported=MEMORY_MODES):
+    """(mode, token_budget) from POWERAI_MEMORY / POWERAI_TOKEN_BUDGET; unsupported modes fall back to buffer."""
+    mode = os.getenv("POWERAI_MEMORY", "buffer").strip().lower()
+    if mode not in supported:
+        if mode:
+            print(f"⚠️ POWERAI_MEMORY={mode} is not available here ({', '.join(supported)}); using buffer",
+                  file=sys.stderr)
+        mode = "buffer"
+    budget = int(os.getenv("POWERAI_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET))
+    return mode, budget
+
+
+def build_memory(mode="buffer", chat_memory=None, llm=None, token_budget=DEFAULT_TOKEN_BUDGET,
+                 return_messages=False, summarize_with_llm=None):
+    """Memory for a ConversationChain (memory_key "history")."""
+    kwargs = {"return_messages": return_messages}
+    if chat_memory is not None:
+        kwargs["chat_memory"] = chat_memory
+
+    if mode == "budget":
+        from powerai_core.budget_memory import (
+            CachedTokenCounter, TokenBudgetMemory, extractive_summarizer, llm_summarizer,
+        )
+        if summarize_with_llm is None:
+            summarize_with_llm = os.getenv("POWERAI_SUMMARIZER", "").lower() == "llm"
+        counter = CachedTokenCounter(getattr(llm, "get_num_tokens", None))
+        summarizer = llm_summarizer(llm) if (summarize_with_llm and llm is not None) else extractive_summarizer
+        return TokenBudgetMemory(max_token_limit=token_budget, token_counter=counter,
+                                 summarizer=summarizer, **kwargs)
+
+    if mode == "retrieval":
+        from powerai_core.retrieval import RetrievalMemory
+        return RetrievalMemory(**kwargs)
+
+    from langchain.memory import ConversationBufferMemory
+    return ConversationBufferMemory(**kwargs)
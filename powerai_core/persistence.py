@@ -0,0 +1,329 @@
+# persistence.py
+# Write-behind message persistence for the SQLite chat histories.
+#
+# SQLChatMessageHistory commits every add_message() on the caller's thread, on
+# a rollback-journal SQLite file, so concurrent users queue on the file's write
+# lock one fsync at a time. This module:
+#
+#   tune_sqlite(engine)   -> WAL journal, synchronous=NORMAL, busy_timeout, ...
+#                            on every pooled connection
+#   BatchWriter           -> one background thread per DB file that drains a
+#                            queue of pending rows from ALL sessions into a
+#                            single transaction per batch
+#   WriteBehindSQLHistory -> WindowedSQLHistory whose add_message(s) enqueue
+#                            instead of committing; its own reads first wait for
+#                            its pending rows (read-your-writes per session)
+#
+# Rows commit in the order they were added and every batch is one transaction
+# made of whole submit() calls (one turn's messages are never split across two),
+# so a crash can lose the newest unflushed rows but never leaves gaps or half a
+# turn behind. history.flush() / writer.flush() block until
+# everything queued so far is committed (durable against a process crash;
+# POWERAI_SQLITE_SYNC=FULL makes it durable against power loss too).
+
+import atexit
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import event
+
+from powerai_core.history import WindowedSQLHistory
+from powerai_core.telemetry import span
+
+SQLITE_PRAGMAS = (
+    "PRAGMA auto_vacuum=INCREMENTAL",  # new files only (must precede WAL); see maintenance.py
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",      # ~16 MB page cache per connection
+    "PRAGMA wal_autocheckpoint=1000",
+)
+
+
+def tune_sqlite(engine, synchronous: Optional[str] = None):
+    """Apply WAL + pragmas to every connection the engine opens (idempotent)."""
+    if engine.dialect.name != "sqlite" or getattr(engine, "_powerai_tuned", False):
+        return engine
+    sync = (synchronous or os.getenv("POWERAI_SQLITE_SYNC", "NORMAL")).upper()
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        for pragma in SQLITE_PRAGMAS:
+            cur.execute(pragma)
+        cur.execute(f"PRAGMA synchronous={sync}")
+        cur.close()
+
+    engine._powerai_tuned = True
+    engine.dispose()  # pooled connections opened before this get re-opened tuned
+    return engine
+
+
+class WriterError(RuntimeError):
+    """A batch could not be committed; the rows of that batch are lost."""
+
+
+class BatchWriter:
+    """
+    Background group-commit writer for one SQLAlchemy engine.
+
+    max_batch:      rows per transaction at most; batches are cut between
+                    submissions only, so one larger submit() is its own batch
+    flush_interval: seconds the writer waits to collect more rows after the
+                    first one arrives (0 = commit whatever is queued right away)
+    max_pending:    submit() blocks while this many rows are queued (backpressure)
+    """
+
+    def __init__(self, engine, max_batch: int = 1000, flush_interval: float = 0.005,
+                 max_pending: int = 50_000, retries: int = 5):
+        self.engine = engine
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self._queue: deque = deque()     # (first_seq, last_seq, table, rows): one per submit()
+        self._pending = 0                # rows in the queue
+        self._cond = threading.Condition()
+        self._enqueued = 0
+        self._committed = 0
+        self._failures: deque = deque(maxlen=100)   # (first_ticket, last_ticket, exc)
+        self._closed = False
+        self.batches = 0
+        self.rows = 0
+        self._thread = threading.Thread(target=self._run, name="powerai-batch-writer", daemon=True)
+        self._thread.start()
+
+    # ---- producer side ----
+    def submit(self, table, rows: Sequence[dict]) -> int:
+        """Queue rows for `table` (a sqlalchemy Table); returns a ticket for wait()."""
+        with self._cond:
+            while self._pending >= self.max_pending and not self._closed:
+                self._cond.wait()
+            if self._closed:
+                raise WriterError("writer is closed")
+            rows = list(rows)
+            if rows:
+                first = self._enqueued + 1
+                self._enqueued += len(rows)
+                self._pending += len(rows)
+                self._queue.append((first, self._enqueued, table, rows))
+                self._cond.notify_all()
+            return self._enqueued
+
+    def wait(self, ticket: int, timeout: Optional[float] = 30.0) -> None:
+        """Block until every row up to `ticket` is written; raise if its batch failed."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._committed < ticket:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"rows up to #{ticket} not committed after {timeout}s")
+                self._cond.wait(remaining)
+            for first, last, exc in self._failures:
+                if first <= ticket <= last:
+                    raise WriterError(f"batch commit failed: {exc!r}") from exc
+
+    def flush(self, timeout: Optional[float] = 30.0) -> None:
+        with self._cond:
+            ticket = self._enqueued
+        self.wait(ticket, timeout)
+
+    @property
+    def committed(self) -> int:
+        return self._committed
+
+    def close(self, timeout: Optional[float] = 30.0) -> None:
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {"batches": self.batches, "rows": self.rows, "pending": self._enqueued - self._committed,
+                "avg_batch": round(self.rows / self.batches, 1) if self.batches else 0.0}
+
+    # ---- writer thread ----
+    def _take_batch(self) -> List[tuple]:
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            if not self._queue:
+                return []
+            # group commit: give other sessions a moment to add their rows
+            deadline = time.monotonic() + self.flush_interval
+            while self._pending < self.max_batch and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            # whole submissions only; the first one goes in even if it alone is larger
+            batch = [self._queue.popleft()]
+            n = len(batch[0][3])
+            while self._queue and n + len(self._queue[0][3]) <= self.max_batch:
+                n += len(self._queue[0][3])
+                batch.append(self._queue.popleft())
+            self._pending -= n
+            self._cond.notify_all()  # wake submitters held back by max_pending
+            return batch
+
+    def _commit(self, batch: List[tuple]) -> None:
+        # every history object has its own Table instance; group by name so one
+        # executemany covers all sessions writing to the same table
+        by_table: Dict[str, tuple] = {}
+        for _, _, table, rows in batch:
+            by_table.setdefault(table.name, (table, []))[1].extend(rows)
+        for attempt in range(self.retries + 1):
+            try:
+                with self.engine.begin() as conn:
+                    for table, rows in by_table.values():
+                        conn.execute(table.insert(), rows)
+                return
+            except Exception:
+                if attempt == self.retries:
+                    raise
+                time.sleep(0.05 * (2 ** attempt))
+
+    def _run(self) -> None:
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return  # closed and drained
+            try:
+                self._commit(batch)
+            except Exception as e:
+                with self._cond:
+                    self._failures.append((batch[0][0], batch[-1][1], e))
+                    self._committed = batch[-1][1]
+                    self._cond.notify_all()
+                continue
+            with self._cond:
+                self._committed = batch[-1][1]
+                self.batches += 1
+                self.rows += sum(len(rows) for _, _, _, rows in batch)
+                self._cond.notify_all()
+
+
+# ---------------------------
+# One writer per database
+# ---------------------------
+_WRITERS: Dict[str, BatchWriter] = {}
+_WRITERS_LOCK = threading.Lock()
+
+
+def get_writer(engine) -> BatchWriter:
+    key = str(engine.url)
+    with _WRITERS_LOCK:
+        writer = _WRITERS.get(key)
+        if writer is None or writer._closed:
+            writer = _WRITERS[key] = BatchWriter(tune_sqlite(engine))
+        return writer
+
+
+def close_writer(engine) -> None:
+    """Flush and stop the writer for this engine (e.g. before engine.dispose())."""
+    with _WRITERS_LOCK:
+        writer = _WRITERS.pop(str(engine.url), None)
+    if writer is not None:
+        writer.close()
+
+
+@atexit.register
+def _flush_all_writers() -> None:
+    with _WRITERS_LOCK:
+        writers = list(_WRITERS.values())
+    for writer in writers:
+        writer.close()
+
+
+class WriteBehindSQLHistory(WindowedSQLHistory):
+    """
+    WindowedSQLHistory whose writes go through the engine's BatchWriter.
+
+    add_message(s) return as soon as the rows are queued. Every read on this
+    object first waits for this session's own queued rows, so a session always
+    sees what it wrote; other sessions' rows show up once their batch commits.
+    """
+
+    def __init__(self, session_id, connection=None, table_name="message_store", **kwargs):
+        super().__init__(session_id=session_id, connection=connection, table_name=table_name, **kwargs)
+        tune_sqlite(self.engine)
+        self._writer = get_writer(self.engine)
+        self._table = self.sql_model_class.__table__
+        self._columns = [c.name for c in self._table.columns if c.name != "id"]
+        self._ticket = 0
+
+    @property
+    def writer(self) -> BatchWriter:
+        if self._writer._closed:  # engine was evicted/disposed: its writer drained everything
+            self._writer = get_writer(self.engine)
+            self._ticket = 0
+        return self._writer
+
+    # ---- writes ----
+    def _row(self, message) -> dict:
+        model = self.converter.to_sql_model(message, self.session_id)
+        return {c: getattr(model, c) for c in self._columns}
+
+    def add_message(self, message) -> None:
+        with span("history.write", queued=True):
+            self._ticket = self.writer.submit(self._table, [self._row(message)])
+
+    def add_messages(self, messages) -> None:
+        with span("history.write", queued=True):
+            rows = [self._row(m) for m in messages]
+            if rows:
+                self._ticket = self.writer.submit(self._table, rows)
+
+    def flush(self, timeout: Optional[float] = 30.0) -> None:
+        """Block until this session's queued messages are committed."""
+        writer = self.writer
+        if self._ticket > writer.committed:
+            with span("history.flush"):
+                writer.wait(self._ticket, timeout)
+
+    def clear(self) -> None:
+        self.flush()
+        super().clear()
+
+    # ---- reads (read-your-writes) ----
+    def last_records(self, n, before_id=None, skip_notes=False):
+        self.flush()
+        return super().last_records(n, before_id, skip_notes)
+
+    def last_ids(self, n, before_id=None, skip_notes=False):
+        self.flush()
+        return super().last_ids(n, before_id, skip_notes)
+
+    def last_records_within(self, max_tokens, before_id=None, skip_notes=False, max_rows=1000):
+        self.flush()
+        return super().last_records_within(max_tokens, before_id, skip_notes, max_rows)
+
+    def records_after(self, after_id, limit=500):
+        self.flush()
+        return super().records_after(after_id, limit)
+
+    def records_by_ids(self, ids):
+        self.flush()
+        return super().records_by_ids(ids)
+
+    def first_record(self):
+        self.flush()
+        return super().first_record()
+
+    def has_messages(self) -> bool:
+        self.flush()
+        return super().has_messages()
+
+    def records(self):
+        self.flush()
+        return super().records()
+
+    @property
+    def messages(self):  # type: ignore[override]
+        self.flush()
+        return super().messages
@@ -0,0 +1,271 @@
+# resources.py
+# Process-wide cache for the expensive objects every rerun used to rebuild.
+#
+# Streamlit re-executes the app script on every interaction, but imported
+# modules stay loaded, so anything kept here survives reruns AND is shared by
+# every browser session served by this process:
+#
+#   get_engine(db_path)                       -> pooled SQLAlchemy engine per DB file
+#   get_llm(model, temperature, api_key)      -> one ChatOpenAI per (model, temp, key hash),
+#                                                responses cached via llm_cache, calls
+#                                                paced by scheduler, identical concurrent
+#                                                calls merged by coalesce
+#   get_session_history(session_id, db_path)  -> one history per session (write-behind,
+#                                                see persistence.py)
+#
+# Each kind lives in a bounded LRU with idle eviction, so hundreds of sessions
+# don't grow memory without limit.
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+_MISSING = object()
+
+
+class ResourceCache:
+    """
+    Thread-safe LRU keyed by any hashable. Values are built outside the cache
+    lock, under a lock per key: a slow build (a session's history restoring its
+    archive) only holds up callers asking for that same key.
+
+    max_items: hard cap; the least recently used entry is evicted past it.
+    idle_ttl:  seconds an entry may sit unused before it is dropped (None = never).
+    on_evict:  called with the evicted value (e.g. engine.dispose).
+    """
+
+    def __init__(self, name: str, max_items: int, idle_ttl: Optional[float] = None,
+                 on_evict: Optional[Callable[[Any], None]] = None):
+        self.name = name
+        self.max_items = max_items
+        self.idle_ttl = idle_ttl
+        self.on_evict = on_evict
+        self._items: "OrderedDict[Hashable, list]" = OrderedDict()  # key -> [value, last_used]
+        self._lock = threading.RLock()
+        self._building: Dict[Hashable, list] = {}  # key -> [RLock, callers using it]
+        self._last_sweep = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _hit(self, key: Hashable, now: float) -> Any:
+        """Cached value (refreshing its LRU slot) or _MISSING; call under self._lock."""
+        entry = self._items.get(key)
+        if entry is None:
+            return _MISSING
+        entry[1] = now
+        self._items.move_to_end(key)
+        self.hits += 1
+        self._maybe_sweep(now)
+        return entry[0]
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Cached value or `default`; never builds."""
+        with self._lock:
+            value = self._hit(key, time.monotonic())
+        return default if value is _MISSING else value
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        with self._lock:
+            value = self._hit(key, time.monotonic())
+            if value is not _MISSING:
+                return value
+            build = self._building.get(key)
+            if build is None:
+                build = self._building[key] = [threading.RLock(), 0]
+            build[1] += 1
+        try:
+            # one builder per key: two reruns racing for the same engine get one
+            with build[0]:
+                with self._lock:
+                    value = self._hit(key, time.monotonic())
+                    if value is not _MISSING:
+                        return value
+                    self.misses += 1
+                value = factory()
+                self.put(key, value)
+                return value
+        finally:
+            with self._lock:
+                build[1] -= 1
+                if not build[1] and self._building.get(key) is build:
+                    del self._building[key]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Insert or replace (a replaced value goes through on_evict)."""
+        now = time.monotonic()
+        with self._lock:
+            old = self._items.get(key)
+            self._items[key] = [value, now]
+            if old is not None and old[0] is not value:
+                self._evicted(old[0])
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                _, (dropped, _) = self._items.popitem(last=False)
+                self._evicted(dropped)
+            self._maybe_sweep(now)
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            entry = self._items.pop(key, None)
+            if entry is not None:
+                self._evicted(entry[0])
+
+    def clear(self) -> None:
+        with self._lock:
+            while self._items:
+                _, (old, _) = self._items.popitem(last=False)
+                self._evicted(old)
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        if self.idle_ttl is None:
+            return 0
+        now = time.monotonic() if now is None else now
+        dropped = 0
+        with self._lock:
+            # OrderedDict is in LRU order, so idle entries are all at the front
+            while self._items:
+                key, (value, last_used) = next(iter(self._items.items()))
+                if now - last_used < self.idle_ttl:
+                    break
+                del self._items[key]
+                self._evicted(value)
+                dropped += 1
+        return dropped
+
+    def _maybe_sweep(self, now: float) -> None:
+        if self.idle_ttl is not None and now - self._last_sweep > min(self.idle_ttl, 60.0):
+            self._last_sweep = now
+            self.evict_idle(now)
+
+    def _evicted(self, value: Any) -> None:
+        self.evictions += 1
+        if self.on_evict:
+            try:
+                self.on_evict(value)
+            except Exception:
+                pass
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def stats(self) -> dict:
+        return {"name": self.name, "size": len(self._items), "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions}
+
+
+# ---------------------------
+# Shared pools (per process)
+# ---------------------------
+def _dispose_engine(engine) -> None:
+    from powerai_core.persistence import close_writer
+
+    close_writer(engine)  # flush queued messages before the pool goes away
+    engine.dispose()
+
+
+ENGINES = ResourceCache("engines", max_items=16, idle_ttl=3600, on_evict=_dispose_engine)
+LLMS = ResourceCache("llms", max_items=32, idle_ttl=3600)
+HISTORIES = ResourceCache("histories", max_items=512, idle_ttl=1800)
+
+
+def key_fingerprint(secret: Optional[str]) -> str:
+    """Cache keys hold a short hash of the API key, never the key itself."""
+    return hashlib.sha256((secret or "").encode("utf-8")).hexdigest()[:16]
+
+
+def db_url(db_path: str) -> str:
+    return f"sqlite:///{os.path.abspath(db_path)}"
+
+
+def get_engine(db_path: str):
+    """One pooled, WAL-tuned engine per SQLite file, shared across reruns, sessions and threads."""
+    from sqlalchemy import create_engine
+    from powerai_core.persistence import tune_sqlite
+
+    from powerai_core.telemetry import span
+
+    path = os.path.abspath(db_path)
+    with span("engine.get"):
+        return ENGINES.get_or_create(path, lambda: tune_sqlite(create_engine(
+            db_url(path),
+            pool_size=5,
+            max_overflow=10,
+            pool_pre_ping=True,
+            connect_args={"check_same_thread": False},
+        )))
+
+
+def get_llm(model: str = "gpt-4o-mini", temperature: float = 0.7,
+            api_key: Optional[str] = None, cache: Optional[bool] = None,
+            priority: str = "interactive", **kwargs):
+    """
+    One ChatOpenAI (and its HTTP connection pool) per (model, temperature, key).
+    Responses go through the shared response cache when powerai_core.llm_cache's
+    policy says so (temperature 0 by default; cache=True/False forces it).
+    Calls go through the shared rate limiter / scheduler at `priority`
+    ("interactive" for chat turns, "batch" for pipelines), which also owns retries.
+    Identical requests in flight at the same time share one upstream call.
+    Call latency is recorded by powerai_core.telemetry ("llm.call", "llm.ttft").
+    """
+    from langchain_openai import ChatOpenAI
+    from powerai_core.coalesce import coalescing_class, coalescing_enabled
+    from powerai_core.llm_cache import langchain_cache_for, should_cache
+    from powerai_core.scheduler import scheduled_chat_openai_class, scheduler_enabled
+    from powerai_core.telemetry import llm_callbacks
+
+    cached = should_cache(temperature, cache)
+    scheduled = scheduler_enabled()
+    coalesced = coalescing_enabled()
+    callbacks = llm_callbacks()
+    key = (model, float(temperature), key_fingerprint(api_key), cached, priority, scheduled,
+           coalesced, bool(callbacks), tuple(sorted(kwargs.items())))
+
+    def build():
+        cls = ChatOpenAI
+        if scheduled:
+            cls = scheduled_chat_openai_class()
+            kwargs.setdefault("max_retries", 0)  # the scheduler retries, with shared backoff
+            kwargs["priority"] = priority
+        if coalesced:
+            cls = coalescing_class(cls)
+        if callbacks:
+            kwargs.setdefault("callbacks", callbacks)
+        return cls(api_key=api_key, model=model, temperature=temperature,
+                   cache=langchain_cache_for(temperature, cached), **kwargs)
+
+    return LLMS.get_or_create(key, build)
+
+
+def get_session_history(session_id: str, db_path: str, table_name: str = "message_store",
+                        window: Optional[int] = None, keep_first: bool = False,
+                        write_behind: bool = True, max_tokens: Optional[int] = None):
+    """
+    Per-session history, created once (table/index checks run once too).
+    write_behind=True queues writes on the DB's background batch writer
+    (WriteBehindSQLHistory); False commits on the caller's thread.
+    max_tokens caps `.messages` by the stored per-row token counts.
+    """
+    from powerai_core.history import WindowedSQLHistory
+    from powerai_core.persistence import WriteBehindSQLHistory
+
+    cls = WriteBehindSQLHistory if write_behind else WindowedSQLHistory
+    key = (os.path.abspath(db_path), table_name, session_id, window, keep_first, write_behind, max_tokens)
+    return HISTORIES.get_or_create(key, lambda: cls(
+        session_id=session_id, connection=get_engine(db_path), table_name=table_name,
+        window=window, keep_first=keep_first, max_tokens=max_tokens,
+    ))
+
+
+def forget_session(session_id: str) -> None:
+    """Drop cached history objects for a session (e.g. after a hard reset)."""
+    with HISTORIES._lock:
+        for key in [k for k in HISTORIES._items if k[2] == session_id]:
+            HISTORIES.pop(key)
+
+
+def cache_stats() -> list:
+    return [c.stats() for c in (ENGINES, LLMS, HISTORIES)]
@@ -0,0 +1,222 @@
+# rest_client.py
+# Raw REST access to /v1/chat/completions for high-volume scripted calls.
+#
+# requests.post() opens a fresh TCP+TLS connection per call and waits forever
+# by default. These clients keep one pooled keep-alive connection set per
+# client, always use timeouts, and retry 429/5xx and connection errors with
+# jittered exponential backoff (honouring Retry-After).
+#
+#     with OpenAIRestClient(api_key) as client:
+#         text = client.chat_text([{"role": "user", "content": "Say OK"}])
+#
+#     async with AsyncOpenAIRestClient(api_key, max_connections=64) as client:
+#         replies = await client.chat_many(list_of_message_lists, concurrency=64)
+#
+# base_url defaults to OPENAI_BASE_URL or the public API; point it at
+# powerai_core/stub_openai_server.py for offline tests and throughput runs.
+
+import asyncio
+import os
+import random
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+RETRY_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+class RestClientError(RuntimeError):
+    """Non-retryable HTTP error, or retries exhausted."""
+
+    def __init__(self, message: str, status: Optional[int] = None, body: str = ""):
+        super().__init__(message)
+        self.status = status
+        self.body = body
+
+
+def backoff_delay(attempt: int, base: float, cap: float, retry_after: Optional[str] = None) -> float:
+    """Full-jitter exponential backoff; a Retry-After header sets the minimum."""
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    if retry_after:
+        try:
+            delay = max(delay, min(cap, float(retry_after)))
+        except ValueError:
+            pass  # HTTP-date form: fall back to our own schedule
+    return delay
+
+
+def reply_text(data: Dict[str, Any]) -> str:
+    return data["choices"][0]["message"]["content"]
+
+
+class _ClientConfig:
+    def __init__(self, api_key, base_url, connect_timeout, read_timeout, max_retries,
+                 backoff_base, backoff_max, default_model):
+        self.api_key = api_key if api_key is not None else os.getenv("OPENAI_API_KEY", "")
+        self.base_url = (base_url or os.getenv("OPENAI_BASE_URL") or DEFAULT_BASE_URL).rstrip("/")
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.default_model = default_model or os.getenv("MODEL_NAME", "gpt-4o-mini")
+        self.retries = 0  # total retries performed, for reporting
+
+    def headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+
+    def payload(self, messages, model, params) -> Dict[str, Any]:
+        return {"model": model or self.default_model, "messages": list(messages), **params}
+
+    def url(self, path: str) -> str:
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+
+# ---------------------------
+# Sync (requests.Session)
+# ---------------------------
+class OpenAIRestClient(_ClientConfig):
+    """
+    pool_size:        keep-alive connections kept per host
+    connect_timeout / read_timeout: seconds (a call never hangs forever)
+    max_retries:      extra attempts on 429/5xx/connection errors
+    backoff_base / backoff_max: seconds for the jittered exponential schedule
+    """
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 pool_size: int = 32, connect_timeout: float = 5.0, read_timeout: float = 60.0,
+                 max_retries: int = 5, backoff_base: float = 0.5, backoff_max: float = 20.0,
+                 default_model: Optional[str] = None):
+        super().__init__(api_key, base_url, connect_timeout, read_timeout, max_retries,
+                         backoff_base, backoff_max, default_model)
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self._requests = requests
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(self.headers())
+
+    def post(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        url = self.url(path)
+        for attempt in range(self.max_retries + 1):
+            last = attempt == self.max_retries
+            try:
+                r = self.session.post(url, json=payload, timeout=(self.connect_timeout, self.read_timeout))
+            except (self._requests.ConnectionError, self._requests.Timeout,
+                    self._requests.exceptions.ChunkedEncodingError) as e:  # dropped mid-body too
+                if last:
+                    raise RestClientError(f"POST {url} failed: {e}") from e
+                self.retries += 1
+                time.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_max))
+                continue
+            if r.status_code < 400:
+                return r.json()
+            if r.status_code not in RETRY_STATUSES or last:
+                raise RestClientError(f"POST {url} -> HTTP {r.status_code}", r.status_code, r.text[:2000])
+            self.retries += 1
+            time.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_max,
+                                     r.headers.get("Retry-After")))
+        raise RestClientError(f"POST {url}: no attempts made")  # max_retries < 0
+
+    def chat(self, messages: Iterable[Dict[str, str]], model: Optional[str] = None, **params) -> Dict[str, Any]:
+        return self.post("chat/completions", self.payload(messages, model, params))
+
+    def chat_text(self, messages, model: Optional[str] = None, **params) -> str:
+        return reply_text(self.chat(messages, model, **params))
+
+    def close(self) -> None:
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ---------------------------
+# Async (aiohttp.ClientSession)
+# ---------------------------
+class AsyncOpenAIRestClient(_ClientConfig):
+    """
+    Same behaviour as OpenAIRestClient; many concurrent requests share one pool.
+    Uses aiohttp (already installed with langchain-community): httpx's pool gets
+    CPU-bound past a few dozen concurrent requests.
+    """
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 max_connections: int = 64, connect_timeout: float = 5.0, read_timeout: float = 60.0,
+                 max_retries: int = 5, backoff_base: float = 0.5, backoff_max: float = 20.0,
+                 default_model: Optional[str] = None):
+        super().__init__(api_key, base_url, connect_timeout, read_timeout, max_retries,
+                         backoff_base, backoff_max, default_model)
+        self.max_connections = max_connections
+        self._session = None
+
+    @property
+    def session(self):
+        # created lazily so it binds to the running event loop
+        if self._session is None or self._session.closed:
+            import aiohttp
+
+            self._aiohttp = aiohttp
+            self._session = aiohttp.ClientSession(
+                headers=self.headers(),
+                connector=aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.read_timeout),
+            )
+        return self._session
+
+    async def post(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        url = self.url(path)
+        session = self.session
+        for attempt in range(self.max_retries + 1):
+            last = attempt == self.max_retries
+            try:
+                async with session.post(url, json=payload) as r:
+                    if r.status < 400:
+                        return await r.json(content_type=None)
+                    body = await r.text()
+                    retry_after = r.headers.get("Retry-After")
+            except (self._aiohttp.ClientConnectionError, self._aiohttp.ClientPayloadError,
+                    asyncio.TimeoutError) as e:  # ClientPayloadError: dropped mid-body
+                if last:
+                    raise RestClientError(f"POST {url} failed: {e!r}") from e
+                self.retries += 1
+                await asyncio.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_max))
+                continue
+            if r.status not in RETRY_STATUSES or last:
+                raise RestClientError(f"POST {url} -> HTTP {r.status}", r.status, body[:2000])
+            self.retries += 1
+            await asyncio.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_max, retry_after))
+        raise RestClientError(f"POST {url}: no attempts made")
+
+    async def chat(self, messages, model: Optional[str] = None, **params) -> Dict[str, Any]:
+        return await self.post("chat/completions", self.payload(messages, model, params))
+
+    async def chat_text(self, messages, model: Optional[str] = None, **params) -> str:
+        return reply_text(await self.chat(messages, model, **params))
+
+    async def chat_many(self, conversations: Iterable[List[Dict[str, str]]], concurrency: int = 32,
+                        model: Optional[str] = None, return_exceptions: bool = False, **params) -> list:
+        """Reply texts in input order; at most `concurrency` requests in flight."""
+        sem = asyncio.Semaphore(concurrency)
+
+        async def one(messages):
+            async with sem:
+                return await self.chat_text(messages, model, **params)
+
+        return await asyncio.gather(*(one(m) for m in conversations), return_exceptions=return_exceptions)
+
+    async def aclose(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
@@ -0,0 +1,427 @@
+# retrieval.py
+# Semantic retrieval memory: a small vector index per session, next to the DB.
+#
+# Instead of replaying the whole SQLite history, each turn sends the model
+#   - the top-k past messages most similar to the new input, and
+#   - the last few messages verbatim.
+#
+# Every stored message is embedded once (HashingEmbedder works offline; pass any
+# texts -> vectors function for real embeddings) and appended to an on-disk,
+# append-only index:
+#
+#   powerai_memory.db.vectors/<session-hash>.f32    float32 rows (n x dim)
+#   powerai_memory.db.vectors/<session-hash>.ids    int64 message ids
+#   powerai_memory.db.vectors/<session-hash>.json   embedder name + dim
+#
+# New messages are picked up by id (rows newer than the last indexed id), so
+# updates are incremental; search is one matrix-vector product + argpartition.
+# A session whose first row no longer matches the index's first id was cleared
+# (or restored under new ids) and is re-indexed; clear_index(history) drops the
+# files right away on a hard reset. Several memories may index one session
+# (chat_service workers, two tabs on one id): appends hold <session-hash>.lock
+# and first pick up what the others wrote, so every id is stored once.
+# The index also keeps per-dimension document frequencies, so queries are
+# IDF-weighted (hashing TF on the stored side, TF-IDF on the query side).
+
+import hashlib
+import json
+import os
+import re
+import threading
+import zlib
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain_core.messages import SystemMessage, get_buffer_string
+from langchain_core.pydantic_v1 import PrivateAttr
+
+from powerai_core.history import WindowedSQLHistory, records_to_messages
+from powerai_core.telemetry import timed
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def _lock_file(fd: int) -> None:
+    if fcntl:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+
+
+def _unlock_file(fd: int) -> None:
+    if fcntl:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def _index_lock(base: str):
+    fd = os.open(base + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        _lock_file(fd)
+        try:
+            yield
+        finally:
+            _unlock_file(fd)
+    finally:
+        os.close(fd)
+
+
+# ---------------------------
+# Embedders
+# ---------------------------
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by can could did do does for from had has have how i i'm if in "
+    "is it its me my of on or our so that the their them then there these they this to was we "
+    "were what when where which who why will with would you your".split()
+)
+
+
+class HashingEmbedder:
+    """
+    Offline embedder: signed feature hashing of word unigrams and bigrams with
+    log-scaled counts, L2-normalized. crc32 keeps hashes stable across processes
+    (Python's hash() is salted per run, which would break a persisted index).
+    """
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text: str) -> List[str]:
+        words = [w for w in _WORD_RE.findall(text.lower()) if w not in _STOPWORDS]
+        return words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            feats = self._features(text)
+            if not feats:
+                continue
+            h = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in feats), dtype=np.uint32, count=len(feats))
+            cols = (h % self.dim).astype(np.intp)
+            signs = np.where((h >> 31) & 1, -1.0, 1.0).astype(np.float32)
+            np.add.at(out[row], cols, signs)
+        np.copysign(np.log1p(np.abs(out)), out, out=out)
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        np.divide(out, norms, out=out, where=norms > 0)
+        return out
+
+
+class CallableEmbedder:
+    """
+    Wrap any texts -> vectors function (e.g. OpenAIEmbeddings().embed_documents):
+
+        CallableEmbedder(OpenAIEmbeddings().embed_documents, name="openai-3-small")
+    """
+
+    def __init__(self, fn: Callable[[List[str]], Any], name: str):
+        self.fn = fn
+        self.name = name
+        self.dim = None
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vecs = np.asarray(self.fn(list(texts)), dtype=np.float32)
+        if vecs.ndim == 1:
+            vecs = vecs.reshape(len(texts), -1)
+        self.dim = vecs.shape[1]
+        norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+        np.divide(vecs, norms, out=vecs, where=norms > 0)
+        return vecs
+
+
+# ---------------------------
+# Per-session index
+# ---------------------------
+def index_base(directory: str, session_id: str) -> str:
+    return os.path.join(directory, hashlib.sha1(session_id.encode("utf-8")).hexdigest()[:20])
+
+
+class SessionVectorIndex:
+    """Append-only vector index for one session, persisted as raw arrays."""
+
+    def __init__(self, directory: str, session_id: str, embedder_name: str, dim: int):
+        os.makedirs(directory, exist_ok=True)
+        self.base = index_base(directory, session_id)
+        self.embedder_name = embedder_name
+        self.dim = dim
+        self._vectors = np.zeros((0, dim), dtype=np.float32)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._count = 0
+        self._df = np.zeros(dim, dtype=np.int64)   # rows with a non-zero value per dimension
+        self._thread_lock = threading.RLock()
+        self._lock_depth = 0
+        with self.locked():
+            self._load()
+
+    # ---- persistence ----
+    @contextmanager
+    def locked(self):
+        """Exclusive lock on the session's files across processes (re-entrant in this object)."""
+        with self._thread_lock:
+            if self._lock_depth:
+                self._lock_depth += 1
+                try:
+                    yield self
+                finally:
+                    self._lock_depth -= 1
+                return
+            with _index_lock(self.base):
+                self._lock_depth = 1
+                try:
+                    yield self
+                finally:
+                    self._lock_depth = 0
+
+    def refresh(self):
+        """Reload when another writer appended to (or reset) the files since we read them."""
+        with self.locked():
+            ids_path = self.base + ".ids"
+            on_disk = os.path.getsize(ids_path) // 8 if os.path.exists(ids_path) else 0
+            first = np.fromfile(ids_path, dtype=np.int64, count=1) if on_disk else ()
+            if on_disk != self._count or (on_disk and int(first[0]) != self.first_id):
+                self._count = 0
+                self._df = np.zeros(self.dim, dtype=np.int64)
+                self._load()
+
+    def _load(self):
+        meta_path = self.base + ".json"
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("embedder") != self.embedder_name or meta.get("dim") != self.dim:
+                self.reset()  # different embedder: vectors are not comparable
+                return
+            vecs = np.fromfile(self.base + ".f32", dtype=np.float32) if os.path.exists(self.base + ".f32") else np.zeros(0, np.float32)
+            ids = np.fromfile(self.base + ".ids", dtype=np.int64) if os.path.exists(self.base + ".ids") else np.zeros(0, np.int64)
+            # a crash between the two appends leaves them uneven: keep the common prefix
+            n = min(len(vecs) // self.dim, len(ids))
+            if len(vecs) != n * self.dim or len(ids) != n:
+                os.truncate(self.base + ".f32", n * self.dim * 4)
+                os.truncate(self.base + ".ids", n * 8)
+            self._grow(n)
+            self._vectors[:n] = vecs[: n * self.dim].reshape(n, self.dim)
+            self._ids[:n] = ids[:n]
+            self._count = n
+            self._df = np.count_nonzero(self._vectors[:n], axis=0).astype(np.int64)
+        else:
+            self.reset()
+
+    def reset(self):
+        with self.locked():
+            for ext in (".f32", ".ids"):
+                if os.path.exists(self.base + ext):
+                    os.remove(self.base + ext)
+            with open(self.base + ".json", "w", encoding="utf-8") as f:
+                json.dump({"embedder": self.embedder_name, "dim": self.dim}, f)
+            self._count = 0
+            self._df = np.zeros(self.dim, dtype=np.int64)
+
+    def _grow(self, needed: int):
+        if needed <= len(self._ids):
+            return
+        cap = max(needed, 2 * len(self._ids), 64)
+        vectors = np.zeros((cap, self.dim), dtype=np.float32)
+        ids = np.zeros(cap, dtype=np.int64)
+        vectors[: self._count] = self._vectors[: self._count]
+        ids[: self._count] = self._ids[: self._count]
+        self._vectors, self._ids = vectors, ids
+
+    # ---- updates / queries ----
+    @property
+    def first_id(self) -> int:
+        return int(self._ids[0]) if self._count else 0
+
+    @property
+    def last_id(self) -> int:
+        return int(self._ids[self._count - 1]) if self._count else 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, ids: Sequence[int], vectors: np.ndarray):
+        """Append rows; ids at or below the last one on disk are already indexed and skipped."""
+        if not len(ids):
+            return
+        with self.locked():
+            self.refresh()
+            ids = np.asarray(ids, dtype=np.int64)
+            keep = ids > self.last_id
+            ids = ids[keep]
+            if not len(ids):
+                return
+            vectors = np.ascontiguousarray(np.asarray(vectors, dtype=np.float32)[keep])
+            n = self._count + len(ids)
+            self._grow(n)
+            self._vectors[self._count:n] = vectors
+            self._ids[self._count:n] = ids
+            self._count = n
+            self._df += np.count_nonzero(vectors, axis=0)
+            with open(self.base + ".f32", "ab") as f:
+                vectors.tofile(f)
+            with open(self.base + ".ids", "ab") as f:
+                ids.tofile(f)
+
+    def idf_weight(self, query: np.ndarray) -> np.ndarray:
+        """Down-weight dimensions most messages share ("ok", "the", hash collisions)."""
+        idf = np.log((self._count + 1) / (self._df + 1)).astype(np.float32) + 1.0
+        q = query.astype(np.float32).ravel() * idf
+        norm = np.linalg.norm(q)
+        return q / norm if norm > 0 else q
+
+    def search(self, query: np.ndarray, k: int, exclude: Sequence[int] = (), min_score: float = 0.0):
+        """Top-k (id, score) by IDF-weighted cosine similarity, best first."""
+        if not self._count or k <= 0:
+            return []
+        scores = self._vectors[: self._count] @ self.idf_weight(query)
+        if len(exclude):
+            scores[np.isin(self._ids[: self._count], np.asarray(exclude, dtype=np.int64))] = -np.inf
+        k = min(k, self._count)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self._ids[i]), float(scores[i])) for i in top if scores[i] > min_score]
+
+
+def index_dir_for(history: WindowedSQLHistory) -> str:
+    db = history.engine.url.database or "memory"
+    return os.path.abspath(db) + ".vectors"
+
+
+def clear_index(history: WindowedSQLHistory) -> None:
+    """Remove a session's vector index files (hard reset); open memories re-index on their next sync."""
+    base = index_base(index_dir_for(history), history.session_id)
+    if not any(os.path.exists(base + ext) for ext in (".f32", ".ids", ".json")):
+        return
+    with _index_lock(base):
+        for ext in (".f32", ".ids", ".json"):
+            if os.path.exists(base + ext):
+                os.remove(base + ext)
+
+
+def _message_text(message_json: str) -> str:
+    data = json.loads(message_json).get("data", {})
+    return str(data.get("content", ""))
+
+
+# ---------------------------
+# Memory
+# ---------------------------
+class RetrievalMemory(BaseChatMemory):
+    """
+    Memory for ConversationChain that sends only relevant history:
+    top `k` similar past messages + the last `recent_messages` verbatim.
+    chat_memory must be a WindowedSQLHistory (keyset reads by id).
+    """
+
+    memory_key: str = "history"
+    input_key: Optional[str] = "input"
+    human_prefix: str = "Human"
+    ai_prefix: str = "AI"
+    k: int = 4
+    recent_messages: int = 6
+    min_score: float = 0.05
+    embedder: Any = None
+    index_dir: Optional[str] = None
+    index: Any = None
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        if not isinstance(self.chat_memory, WindowedSQLHistory):
+            raise ValueError("RetrievalMemory needs a WindowedSQLHistory as chat_memory")
+        if self.embedder is None:
+            self.embedder = HashingEmbedder()
+        self.index_dir = self.index_dir or index_dir_for(self.chat_memory)
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    def _open_index(self):
+        if self.index is None:
+            dim = getattr(self.embedder, "dim", None)
+            if dim is None:  # callable embedders learn their dim from a first call
+                dim = self.embedder.embed(["probe"]).shape[1]
+            self.index = SessionVectorIndex(self.index_dir, self.chat_memory.session_id,
+                                            self.embedder.name, dim)
+        return self.index
+
+    @timed("memory.index")
+    def sync_index(self, batch: int = 256) -> int:
+        """Embed messages stored since the last sync. Returns how many were added."""
+        with self._lock, self._open_index().locked() as index:
+            index.refresh()  # rows other memories on this session indexed meanwhile
+            if len(index):
+                # ids only grow, so a reset session's new rows sort after the old index:
+                # compare the first row instead (compaction keeps the first id)
+                first = self.chat_memory.first_record()
+                if first is None or first[0] != index.first_id:
+                    index.reset()  # session was wiped elsewhere
+            added = 0
+            while True:
+                rows = self.chat_memory.records_after(index.last_id, limit=batch)
+                if not rows:
+                    return added
+                vecs = self.embedder.embed([_message_text(m) for _, m in rows])
+                index.add([i for i, _ in rows], vecs)
+                added += len(rows)
+
+    def relevant_records(self, query: str, exclude: Sequence[int]):
+        self.sync_index()
+        if not query.strip():
+            return []
+        qvec = self.embedder.embed([query])[0]
+        hits = self._open_index().search(qvec, self.k, exclude=exclude, min_score=self.min_score)
+        return self.chat_memory.records_by_ids([i for i, _ in hits])
+
+    @timed("memory.load")
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        history = self.chat_memory
+        recent = history.last_records(self.recent_messages)
+        pinned = []
+        if history.keep_first:
+            first = history.first_record()
+            if first and (not recent or first[0] < recent[0][0]):
+                pinned = [first]
+        query = str(inputs.get(self.input_key or "input", ""))
+        exclude = [i for i, _ in pinned + recent]
+        retrieved = self.relevant_records(query, exclude)
+
+        pinned_msgs = records_to_messages(pinned)
+        retrieved_msgs = records_to_messages(retrieved)
+        recent_msgs = records_to_messages(recent)
+        if self.return_messages:
+            head = []
+            if retrieved_msgs:
+                head = [SystemMessage(content="Relevant earlier messages:\n" + get_buffer_string(
+                    retrieved_msgs, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix))]
+            return {self.memory_key: pinned_msgs + head + recent_msgs}
+
+        parts = []
+        if pinned_msgs or retrieved_msgs:
+            parts.append("Relevant earlier messages:\n" + get_buffer_string(
+                pinned_msgs + retrieved_msgs, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix))
+        parts.append(get_buffer_string(recent_msgs, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix))
+        return {self.memory_key: "\n".join(p for p in parts if p)}
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        super().save_context(inputs, outputs)
+        self.sync_index()  # embed just the two new messages
+
+    def clear(self) -> None:
+        super().clear()
+        with self._lock:
+            self._open_index().reset()
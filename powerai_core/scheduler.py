@@ -0,0 +1,623 @@
+# scheduler.py
+# One gate in front of every outgoing model call.
+#
+#   - RPM and TPM token buckets (requests / tokens per minute)
+#   - two priorities: "interactive" chat turns go first; "batch" work
+#     (day8/day9 pipelines) waits while interactive calls are queued and
+#     leaves a reserve of each bucket for them
+#   - adaptive concurrency (AIMD): the in-flight limit halves on every 429 and
+#     creeps back up only on reported success (timeouts / 5xx leave it as is);
+#     a 429 also pauses new calls for Retry-After
+#   - metrics: queue depth per priority, wait times, 429s, current limit
+#
+# State lives in memory (one process) or, with POWERAI_SCHEDULER_STATE=<file>,
+# in a small JSON file guarded by an OS file lock, so every worker process on
+# the machine shares the same budgets, queue counts and concurrency limit.
+# The async API runs file-state transactions in a worker thread, so the lock
+# never blocks an event loop.
+#
+# get_llm() returns ScheduledChatOpenAI, so all chains go through here.
+# Streamed calls ask for a final usage chunk (stream_options.include_usage), so
+# they settle their TPM estimate like plain calls do; POWERAI_STREAM_USAGE=off
+# for OpenAI-compatible servers that reject the option.
+# Settings (env): POWERAI_RPM, POWERAI_TPM, POWERAI_MAX_CONCURRENCY,
+# POWERAI_SCHEDULER_STATE, POWERAI_SCHEDULER=off.
+#
+#   python -m powerai_core.scheduler --state /tmp/powerai_sched.json   # show shared state
+
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+PRIORITIES = ("interactive", "batch")
+DEFAULT_OUTPUT_TOKENS = 512
+_PRIORITY = contextvars.ContextVar("powerai_call_priority", default=None)
+
+
+def estimate_tokens(messages, max_output: Optional[int] = None) -> int:
+    """Rough TPM charge before the call: ~4 chars/token in, plus the output cap."""
+    chars = sum(len(str(getattr(m, "content", m))) for m in messages)
+    return chars // 4 + 4 * len(messages) + (max_output or DEFAULT_OUTPUT_TOKENS)
+
+
+@contextmanager
+def call_priority(priority: str):
+    """Run the calls inside the block at this priority (overrides the model's)."""
+    token = _PRIORITY.set(priority)
+    try:
+        yield
+    finally:
+        _PRIORITY.reset(token)
+
+
+# ---------------------------
+# Shared state backends
+# ---------------------------
+class MemoryState:
+    """State for a single process."""
+
+    owner = "local"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data: Dict[str, Any] = {}
+
+    def transact(self, fn: Callable[[dict], Any]) -> Any:
+        with self._lock:
+            return fn(self._data)
+
+
+class FileState:
+    """
+    State shared by every process that points at the same file. Each
+    transaction holds an exclusive lock on <path>.lock, reads the JSON, applies
+    fn and writes it back atomically.
+    """
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        self.owner = str(os.getpid())
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._thread_lock = threading.Lock()
+        self._lock_fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+
+    def _lock(self):
+        if fcntl:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        else:
+            os.lseek(self._lock_fd, 0, os.SEEK_SET)
+            msvcrt.locking(self._lock_fd, msvcrt.LK_LOCK, 1)
+
+    def _unlock(self):
+        if fcntl:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(self._lock_fd, 0, os.SEEK_SET)
+            msvcrt.locking(self._lock_fd, msvcrt.LK_UNLCK, 1)
+
+    def transact(self, fn: Callable[[dict], Any]) -> Any:
+        with self._thread_lock:
+            self._lock()
+            try:
+                try:
+                    with open(self.path, encoding="utf-8") as f:
+                        data = json.load(f)
+                except (FileNotFoundError, ValueError):
+                    data = {}
+                result = fn(data)
+                tmp = f"{self.path}.{self.owner}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+                os.replace(tmp, self.path)
+                return result
+            finally:
+                self._unlock()
+
+
+def _pid_alive(pid: str) -> bool:
+    if not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+# ---------------------------
+# Scheduler
+# ---------------------------
+class Permit:
+    """Handed out by Scheduler.permit(); report the outcome through it."""
+
+    __slots__ = ("priority", "estimate", "used", "limited", "retry_after", "ok")
+
+    def __init__(self, priority, estimate):
+        self.priority = priority
+        self.estimate = estimate
+        self.used: Optional[int] = None
+        self.limited = False
+        self.retry_after: Optional[float] = None
+        self.ok = False
+
+    def record(self, tokens_used: Optional[int]) -> None:
+        """Actual tokens of the call (corrects the TPM estimate)."""
+        self.used = tokens_used
+
+    def succeeded(self) -> None:
+        """The call completed: lets the concurrency limit grow."""
+        self.ok = True
+
+    def rate_limited(self, retry_after: Optional[float] = None) -> None:
+        self.limited = True
+        self.retry_after = retry_after
+
+
+class Scheduler:
+    """
+    rpm / tpm:        bucket refill rates per minute (burst = one minute's worth)
+    max_concurrency:  upper bound for the adaptive in-flight limit
+    batch_reserve:    share of each bucket batch calls must leave untouched
+    """
+
+    def __init__(self, rpm: float = 500, tpm: float = 200_000, max_concurrency: int = 16,
+                 batch_reserve: float = 0.2, state=None, poll_interval: float = 0.02):
+        self.rpm = float(rpm)
+        self.tpm = float(tpm)
+        self.max_concurrency = max_concurrency
+        self.batch_reserve = batch_reserve
+        self.state = state or MemoryState()
+        self.poll_interval = poll_interval
+        # local metrics (this process)
+        self._mlock = threading.Lock()
+        self.wait_times = {p: deque(maxlen=1000) for p in PRIORITIES}
+        self.issued = {p: 0 for p in PRIORITIES}
+        self.rate_limited_calls = 0
+        self._last_gc = 0.0
+
+    # ---- state helpers (run inside state.transact) ----
+    def _init(self, s: dict, now: float) -> None:
+        if "updated" not in s:
+            s.update(rpm_tokens=self.rpm, tpm_tokens=self.tpm, updated=now,
+                     limit=float(self.max_concurrency), inflight={}, waiting={},
+                     cooldown_until=0.0, consecutive_429=0)
+            return
+        elapsed = max(0.0, now - s["updated"])
+        s["rpm_tokens"] = min(self.rpm, s["rpm_tokens"] + elapsed * self.rpm / 60.0)
+        s["tpm_tokens"] = min(self.tpm, s["tpm_tokens"] + elapsed * self.tpm / 60.0)
+        s["updated"] = now
+        if isinstance(self.state, FileState) and now - self._last_gc > 5.0:
+            self._last_gc = now
+            for table in (s["inflight"], *s["waiting"].values()):
+                for pid in [p for p in table if not _pid_alive(p)]:
+                    del table[pid]
+
+    @staticmethod
+    def _bump(table: dict, owner: str, delta: int) -> None:
+        value = table.get(owner, 0) + delta
+        if value > 0:
+            table[owner] = value
+        else:
+            table.pop(owner, None)
+
+    def _set_waiting(self, priority: str, delta: int) -> None:
+        owner = self.state.owner
+
+        def fn(s):
+            self._init(s, time.time())
+            self._bump(s["waiting"].setdefault(priority, {}), owner, delta)
+
+        self.state.transact(fn)
+
+    def _try_acquire(self, priority: str, estimate: int) -> float:
+        """Take the permit (returns 0) or return how long to sleep before retrying."""
+        owner = self.state.owner
+
+        def fn(s):
+            now = time.time()
+            self._init(s, now)
+            if now < s["cooldown_until"]:
+                return s["cooldown_until"] - now
+            if sum(s["inflight"].values()) >= max(1, int(s["limit"])):
+                return self.poll_interval
+            reserve = 0.0
+            if priority != "interactive":
+                if sum(s["waiting"].get("interactive", {}).values()) > 0:
+                    return self.poll_interval
+                reserve = self.batch_reserve
+            need_req = 1 + reserve * self.rpm
+            need_tok = min(estimate, self.tpm) + reserve * self.tpm
+            if s["rpm_tokens"] < need_req or s["tpm_tokens"] < need_tok:
+                deficit = max((need_req - s["rpm_tokens"]) / self.rpm,
+                              (need_tok - s["tpm_tokens"]) / self.tpm) * 60.0
+                return max(self.poll_interval, min(deficit, 1.0))
+            s["rpm_tokens"] -= 1
+            s["tpm_tokens"] -= min(estimate, self.tpm)
+            self._bump(s["inflight"], owner, 1)
+            return 0.0
+
+        return self.state.transact(fn)
+
+    def _release(self, permit: Permit) -> None:
+        owner = self.state.owner
+
+        def fn(s):
+            now = time.time()
+            self._init(s, now)
+            self._bump(s["inflight"], owner, -1)
+            if permit.used is not None:  # settle the TPM estimate
+                s["tpm_tokens"] = min(self.tpm, s["tpm_tokens"] + permit.estimate - permit.used)
+            if permit.limited:
+                s["consecutive_429"] += 1
+                s["limit"] = max(1.0, s["limit"] / 2)
+                backoff = min(30.0, 0.5 * (2 ** (s["consecutive_429"] - 1))) * random.uniform(0.5, 1.0)
+                pause = max(backoff, permit.retry_after or 0.0)
+                s["cooldown_until"] = max(s["cooldown_until"], now + pause)
+            elif permit.ok:
+                s["consecutive_429"] = 0
+                s["limit"] = min(float(self.max_concurrency), s["limit"] + 1.0 / max(1.0, s["limit"]))
+            # any other outcome (timeout, 5xx, dropped connection) says nothing about capacity
+
+        self.state.transact(fn)
+        if permit.limited:
+            with self._mlock:
+                self.rate_limited_calls += 1
+
+    # ---- public API ----
+    def _resolve(self, priority: Optional[str]) -> str:
+        priority = _PRIORITY.get() or priority or "interactive"
+        return priority if priority in PRIORITIES else "batch"
+
+    @contextmanager
+    def permit(self, priority: Optional[str] = None, estimate: int = DEFAULT_OUTPUT_TOKENS):
+        """Blocks until the call may go out; releases (and learns from it) on exit."""
+        priority = self._resolve(priority)
+        started = time.perf_counter()
+        wait = self._try_acquire(priority, estimate)
+        if wait:
+            self._set_waiting(priority, 1)
+            try:
+                while wait:
+                    time.sleep(wait)
+                    wait = self._try_acquire(priority, estimate)
+            finally:
+                self._set_waiting(priority, -1)
+        self._note_wait(priority, time.perf_counter() - started)
+        permit = Permit(priority, estimate)
+        try:
+            yield permit
+        finally:
+            self._release(permit)
+
+    async def _off_loop(self, fn: Callable, *args) -> Any:
+        """Run a state step; file state (flock + read/write) goes to a worker thread."""
+        import asyncio
+
+        if not isinstance(self.state, FileState):
+            return fn(*args)
+        return await asyncio.to_thread(fn, *args)
+
+    async def _atry_acquire(self, priority: str, estimate: int) -> float:
+        import asyncio
+
+        step = asyncio.ensure_future(self._off_loop(self._try_acquire, priority, estimate))
+        try:
+            return await asyncio.shield(step)
+        except asyncio.CancelledError:
+            # the thread may still take the permit after we stop waiting: hand it back
+            def undo(done):
+                if not done.cancelled() and done.exception() is None and done.result() == 0:
+                    asyncio.ensure_future(self.arelease(Permit(priority, estimate)))
+
+            step.add_done_callback(undo)
+            raise
+
+    async def apermit_acquire(self, priority: Optional[str] = None,
+                              estimate: int = DEFAULT_OUTPUT_TOKENS) -> Permit:
+        """Async acquire; pair with `await arelease(permit)` in a finally block."""
+        import asyncio
+
+        priority = self._resolve(priority)
+        started = time.perf_counter()
+        wait = await self._atry_acquire(priority, estimate)
+        if wait:
+            await self._off_loop(self._set_waiting, priority, 1)
+            try:
+                while wait:
+                    await asyncio.sleep(wait)
+                    wait = await self._atry_acquire(priority, estimate)
+            finally:
+                await self._off_loop(self._set_waiting, priority, -1)
+        self._note_wait(priority, time.perf_counter() - started)
+        return Permit(priority, estimate)
+
+    def release(self, permit: Permit) -> None:
+        self._release(permit)
+
+    async def arelease(self, permit: Permit) -> None:
+        await self._off_loop(self._release, permit)
+
+    def _note_wait(self, priority: str, seconds: float) -> None:
+        with self._mlock:
+            self.wait_times[priority].append(seconds)
+            self.issued[priority] += 1
+
+    def metrics(self) -> dict:
+        def fn(s):
+            self._init(s, time.time())
+            return {
+                "queue_depth": {p: sum(s["waiting"].get(p, {}).values()) for p in PRIORITIES},
+                "inflight": sum(s["inflight"].values()),
+                "concurrency_limit": round(s["limit"], 2),
+                "rpm_available": round(s["rpm_tokens"], 1),
+                "tpm_available": round(s["tpm_tokens"]),
+                "cooling_down_s": round(max(0.0, s["cooldown_until"] - time.time()), 2),
+            }
+
+        shared = self.state.transact(fn)
+        with self._mlock:
+            waits = {}
+            for p, values in self.wait_times.items():
+                ordered = sorted(values)
+                waits[p] = {
+                    "calls": self.issued[p],
+                    "avg_wait_s": round(sum(ordered) / len(ordered), 4) if ordered else 0.0,
+                    "p95_wait_s": round(ordered[int(0.95 * (len(ordered) - 1))], 4) if ordered else 0.0,
+                }
+            shared["waits"] = waits
+            shared["rate_limited"] = self.rate_limited_calls
+        return shared
+
+    def format_metrics(self) -> str:
+        m = self.metrics()
+        q = m["queue_depth"]
+        w = m["waits"]
+        return (f"queue {q['interactive']}i/{q['batch']}b · in flight {m['inflight']}/{m['concurrency_limit']:g} · "
+                f"wait p95 {w['interactive']['p95_wait_s']:.2f}s i, {w['batch']['p95_wait_s']:.2f}s b · "
+                f"429s {m['rate_limited']}")
+
+
+# ---------------------------
+# Shared instance
+# ---------------------------
+_scheduler: Optional[Scheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def scheduler_enabled() -> bool:
+    return os.getenv("POWERAI_SCHEDULER", "on").strip().lower() not in ("off", "0", "false")
+
+
+def scheduler_from_env(state_path: Optional[str] = None) -> Scheduler:
+    path = state_path or os.getenv("POWERAI_SCHEDULER_STATE")
+    return Scheduler(
+        rpm=float(os.getenv("POWERAI_RPM", 500)),
+        tpm=float(os.getenv("POWERAI_TPM", 200_000)),
+        max_concurrency=int(os.getenv("POWERAI_MAX_CONCURRENCY", 16)),
+        state=FileState(path) if path else MemoryState(),
+    )
+
+
+def get_scheduler() -> Scheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = scheduler_from_env()
+        return _scheduler
+
+
+# ---------------------------
+# Chat model integration
+# ---------------------------
+def _failure_kind(exc: BaseException) -> Optional[str]:
+    """"rate_limit" (429), "transient" (timeouts, 5xx, dropped connections) or None."""
+    status = getattr(exc, "status_code", None)
+    name = type(exc).__name__
+    if status == 429 or name == "RateLimitError":
+        return "rate_limit"
+    if (status is not None and (status >= 500 or status == 408)) or name in ("APIConnectionError", "APITimeoutError"):
+        return "transient"
+    return None
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _usage_tokens(result) -> Optional[int]:
+    usage = (getattr(result, "llm_output", None) or {}).get("token_usage") or {}
+    total = usage.get("total_tokens")
+    return int(total) if total else None
+
+
+def _chunk_usage_tokens(chunk) -> Optional[int]:
+    usage = getattr(getattr(chunk, "message", None), "usage_metadata", None) or {}
+    total = usage.get("total_tokens")
+    return int(total) if total else None
+
+
+def _stream_kwargs(kwargs: dict) -> dict:
+    """Ask for the usage chunk at the end of a stream (unless the caller set stream_options)."""
+    if "stream_options" in kwargs or os.getenv("POWERAI_STREAM_USAGE", "on").strip().lower() in ("off", "0", "false"):
+        return kwargs
+    return {**kwargs, "stream_options": {"include_usage": True}}
+
+
+def _transient_backoff(attempt: int) -> float:
+    return min(8.0, 0.5 * (2 ** attempt)) * random.uniform(0.5, 1.0)
+
+
+class ScheduledModelMixin:
+    """
+    Routes _generate/_stream (sync and async) of a chat model through the
+    shared scheduler. The scheduler owns retries (get_llm turns the OpenAI
+    client's own retries off): a 429 is reported to it and its cooldown is the
+    backoff; timeouts/5xx back off locally. At most `schedule_retries` retries.
+    Streams are only retried if no chunk reached the caller yet.
+    """
+
+    schedule_retries = 4
+
+    def _schedule_estimate(self, messages, kwargs) -> int:
+        return estimate_tokens(messages, kwargs.get("max_tokens") or getattr(self, "max_tokens", None))
+
+    def _schedule_priority(self) -> str:
+        return getattr(self, "priority", None) or "interactive"
+
+    def _should_retry(self, exc, permit, attempt) -> bool:
+        kind = _failure_kind(exc)
+        if kind == "rate_limit":
+            permit.rate_limited(_retry_after(exc))
+        return kind is not None and attempt < self.schedule_retries
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if not scheduler_enabled():
+            return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        sched = get_scheduler()
+        estimate = self._schedule_estimate(messages, kwargs)
+        attempt = 0
+        while True:
+            with sched.permit(self._schedule_priority(), estimate) as permit:
+                try:
+                    result = super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+                    permit.record(_usage_tokens(result))
+                    permit.succeeded()
+                    return result
+                except Exception as e:
+                    if not self._should_retry(e, permit, attempt):
+                        raise
+            if not permit.limited:
+                time.sleep(_transient_backoff(attempt))
+            attempt += 1
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if not scheduler_enabled():
+            return await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        import asyncio
+
+        sched = get_scheduler()
+        estimate = self._schedule_estimate(messages, kwargs)
+        attempt = 0
+        while True:
+            permit = await sched.apermit_acquire(self._schedule_priority(), estimate)
+            try:
+                result = await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+                permit.record(_usage_tokens(result))
+                permit.succeeded()
+                return result
+            except Exception as e:
+                if not self._should_retry(e, permit, attempt):
+                    raise
+            finally:
+                await sched.arelease(permit)
+            if not permit.limited:
+                await asyncio.sleep(_transient_backoff(attempt))
+            attempt += 1
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        if not scheduler_enabled():
+            yield from super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+            return
+        sched = get_scheduler()
+        estimate = self._schedule_estimate(messages, kwargs)
+        kwargs = _stream_kwargs(kwargs)
+        attempt = 0
+        while True:
+            started = False
+            with sched.permit(self._schedule_priority(), estimate) as permit:
+                try:
+                    for chunk in super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                        started = True
+                        used = _chunk_usage_tokens(chunk)
+                        if used:
+                            permit.record(used)
+                        yield chunk
+                    permit.succeeded()
+                    return
+                except Exception as e:
+                    if started or not self._should_retry(e, permit, attempt):
+                        raise
+            if not permit.limited:
+                time.sleep(_transient_backoff(attempt))
+            attempt += 1
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        if not scheduler_enabled():
+            async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                yield chunk
+            return
+        import asyncio
+
+        sched = get_scheduler()
+        estimate = self._schedule_estimate(messages, kwargs)
+        kwargs = _stream_kwargs(kwargs)
+        attempt = 0
+        while True:
+            started = False
+            permit = await sched.apermit_acquire(self._schedule_priority(), estimate)
+            try:
+                async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                    started = True
+                    used = _chunk_usage_tokens(chunk)
+                    if used:
+                        permit.record(used)
+                    yield chunk
+                permit.succeeded()
+                return
+            except Exception as e:
+                if started or not self._should_retry(e, permit, attempt):
+                    raise
+            finally:
+                await sched.arelease(permit)
+            if not permit.limited:
+                await asyncio.sleep(_transient_backoff(attempt))
+            attempt += 1
+
+
+def scheduled_chat_openai_class():
+    """ChatOpenAI subclass whose calls go through the scheduler (built on first use)."""
+    global _ScheduledChatOpenAI
+    if _ScheduledChatOpenAI is None:
+        from langchain_openai import ChatOpenAI
+
+        class ScheduledChatOpenAI(ScheduledModelMixin, ChatOpenAI):
+            priority: str = "interactive"
+
+        _ScheduledChatOpenAI = ScheduledChatOpenAI
+    return _ScheduledChatOpenAI
+
+
+_ScheduledChatOpenAI = None
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Show the shared scheduler state")
+    parser.add_argument("--state", default=os.getenv("POWERAI_SCHEDULER_STATE"), help="state file")
+    args = parser.parse_args()
+    if not args.state:
+        parser.error("in-process state is only visible inside its process; pass --state FILE")
+    print(json.dumps(scheduler_from_env(args.state).metrics(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
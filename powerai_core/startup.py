@@ -0,0 +1,97 @@
+# startup.py
+# Cold-start helpers for the CLI bots and Streamlit apps.
+#
+# Importing langchain / langchain_openai / SQLAlchemy and building ChatOpenAI
+# takes seconds. Entry points keep those imports inside the functions that need
+# them and start the work in a background thread right away, so it overlaps
+# with the user reading the banner and typing the first message:
+#
+#   bot = background(build_conversation)       # returns at once
+#   text = input("You: ")
+#   bot.get().invoke({"input": text})           # waits only if the build is still running
+#
+#   warm_up("langchain_openai", "langchain.chains.conversation.base")
+#                                               # import in the background, once per process
+#
+# Both are timed as "startup.<name>" spans. POWERAI_WARMUP=off runs everything
+# on the caller's thread at first use (plain tracebacks, sequential timings).
+#
+#   python benchmarks/run_benchmarks.py --only startup   # time-to-prompt per entry point
+
+import importlib
+import os
+import threading
+from typing import Callable, Dict, Generic, Optional, Tuple, TypeVar
+
+from powerai_core.telemetry import span
+
+T = TypeVar("T")
+
+
+def warmup_enabled() -> bool:
+    return os.getenv("POWERAI_WARMUP", "on").strip().lower() not in ("0", "off", "false", "no")
+
+
+class Background(Generic[T]):
+    """A value built once by `factory`, on a daemon thread (or lazily at get() when warm-up is off)."""
+
+    def __init__(self, factory: Callable[[], T], name: str = "background"):
+        self.name = name
+        self._factory = factory
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._started = False
+        self._value: Optional[T] = None
+        self._error: Optional[BaseException] = None
+        if warmup_enabled():
+            self._start()
+            threading.Thread(target=self._run, name=f"powerai-{name}", daemon=True).start()
+
+    def _start(self) -> bool:
+        with self._lock:
+            if self._started:
+                return False
+            self._started = True
+            return True
+
+    def _run(self) -> None:
+        try:
+            with span(f"startup.{self.name}"):
+                self._value = self._factory()
+        except Exception as e:  # re-raised by get(), on the caller's thread
+            self._error = e
+        finally:
+            self._done.set()
+
+    def ready(self) -> bool:
+        return self._done.is_set()
+
+    def get(self, timeout: Optional[float] = None) -> T:
+        if self._start():  # warm-up off: build now
+            self._run()
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"{self.name} still starting after {timeout}s")
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+def background(factory: Callable[[], T], name: str = "background") -> Background[T]:
+    return Background(factory, name)
+
+
+_WARMUPS: Dict[Tuple[str, ...], Background] = {}
+_WARMUPS_LOCK = threading.Lock()
+
+
+def _import_all(modules: Tuple[str, ...]) -> list:
+    return [importlib.import_module(m) for m in modules]
+
+
+def warm_up(*modules: str) -> Background:
+    """Import `modules` in the background, once per process (Streamlit reruns reuse it)."""
+    with _WARMUPS_LOCK:
+        warm = _WARMUPS.get(modules)
+        if warm is None:
+            warm = _WARMUPS[modules] = Background(lambda: _import_all(modules), "warmup")
+        return warm
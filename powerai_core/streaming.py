@@ -0,0 +1,141 @@
+# streaming.py
+# Token streaming for ConversationChain-style turns.
+#
+# chain.invoke / conversation.run block until the whole completion is back.
+# stream_turn() builds exactly the prompt the chain would (same prompt template,
+# same memory variables), streams the model's tokens as they arrive, and saves
+# the finished exchange to the chain's memory ONCE at the end. It also records
+# time-to-first-token and total latency for the turn.
+#
+#     timings = TurnTimings()
+#     reply = st.write_stream(stream_turn(chain, user_input, timings))
+#     st.caption(timings.caption())
+#
+# astream_turn() is the asyncio twin (used by chat_service.py): the model streams
+# on the event loop, memory reads/writes (SQLite) run in worker threads.
+
+import asyncio
+import time
+from typing import AsyncIterator, Iterator, Optional
+
+from powerai_core.telemetry import span
+
+
+class TurnTimings:
+    """Latency of one streamed turn, in seconds (None until known)."""
+
+    __slots__ = ("started", "ttft", "total", "chunks", "chars")
+
+    def __init__(self):
+        self.started = None
+        self.ttft = None
+        self.total = None
+        self.chunks = 0
+        self.chars = 0
+
+    def as_dict(self):
+        return {"ttft": self.ttft, "total": self.total, "chunks": self.chunks, "chars": self.chars}
+
+    def caption(self) -> str:
+        if self.total is None:
+            return ""
+        ttft = f"{self.ttft:.2f}s" if self.ttft is not None else "—"
+        return f"⏱️ first token {ttft} · total {self.total:.2f}s"
+
+
+def _chunk_text(chunk) -> str:
+    content = getattr(chunk, "content", chunk)
+    return content if isinstance(content, str) else str(content or "")
+
+
+def stream_turn(chain, user_input: str, timings: Optional[TurnTimings] = None) -> Iterator[str]:
+    """
+    Stream one ConversationChain turn.
+
+    Yields text chunks; when the generator is exhausted the (input, reply) pair
+    is written to chain.memory. If the stream fails midway nothing is saved, so
+    memory never holds half an answer.
+    """
+    timings = timings if timings is not None else TurnTimings()
+    memory = chain.memory
+    inputs = {chain.input_key: user_input}
+    variables = dict(inputs)
+    with span("prompt.build"):
+        if memory is not None:
+            variables.update(memory.load_memory_variables(inputs))
+        prompt_value = chain.prompt.format_prompt(**variables)
+
+    timings.started = time.perf_counter()
+    parts = []
+    for chunk in chain.llm.stream(prompt_value):
+        text = _chunk_text(chunk)
+        if not text:
+            continue
+        if timings.ttft is None:
+            timings.ttft = time.perf_counter() - timings.started
+        timings.chunks += 1
+        timings.chars += len(text)
+        parts.append(text)
+        yield text
+    timings.total = time.perf_counter() - timings.started
+
+    reply = "".join(parts)
+    if memory is not None:
+        with span("memory.save"):
+            memory.save_context(inputs, {chain.output_key: reply})
+
+
+async def astream_turn(chain, user_input: str, timings: Optional[TurnTimings] = None) -> AsyncIterator[str]:
+    """stream_turn() for asyncio callers; same prompt, same save-once-at-the-end rule."""
+    timings = timings if timings is not None else TurnTimings()
+    memory = chain.memory
+    inputs = {chain.input_key: user_input}
+    variables = dict(inputs)
+    with span("prompt.build"):
+        if memory is not None:
+            variables.update(await asyncio.to_thread(memory.load_memory_variables, inputs))
+        prompt_value = chain.prompt.format_prompt(**variables)
+
+    timings.started = time.perf_counter()
+    parts = []
+    async for chunk in chain.llm.astream(prompt_value):
+        text = _chunk_text(chunk)
+        if not text:
+            continue
+        if timings.ttft is None:
+            timings.ttft = time.perf_counter() - timings.started
+        timings.chunks += 1
+        timings.chars += len(text)
+        parts.append(text)
+        yield text
+    timings.total = time.perf_counter() - timings.started
+
+    reply = "".join(parts)
+    if memory is not None:
+        with span("memory.save"):
+            await asyncio.to_thread(memory.save_context, inputs, {chain.output_key: reply})
+
+
+def run_streamed(chain, user_input: str, timings: Optional[TurnTimings] = None, on_token=None) -> str:
+    """Consume stream_turn() outside Streamlit (CLI bots, tests). Returns the reply."""
+    parts = []
+    for text in stream_turn(chain, user_input, timings):
+        if on_token:
+            on_token(text)
+        parts.append(text)
+    return "".join(parts)
+
+
+if __name__ == "__main__":
+    # Offline smoke run: python -m powerai_core.streaming
+    from langchain.chains import ConversationChain
+    from langchain.memory import ConversationBufferMemory
+    from powerai_core.fake_llm import FakeStreamingChatModel
+
+    llm = FakeStreamingChatModel(first_token_latency=0.2, token_latency=0.03)
+    chain = ConversationChain(llm=llm, memory=ConversationBufferMemory())
+    t = TurnTimings()
+    run_streamed(chain, "Hello there, stream me something", t,
+                 on_token=lambda s: print(s, end="", flush=True))
+    print("\n" + t.caption())
+    print("memory messages:", len(chain.memory.chat_memory.messages))
@@ -0,0 +1,217 @@
+# stub_openai_server.py
+# Local stand-in for POST /v1/chat/completions, for offline tests and
+# throughput measurements of the REST clients (no API key, no network).
+#
+#   python -m powerai_core.stub_openai_server --port 8089 --latency 0.05 --fail-rate 0.1
+#   OPENAI_BASE_URL=http://127.0.0.1:8089/v1 python Day1_Setup/test_openai_rest.py
+#
+# Or in-process:
+#
+#     server, base_url = start_stub_server(latency=0.02)
+#     ...
+#     server.shutdown()
+#
+# Replies echo the last user message in the OpenAI response shape (with usage).
+# "stream": true returns server-sent events like the real endpoint. HTTP/1.1
+# keep-alive is on, so pooled clients reuse connections. --fail-rate makes a
+# share of requests answer 429 (with Retry-After) or 503 to exercise retries.
+
+import argparse
+import json
+import random
+import socket
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+
+
+def _words(text: str):
+    return text.split()
+
+
+class StubState:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, fail_rate: float = 0.0,
+                 token_latency: float = 0.0, retry_after: float = 0.05, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.token_latency = token_latency
+        self.retry_after = retry_after
+        self.rnd = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+        self.connections = 0
+
+    def roll_failure(self) -> Optional[int]:
+        with self.lock:
+            self.requests += 1
+            if self.fail_rate and self.rnd.random() < self.fail_rate:
+                self.failures += 1
+                return self.rnd.choice((429, 503))
+        return None
+
+    def delay(self) -> float:
+        with self.lock:
+            extra = self.rnd.uniform(0, self.jitter) if self.jitter else 0.0
+        return self.latency + extra
+
+
+def build_reply(payload: dict) -> Tuple[str, dict]:
+    messages = payload.get("messages") or []
+    last = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+    text = f"(stub) You said: {str(last)[-140:]}"
+    prompt_tokens = sum(len(_words(str(m.get("content", "")))) for m in messages)
+    usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(_words(text)),
+             "total_tokens": prompt_tokens + len(_words(text))}
+    return text, usage
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive
+    server_version = "PowerAIStub/1.0"
+
+    def setup(self):
+        super().setup()
+        # headers and body go out in separate writes; without this, keep-alive
+        # connections stall ~40ms per request on delayed ACKs
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.server.state.lock:
+            self.server.state.connections += 1
+
+    def log_message(self, fmt, *args):  # keep test output quiet
+        pass
+
+    def _json(self, status: int, body: dict, headers: Optional[dict] = None):
+        raw = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def do_GET(self):
+        if self.path.rstrip("/") in ("/health", "/v1/models"):
+            state = self.server.state
+            self._json(200, {"ok": True, "requests": state.requests, "failures": state.failures,
+                             "connections": state.connections})
+        else:
+            self._json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self._json(404, {"error": {"message": "not found"}})
+            return
+        try:
+            payload = json.loads(raw or b"{}")
+        except ValueError:
+            self._json(400, {"error": {"message": "invalid JSON"}})
+            return
+
+        state = self.server.state
+        status = state.roll_failure()
+        if status is not None:
+            headers = {"Retry-After": str(state.retry_after)} if status == 429 else None
+            self._json(status, {"error": {"message": "stub failure", "code": status}}, headers)
+            return
+
+        time.sleep(state.delay())
+        text, usage = build_reply(payload)
+        model = payload.get("model", "stub-model")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        if payload.get("stream"):
+            include_usage = bool((payload.get("stream_options") or {}).get("include_usage"))
+            self._stream(completion_id, model, text, usage if include_usage else None, state.token_latency)
+            return
+        self._json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                         "finish_reason": "stop"}],
+            "usage": usage,
+        })
+
+    def _stream(self, completion_id, model, text, usage, token_latency):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send(obj):
+            data = ("data: " + (obj if isinstance(obj, str) else json.dumps(obj)) + "\n\n").encode("utf-8")
+            self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        base = {"id": completion_id, "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": model}
+        pieces = text.split(" ")
+        for i, piece in enumerate(pieces):
+            if i and token_latency:
+                time.sleep(token_latency)
+            delta = {"content": piece + (" " if i < len(pieces) - 1 else "")}
+            if i == 0:
+                delta["role"] = "assistant"
+            send({**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+        send({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if usage:  # stream_options.include_usage: one last chunk with no choices, like OpenAI
+            send({**base, "choices": [], "usage": usage})
+        send("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, address, state: StubState):
+        super().__init__(address, StubHandler)
+        self.state = state
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+def start_stub_server(host: str = "127.0.0.1", port: int = 0, **state_kwargs) -> Tuple[StubServer, str]:
+    """Serve in a daemon thread; port 0 picks a free port. Returns (server, base_url)."""
+    server = StubServer((host, port), StubState(**state_kwargs))
+    threading.Thread(target=server.serve_forever, name="stub-openai", daemon=True).start()
+    return server, server.base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stub of the OpenAI chat completions endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before each reply")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random latency, seconds")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="seconds between streamed chunks")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of requests answered 429/503")
+    parser.add_argument("--retry-after", type=float, default=0.05, help="Retry-After seconds sent with 429")
+    args = parser.parse_args()
+
+    server = StubServer((args.host, args.port), StubState(
+        latency=args.latency, jitter=args.jitter, fail_rate=args.fail_rate,
+        token_latency=args.token_latency, retry_after=args.retry_after,
+    ))
+    print(f"Stub OpenAI server on {server.base_url} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
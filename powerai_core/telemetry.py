@@ -0,0 +1,460 @@
+# telemetry.py
+# Lightweight per-turn latency instrumentation.
+#
+#   turn = telemetry.begin_turn("memorychat", session=session_id)   # one app rerun / turn
+#   with telemetry.span("history.messages"):                          # any stage, any depth
+#       ...
+#   turn.end()
+#
+# Every span feeds a rolling histogram per stage name (last HISTORY_SAMPLES
+# samples -> p50/p95/p99) and, inside a turn, that turn's trace. On top of that:
+#
+#   POWERAI_TRACE_FILE=traces.jsonl  -> one JSON line per finished turn
+#   POWERAI_METRICS_PORT=9464        -> GET http://127.0.0.1:9464/metrics (Prometheus text)
+#   POWERAI_TELEMETRY=off            -> span() returns a shared no-op; nothing is recorded
+#
+# LLM calls are timed by a callback handler (llm_callbacks(), wired in get_llm):
+# "llm.call" for the whole call and "llm.ttft" for time to first token.
+#
+#   python -m powerai_core.telemetry --trace traces.jsonl   # per-stage percentiles from a trace file
+#   python -m powerai_core.telemetry --overhead             # cost of a span, enabled vs disabled
+
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+HISTORY_SAMPLES = 2048
+QUANTILES = (0.5, 0.95, 0.99)
+
+_enabled = os.getenv("POWERAI_TELEMETRY", "on").strip().lower() not in ("off", "0", "false", "no")
+
+
+def telemetry_enabled() -> bool:
+    return _enabled
+
+
+def set_enabled(on: bool) -> None:
+    global _enabled
+    _enabled = bool(on)
+
+
+# ---------------------------
+# Rolling histograms
+# ---------------------------
+def quantile(sorted_samples: List[float], q: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    return sorted_samples[min(len(sorted_samples) - 1, int(q * len(sorted_samples)))]
+
+
+class RollingHistogram:
+    """Last `size` samples (seconds) for percentiles, plus all-time count and sum."""
+
+    __slots__ = ("samples", "count", "total", "last")
+
+    def __init__(self, size: int = HISTORY_SAMPLES):
+        self.samples: deque = deque(maxlen=size)
+        self.count = 0
+        self.total = 0.0
+        self.last = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+
+    def summary(self) -> dict:
+        ordered = sorted(self.samples)
+        out = {"count": self.count, "sum": self.total, "last": self.last}
+        for q in QUANTILES:
+            out[f"p{int(q * 100)}"] = quantile(ordered, q)
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._hists: Dict[str, RollingHistogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            hist = self._hists.get(name)
+            if hist is None:
+                hist = self._hists[name] = RollingHistogram()
+            hist.observe(seconds)
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            hists = list(self._hists.items())
+        return {name: hist.summary() for name, hist in sorted(hists)}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._hists.clear()
+
+
+REGISTRY = Registry()
+
+
+# ---------------------------
+# Turns and spans
+# ---------------------------
+_current_turn: contextvars.ContextVar = contextvars.ContextVar("powerai_turn", default=None)
+_trace_lock = threading.Lock()
+
+
+class Turn:
+    """One app turn (a Streamlit rerun, a CLI exchange); collects its spans."""
+
+    def __init__(self, name: str, **attrs: Any):
+        self.name = name
+        self.attrs = attrs
+        self.spans: List[dict] = []
+        self.started = time.perf_counter()
+        self.wall = time.time()
+        self.total: Optional[float] = None
+        self._token = _current_turn.set(self)
+
+    def tag(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def add(self, name: str, start: float, seconds: float, attrs: Optional[dict] = None) -> None:
+        entry = {"name": name, "offset_ms": round((start - self.started) * 1000, 3),
+                 "ms": round(seconds * 1000, 3)}
+        if attrs:
+            entry.update(attrs)
+        self.spans.append(entry)
+
+    def breakdown(self) -> Dict[str, float]:
+        """Milliseconds per stage name in this turn (repeated stages summed)."""
+        out: Dict[str, float] = {}
+        for s in self.spans:
+            out[s["name"]] = out.get(s["name"], 0.0) + s["ms"]
+        return out
+
+    def end(self) -> None:
+        if self.total is not None:
+            return
+        self.total = time.perf_counter() - self.started
+        try:
+            _current_turn.reset(self._token)
+        except ValueError:
+            _current_turn.set(None)  # ended from another context
+        REGISTRY.observe(f"{self.name}.turn", self.total)
+        path = os.getenv("POWERAI_TRACE_FILE")
+        if path:
+            write_trace(path, self)
+
+    def as_dict(self) -> dict:
+        return {"ts": round(self.wall, 3), "turn": self.name, **self.attrs,
+                "total_ms": round((self.total or 0.0) * 1000, 3), "spans": self.spans}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.end()
+        return False
+
+
+class _NoopTurn:
+    spans: List[dict] = []
+    total = None
+
+    def tag(self, **attrs):
+        pass
+
+    def add(self, *args, **kwargs):
+        pass
+
+    def breakdown(self):
+        return {}
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_TURN = _NoopTurn()
+
+
+def begin_turn(name: str, **attrs: Any):
+    """Start a turn in this context (a previous unfinished one, e.g. cut short by st.stop(), is dropped)."""
+    if not _enabled:
+        return _NOOP_TURN
+    return Turn(name, **attrs)
+
+
+def current_turn() -> Optional[Turn]:
+    return _current_turn.get() if _enabled else None
+
+
+class Span:
+    __slots__ = ("name", "attrs", "start")
+
+    def __init__(self, name: str, attrs: Optional[dict]):
+        self.name = name
+        self.attrs = attrs
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        record(self.name, time.perf_counter() - self.start, self.start,
+               dict(self.attrs or {}, error=exc_type.__name__) if exc_type else self.attrs)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(name: str, **attrs: Any):
+    """Time a block: `with span("history.write"): ...`"""
+    if not _enabled:
+        return _NOOP_SPAN
+    return Span(name, attrs or None)
+
+
+def record(name: str, seconds: float, start: Optional[float] = None, attrs: Optional[dict] = None) -> None:
+    """Record a measured duration (for stages timed by other means, e.g. ttft)."""
+    if not _enabled:
+        return
+    REGISTRY.observe(name, seconds)
+    turn = _current_turn.get()
+    if turn is not None and turn.total is None:
+        turn.add(name, start if start is not None else time.perf_counter() - seconds, seconds, attrs)
+
+
+def timed(name: str):
+    """Decorator form of span()."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with Span(name, None):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+
+# ---------------------------
+# LLM calls (callback handler)
+# ---------------------------
+_llm_handler = None
+
+
+def llm_callbacks() -> list:
+    """[handler] timing every call of the model it is attached to; [] when disabled."""
+    global _llm_handler
+    if not _enabled:
+        return []
+    if _llm_handler is None:
+        from langchain_core.callbacks import BaseCallbackHandler
+
+        class LatencyCallback(BaseCallbackHandler):
+            run_inline = True  # async runs too: no executor hop per token
+
+            def __init__(self):
+                self._runs: Dict[Any, list] = {}   # run_id -> [start, turn, first_token_seen]
+
+            def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+                self._runs[run_id] = [time.perf_counter(), _current_turn.get(), False]
+
+            def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+                self._runs[run_id] = [time.perf_counter(), _current_turn.get(), False]
+
+            def on_llm_new_token(self, token, *, run_id, **kwargs):
+                run = self._runs.get(run_id)
+                if run is not None and not run[2] and token:
+                    run[2] = True
+                    self._observe("llm.ttft", run, time.perf_counter() - run[0])
+
+            def on_llm_end(self, response, *, run_id, **kwargs):
+                run = self._runs.pop(run_id, None)
+                if run is not None:
+                    self._observe("llm.call", run, time.perf_counter() - run[0])
+
+            def on_llm_error(self, error, *, run_id, **kwargs):
+                run = self._runs.pop(run_id, None)
+                if run is not None:
+                    self._observe("llm.call", run, time.perf_counter() - run[0],
+                                  {"error": type(error).__name__})
+
+            @staticmethod
+            def _observe(name, run, seconds, attrs=None):
+                REGISTRY.observe(name, seconds)
+                turn = run[1]
+                if turn is not None and turn.total is None:
+                    turn.add(name, run[0], seconds, attrs)
+
+        _llm_handler = LatencyCallback()
+    return [_llm_handler]
+
+
+# ---------------------------
+# Export
+# ---------------------------
+def write_trace(path: str, turn: Turn) -> None:
+    line = json.dumps(turn.as_dict(), ensure_ascii=False)
+    with _trace_lock:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def panel_rows(snapshot: Optional[Dict[str, dict]] = None) -> List[dict]:
+    """Rows for a UI table: stage, count, p50/p95/p99/last in ms."""
+    rows = []
+    for name, s in (snapshot if snapshot is not None else REGISTRY.snapshot()).items():
+        rows.append({"stage": name, "count": s["count"],
+                     **{k: round(s[k] * 1000, 1) for k in ("p50", "p95", "p99", "last")}})
+    return rows
+
+
+def render_panel(container, turn=None) -> None:
+    """Draw the performance panel into a Streamlit container (e.g. an st.sidebar.expander)."""
+    if not _enabled:
+        container.caption("Telemetry is off (POWERAI_TELEMETRY=off).")
+        return
+    if turn is not None and turn.total is not None:
+        parts = " · ".join(f"{name} {ms:.0f}ms" for name, ms in turn.breakdown().items())
+        container.caption(f"Last run {turn.total * 1000:.0f}ms: {parts}")
+    rows = panel_rows()
+    if rows:
+        container.dataframe(rows, hide_index=True, use_container_width=True)
+    else:
+        container.caption("No samples yet.")
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def prometheus_text(snapshot: Optional[Dict[str, dict]] = None) -> str:
+    snap = snapshot if snapshot is not None else REGISTRY.snapshot()
+    lines = ["# HELP powerai_stage_seconds Latency of PowerAI stages (rolling window quantiles).",
+             "# TYPE powerai_stage_seconds summary"]
+    for name, s in snap.items():
+        label = f'stage="{_label(name)}"'
+        for q in QUANTILES:
+            lines.append(f'powerai_stage_seconds{{{label},quantile="{q}"}} {s[f"p{int(q * 100)}"]:.6f}')
+        lines.append(f"powerai_stage_seconds_sum{{{label}}} {s['sum']:.6f}")
+        lines.append(f"powerai_stage_seconds_count{{{label}}} {s['count']}")
+    return "\n".join(lines) + "\n"
+
+
+_metrics_server = None
+_metrics_lock = threading.Lock()
+
+
+def start_metrics_server(port: Optional[int] = None, host: Optional[str] = None):
+    """Serve GET /metrics on a daemon thread (once per process). No-op without a port."""
+    global _metrics_server
+    port = port if port is not None else int(os.getenv("POWERAI_METRICS_PORT", "0") or 0)
+    if not port or not _enabled:
+        return None
+    with _metrics_lock:
+        if _metrics_server is not None:
+            return _metrics_server
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt, *args):
+                pass
+
+        server = ThreadingHTTPServer((host or os.getenv("POWERAI_METRICS_HOST", "127.0.0.1"), port),
+                                     MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="powerai-metrics", daemon=True).start()
+        _metrics_server = server
+        return server
+
+
+# ---------------------------
+# CLI
+# ---------------------------
+def summarize_trace_file(path: str) -> Dict[str, dict]:
+    hists: Dict[str, RollingHistogram] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            t = json.loads(line)
+            stages = [(f"{t['turn']}.turn", t["total_ms"])] + [(s["name"], s["ms"]) for s in t["spans"]]
+            for name, ms in stages:
+                hists.setdefault(name, RollingHistogram(size=1_000_000)).observe(ms / 1000)
+    return {name: h.summary() for name, h in sorted(hists.items())}
+
+
+def format_table(snapshot: Dict[str, dict]) -> str:
+    out = [f"{'stage':<24}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"]
+    for row in panel_rows(snapshot):
+        out.append(f"{row['stage']:<24}{row['count']:>8}{row['p50']:>10.1f}{row['p95']:>10.1f}{row['p99']:>10.1f}")
+    return "\n".join(out)
+
+
+def _overhead(n: int = 200_000) -> None:
+    def loop():
+        t0 = time.perf_counter()
+        for _ in range(n):
+            with span("bench"):
+                pass
+        return (time.perf_counter() - t0) / n * 1e9
+
+    for on in (False, True):
+        set_enabled(on)
+        print(f"span() {'enabled ' if on else 'disabled'}: {loop():7.0f} ns per span")
+    REGISTRY.reset()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="PowerAI latency telemetry tools")
+    parser.add_argument("--trace", help="summarize a JSONL trace file written via POWERAI_TRACE_FILE")
+    parser.add_argument("--overhead", action="store_true", help="measure the cost of a span")
+    args = parser.parse_args()
+    if args.trace:
+        print(format_table(summarize_trace_file(args.trace)))
+    elif args.overhead:
+        _overhead()
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# transcript.py
+# Paged, cached chat transcript for the Streamlit apps.
+#
+# Re-rendering a whole session on every rerun costs a query, a JSON decode and
+# a chat bubble per stored message. The transcript view shows only the newest
+# page and walks back one page per "load older" click:
+#
+#     blocks, has_older = load_transcript(history_pages(history), pages=2, page_size=30)
+#
+# Decoded blocks are cached by message id. A page first reads only the ids
+# (history.last_ids: the session index plus the tokens column) and fetches and
+# decodes just the rows not cached yet. The maintenance compaction rewrites an
+# old id into a summary: it drops the folded id range from the cache, and the
+# stored token count is compared as well, so a compaction run by another process
+# is picked up too. "[SYSTEM NOTE]" rows are dropped by the query
+# (skip_notes=True), not by a Python filter.
+
+import json
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+from powerai_core.resources import ResourceCache
+from powerai_core.telemetry import span
+
+
+class TranscriptBlock(NamedTuple):
+    """One chat bubble, ready to render."""
+
+    id: int
+    role: str  # "user" | "assistant"
+    content: str
+
+
+# (engine url, table, session_id, message id) -> (stored tokens, TranscriptBlock)
+BLOCKS = ResourceCache("transcript_blocks", max_items=20_000, idle_ttl=3600)
+
+PageFetcher = Callable[[int, Optional[int]], List[TranscriptBlock]]
+
+
+def ui_role(message_type: str) -> str:
+    return "user" if message_type in ("human", "user") else "assistant"
+
+
+def decode_block(msg_id: int, raw: str) -> TranscriptBlock:
+    # plain json.loads: the UI needs role + text, not a pydantic message
+    data = json.loads(raw)
+    return TranscriptBlock(msg_id, ui_role(data.get("type", "ai")), data.get("data", {}).get("content", ""))
+
+
+def _scope(history) -> tuple:
+    return (str(history.engine.url), history.table_name, history.session_id)
+
+
+def history_pages(history, skip_notes: bool = True) -> PageFetcher:
+    """Page fetcher over a WindowedSQLHistory, decoding through the block cache."""
+    scope = _scope(history)
+
+    def fetch(limit: int, before_id: Optional[int]) -> List[TranscriptBlock]:
+        ids = history.last_ids(limit, before_id, skip_notes=skip_notes)
+        blocks = {}
+        for msg_id, tokens in ids:
+            hit = BLOCKS.get(scope + (msg_id,))
+            if hit is not None and hit[0] == tokens:
+                blocks[msg_id] = hit[1]
+        missing = [msg_id for msg_id, _ in ids if msg_id not in blocks]
+        if missing:
+            stored = dict(ids)
+            for msg_id, raw in history.records_by_ids(missing):
+                block = decode_block(msg_id, raw)
+                BLOCKS.put(scope + (msg_id,), (stored[msg_id], block))
+                blocks[msg_id] = block
+        return [blocks[msg_id] for msg_id, _ in ids if msg_id in blocks]
+
+    return fetch
+
+
+def load_transcript(fetch: PageFetcher, pages: Optional[int] = 1,
+                    page_size: int = 30) -> Tuple[List[TranscriptBlock], bool]:
+    """
+    The newest `pages` pages (None = everything), oldest first, and whether
+    older messages remain. Each page is one keyset query of page_size + 1 rows.
+    """
+    blocks: List[TranscriptBlock] = []
+    before_id = None
+    has_older = False
+    loaded = 0
+    with span("ui.transcript", pages=pages):
+        while pages is None or loaded < pages:
+            page = fetch(page_size + 1, before_id)
+            has_older = len(page) > page_size
+            page = page[-page_size:]
+            blocks[:0] = page
+            loaded += 1
+            if not has_older:
+                break
+            before_id = page[0].id
+    return blocks, has_older
+
+
+def forget_blocks(engine, table_name: str, session_id: str,
+                  lo: Optional[int] = None, hi: Optional[int] = None) -> None:
+    """Drop a session's cached blocks with lo <= id <= hi (None = open end)."""
+    scope = (str(engine.url), table_name, session_id)
+    with BLOCKS._lock:
+        for key in [k for k in BLOCKS._items if k[:3] == scope
+                    and (lo is None or k[3] >= lo) and (hi is None or k[3] <= hi)]:
+            BLOCKS.pop(key)
+
+
+def forget_transcript(history) -> None:
+    """Drop a session's cached blocks (e.g. after a hard reset)."""
+    forget_blocks(history.engine, history.table_name, history.session_id)